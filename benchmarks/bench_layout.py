@@ -0,0 +1,129 @@
+"""
+Counts the cell moves and time taken by the legacy column handling against the layout planner.
+
+The legacy flow inserts each PDF with insert_cols when the sample area is full and lets every
+per-row statistic function insert its own missing header. The planner flow batches each PDF
+through insert_columns_into_excel and runs update_statistics once, as process_batch does.
+
+Usage:
+    python benchmarks/bench_layout.py [--reports 50] [--rows 40] [--workbook sample/Example.xlsx]
+"""
+import argparse
+import os
+import sys
+import time
+from openpyxl import Workbook, load_workbook
+from openpyxl.worksheet.worksheet import Worksheet
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import mold_processing  # noqa: E402
+
+#CONSTANTS
+LEGACY_STAT_FUNCTIONS = [
+    mold_processing.clear_old_stats,
+    mold_processing.total_count,
+    mold_processing.mean_count,
+    mold_processing.stdv_count,
+    mold_processing.display_mold_type_frequency,
+    mold_processing.find_min,
+    mold_processing.fifth_percentile,
+    mold_processing.find_median,
+    mold_processing.find_ninety_fifth_percentile,
+    mold_processing.find_max,
+    mold_processing.find_count,
+]
+
+class MoveCounter:
+    """Counts calls to Worksheet._move_cell, which every column shift goes through."""
+
+    def __init__(self):
+        self.moves = 0
+        self.original = Worksheet._move_cell
+
+    def __enter__(self):
+        counter = self
+
+        def counting_move_cell(sheet, row, column, row_offset, col_offset, translate=False):
+            counter.moves += 1
+            return counter.original(sheet, row, column, row_offset, col_offset, translate)
+
+        Worksheet._move_cell = counting_move_cell
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Worksheet._move_cell = self.original
+        return False
+
+def legacy_insert(mold_dict, sheet, lab_reference_number):
+    """insert_into_excel as it was before the layout planner, one insert_cols per PDF once the sample area is full."""
+    total_count_index = mold_processing.find_total_count_index(sheet)
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    for col_index in range(total_count_index):
+        if header_row[col_index] is None:
+            break
+    else:
+        col_index = total_count_index
+        sheet.insert_cols(col_index + 1)
+    sheet.cell(row=3, column=col_index + 1, value=lab_reference_number)
+    for row in range(4, sheet.max_row + 1):
+        spore_type = str(sheet.cell(row=row, column=1).value).strip()
+        if spore_type in mold_dict:
+            sheet.cell(row=row, column=col_index + 1, value=mold_dict[spore_type])
+
+def make_template(rows):
+    """A template with spore types, no sample columns and only the 'Total' header, like a fresh tracking sheet."""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.cell(row=3, column=1, value="Spore Type")
+    sheet.cell(row=3, column=2, value="Total")
+    for row in range(4, rows + 4):
+        sheet.cell(row=row, column=1, value=f"Spore {row - 3}")
+    return workbook
+
+def make_reports(sheet, count):
+    spore_types = [str(sheet.cell(row=row, column=1).value).strip() for row in range(4, sheet.max_row + 1)]
+    return [
+        ({spore_type: (index * 7 + offset * 3) % 50 for offset, spore_type in enumerate(spore_types)}, f"REF-{index:04d}")
+        for index in range(count)
+    ]
+
+def run_legacy(workbook, reports):
+    sheet = workbook.active
+    for mold_dict, lab_reference_number in reports:
+        legacy_insert(mold_dict, sheet, lab_reference_number)
+    for stat_function in LEGACY_STAT_FUNCTIONS:
+        stat_function(sheet)
+
+def run_planner(workbook, reports):
+    sheet = workbook.active
+    for report in reports:
+        mold_processing.insert_columns_into_excel([report], sheet)
+    mold_processing.update_statistics(sheet)
+
+def measure(label, make_workbook, reports):
+    for name, run in (("legacy", run_legacy), ("planner", run_planner)):
+        workbook = make_workbook()
+        with MoveCounter() as counter:
+            started = time.perf_counter()
+            run(workbook, reports)
+            elapsed = time.perf_counter() - started
+        print(f"{label:<24}{name:<10}{counter.moves:>12}{elapsed:>12.3f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare cell moves of the legacy column handling and the layout planner.")
+    parser.add_argument("--reports", type=int, default=50, help="number of single-sample reports to insert")
+    parser.add_argument("--rows", type=int, default=40, help="spore type rows in the synthetic template")
+    parser.add_argument("--workbook", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample", "Example.xlsx"),
+                        help="real workbook to benchmark as well, skipped if missing")
+    args = parser.parse_args(argv)
+
+    print(f"{'workbook':<24}{'flow':<10}{'cell moves':>12}{'seconds':>12}")
+    template_reports = make_reports(make_template(args.rows).active, args.reports)
+    measure("synthetic template", lambda: make_template(args.rows), template_reports)
+    if os.path.exists(args.workbook):
+        workbook_reports = make_reports(load_workbook(args.workbook).active, args.reports)
+        measure(os.path.basename(args.workbook), lambda: load_workbook(args.workbook), workbook_reports)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
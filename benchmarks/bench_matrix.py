@@ -0,0 +1,90 @@
+"""
+Compares the memory and time of holding a sample history as openpyxl cells against SampleMatrix.
+
+For every size a synthetic tracking workbook is written, then loaded both ways while tracemalloc
+records what stays allocated: the cell-based way is load_workbook as the GUI and batch mode use it,
+the matrix way streams the same sheet read-only into a SampleMatrix. The statistics are then
+computed from each, with update_statistics on the sheet and SampleMatrix.statistics, and
+checked to agree.
+
+Usage:
+    python benchmarks/bench_matrix.py [--samples 1000 5000] [--rows 100]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from openpyxl import load_workbook
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from mold_processing import SampleMatrix, update_statistics  # noqa: E402
+from synthetic import make_tracking_workbook  # noqa: E402
+
+def measure_load(load):
+    """
+    Runs a loader under tracemalloc.
+
+    Returns:
+        tuple: (result, retained bytes, peak bytes, seconds)
+    """
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained, peak, elapsed
+
+def load_matrix(path):
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return SampleMatrix.from_sheet(workbook.active)
+    finally:
+        workbook.close()
+
+def same_statistics(first, second):
+    for header, values in first.items():
+        for a, b in zip(values, second[header]):
+            if a != b and not (isinstance(a, float) and isinstance(b, float) and abs(a - b) <= 1e-9 * max(abs(a), 1)):
+                return False
+    return True
+
+def run(samples_list, rows):
+    print(f"{'size':<12}{'approach':<10}{'retained MB':>13}{'peak MB':>10}{'B/count':>9}{'load s':>9}{'stats s':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for samples in samples_list:
+            path = os.path.join(directory, f"history_{samples}x{rows}.xlsx")
+            make_tracking_workbook(path, samples, rows, statistics=False)
+            counts = samples * rows
+            size = f"{samples}x{rows}"
+
+            workbook, retained, peak, load_time = measure_load(lambda: load_workbook(path))
+            started = time.perf_counter()
+            sheet_stats = update_statistics(workbook.active, "values")
+            stats_time = time.perf_counter() - started
+            print(f"{size:<12}{'cells':<10}{retained / 2**20:>13.1f}{peak / 2**20:>10.1f}{retained / counts:>9.0f}{load_time:>9.2f}{stats_time:>9.3f}")
+            del workbook
+
+            matrix, retained, peak, load_time = measure_load(lambda: load_matrix(path))
+            started = time.perf_counter()
+            matrix_stats = matrix.statistics(legacy_last_column=True)
+            stats_time = time.perf_counter() - started
+            print(f"{size:<12}{'matrix':<10}{retained / 2**20:>13.1f}{peak / 2**20:>10.1f}{retained / counts:>9.0f}{load_time:>9.2f}{stats_time:>9.3f}")
+            if not same_statistics(sheet_stats, matrix_stats):
+                print(f"Statistics differ for {size}!")
+                return 1
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory of a sample history held as openpyxl cells vs. a SampleMatrix.")
+    parser.add_argument("--samples", type=int, nargs="+", default=[1000, 5000], help="sample columns per workbook")
+    parser.add_argument("--rows", type=int, default=100, help="spore type rows per workbook")
+    args = parser.parse_args(argv)
+    return run(args.samples, args.rows)
+
+if __name__ == "__main__":
+    sys.exit(main())
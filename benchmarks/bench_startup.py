@@ -0,0 +1,111 @@
+"""
+Checks the cold start of the headless CLI (src/cli.py) against a time budget.
+
+Each scenario runs `python -X importtime -m cli ...` in a fresh process from src/. The import
+time is the sum of the top-level imports reported by -X importtime, and the wall time is that of
+the whole process. The median of --repeat runs is kept. A scenario fails if its import time is over
+the budget or if it loaded any of the heavy modules it must not need. `check -w` has to read the
+workbook, so it may import openpyxl and gets the larger --workbook-budget, but it must not load
+the PDF extraction.
+
+Usage:
+    python benchmarks/bench_startup.py [--budget 100] [--workbook-budget 400] [--repeat 5]
+
+The exit status is 1 if any scenario failed.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from synthetic import make_report_pdf, make_tracking_workbook
+
+#CONSTANTS
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+HEAVY_MODULES = ("pdfplumber", "pdfminer", "openpyxl", "numpy", "tkinter")
+EXTRACTION_MODULES = ("pdfplumber", "pdfminer", "tkinter", "mold_processing")  # openpyxl pulls in numpy itself
+DEFAULT_BUDGET_MS = 100
+DEFAULT_WORKBOOK_BUDGET_MS = 400  # openpyxl alone takes 150-250 ms to import
+
+def scenarios(directory, budget, workbook_budget):
+    """The light command lines, each with the heavy modules it must not import and its import time budget."""
+    pdf_path = os.path.join(directory, "report.pdf")
+    cache_path = os.path.join(directory, "cache.sqlite3")
+    workbook_path = os.path.join(directory, "tracking.xlsx")
+    make_report_pdf(pdf_path)
+    make_tracking_workbook(workbook_path, 200)
+    # Fill the cache once so 'extract' below is a cache hit
+    subprocess.run([sys.executable, "-m", "cli", "extract", pdf_path, "--cache", cache_path], cwd=SRC_DIR, check=True, capture_output=True)
+    return {
+        "help": (["--help"], HEAVY_MODULES, budget),
+        "check": (["check", pdf_path, "--cache", cache_path], HEAVY_MODULES, budget),
+        "check -w": (["check", pdf_path, "-w", workbook_path, "--cache", cache_path], EXTRACTION_MODULES, workbook_budget),
+        "extract (cached)": (["extract", pdf_path, "--cache", cache_path], HEAVY_MODULES, budget),
+    }
+
+def parse_importtime(stderr):
+    """
+    Reads the -X importtime report.
+
+    Returns:
+        tuple: (milliseconds spent in top-level imports, set of imported module names)
+    """
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not cumulative_us.strip().isdigit():
+            continue  # The column header line
+        modules.add(name.strip())
+        # Top-level imports are not indented, their cumulative time includes everything below them
+        if name.startswith(" ") and not name.startswith("  "):
+            total_us += int(cumulative_us)
+    return total_us / 1000, modules
+
+def run_scenario(arguments, repeat):
+    import_times = []
+    wall_times = []
+    modules = set()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", "-m", "cli"] + arguments, cwd=SRC_DIR, capture_output=True, text=True)
+        wall_times.append((time.perf_counter() - started) * 1000)
+        import_ms, imported = parse_importtime(process.stderr)
+        import_times.append(import_ms)
+        modules |= imported
+    return statistics.median(import_times), statistics.median(wall_times), modules
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start time of the headless CLI against a budget.")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_MS, help="allowed import time per command in ms (default: %(default)s)")
+    parser.add_argument("--workbook-budget", type=float, default=DEFAULT_WORKBOOK_BUDGET_MS, help="allowed import time for commands reading a workbook in ms (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per command, the median is kept")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    print(f"{'command':<20}{'imports ms':>12}{'wall ms':>10}  result")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (arguments, forbidden, budget) in scenarios(directory, args.budget, args.workbook_budget).items():
+            import_ms, wall_ms, modules = run_scenario(arguments, args.repeat)
+            heavy = sorted(module for module in modules if module.split(".")[0] in forbidden)
+            problems = []
+            if import_ms > budget:
+                problems.append(f"over the {budget:.0f} ms budget")
+            if heavy:
+                problems.append("imported " + ", ".join(sorted({module.split(".")[0] for module in heavy})))
+            failures += bool(problems)
+            print(f"{name:<20}{import_ms:>12.1f}{wall_ms:>10.1f}  {'; '.join(problems) or 'ok'}")
+    if failures:
+        print(f"{failures} commands failed the startup budget.")
+        return 1
+    print("All commands within the startup budget.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
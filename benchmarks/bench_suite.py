@@ -0,0 +1,200 @@
+"""
+Times the hot paths on synthetic reports and workbooks and compares them with a saved baseline,
+so a change that slows one of them down shows up.
+
+Benchmarked: find_mold_values with both engines and find_all_samples on a synthetic result PDF,
+and for every workbook size load_workbook, save, insert_into_excel, each of the per-row statistic
+functions and update_statistics. Every benchmark runs --repeat times and the median is kept.
+Setup work (copying and loading the workbook a benchmark needs) is not timed.
+
+Usage:
+    python benchmarks/bench_suite.py [--samples 100 1000] [--rows 31] [--repeat 5] [--filter stats]
+    python benchmarks/bench_suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_suite.py --baseline benchmarks/baseline.json [--tolerance 0.25]
+
+With --baseline the exit status is 1 if any benchmark got slower than the tolerance allows.
+Baselines are only comparable on the same machine.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import openpyxl
+from openpyxl import load_workbook
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from mold_processing import (  # noqa: E402
+    find_mold_values, find_all_samples, insert_into_excel, update_statistics, clear_old_stats, total_count, mean_count,
+    stdv_count, display_mold_type_frequency, find_min, fifth_percentile, find_median, find_ninety_fifth_percentile,
+    find_max, find_count
+)
+from synthetic import make_report_pdf, make_tracking_workbook  # noqa: E402
+
+#CONSTANTS
+STAT_FUNCTIONS = [
+    clear_old_stats, total_count, mean_count, stdv_count, display_mold_type_frequency, find_min, fifth_percentile,
+    find_median, find_ninety_fifth_percentile, find_max, find_count,
+]
+MAX_PDF_ROWS = 45  # spore type rows that fit on one synthetic results page
+MIN_REGRESSION = 0.001  # seconds a benchmark must slow down by before it counts, whatever the ratio
+
+def time_call(run, setup=None, repeat=5):
+    """
+    Runs a benchmark `repeat` times.
+
+    Args:
+        run (callable): The timed call, given whatever setup returned.
+        setup (callable, optional): Untimed preparation run before every call.
+        repeat (int, optional): Number of timed calls.
+
+    Returns:
+        dict: 'median' and 'min' seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        started = time.perf_counter()
+        run(argument)
+        times.append(time.perf_counter() - started)
+    return {"median": statistics.median(times), "min": min(times)}
+
+def extraction_benchmarks(directory, rows):
+    pdf_path = os.path.join(directory, "report.pdf")
+    make_report_pdf(pdf_path, rows=min(rows, MAX_PDF_ROWS), indoor_samples=2)
+    return {
+        "find_mold_values[tables]": (lambda _: find_mold_values(pdf_path, "tables"), None),
+        "find_mold_values[words]": (lambda _: find_mold_values(pdf_path, "words"), None),
+        "find_all_samples": (lambda _: find_all_samples(pdf_path), None),
+    }
+
+def workbook_benchmarks(directory, samples, rows):
+    workbook_path = os.path.join(directory, f"tracking_{samples}x{rows}.xlsx")
+    make_tracking_workbook(workbook_path, samples, rows)
+    mold_dict, lab_reference_number = make_report_pdf(os.path.join(directory, "insert.pdf"), rows=min(rows, MAX_PDF_ROWS), seed=1)
+    save_path = os.path.join(directory, "saved.xlsx")
+    loaded = {}
+
+    def loaded_sheet():
+        # The statistic functions leave the samples alone, so one loaded copy serves every call
+        if "sheet" not in loaded:
+            loaded["workbook"] = load_workbook(workbook_path)
+            loaded["sheet"] = loaded["workbook"].active
+        return loaded["sheet"]
+
+    size = f"{samples}x{rows}"
+    benchmarks = {
+        f"load_workbook[{size}]": (lambda _: load_workbook(workbook_path), None),
+        f"save[{size}]": (lambda workbook: workbook.save(save_path), lambda: loaded_sheet().parent),
+        f"insert_into_excel[{size}]": (
+            lambda sheet: insert_into_excel(mold_dict, sheet, lab_reference_number),
+            lambda: load_workbook(workbook_path).active,
+        ),
+    }
+    for function in STAT_FUNCTIONS:
+        benchmarks[f"{function.__name__}[{size}]"] = (function, loaded_sheet)
+    benchmarks[f"update_statistics[{size}]"] = (lambda sheet: update_statistics(sheet, "values"), loaded_sheet)
+    return benchmarks
+
+def run_benchmarks(samples_list, rows, repeat, name_filter=None):
+    """
+    Builds the synthetic inputs and times every benchmark.
+
+    Args:
+        samples_list (list): Sample column counts, one workbook size each.
+        rows (int): Spore type rows of every workbook.
+        repeat (int): Timed calls per benchmark.
+        name_filter (str, optional): Only run benchmarks whose name contains this text.
+
+    Returns:
+        dict: Benchmark name -> {'median', 'min'} seconds, in run order.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        groups = [lambda: extraction_benchmarks(directory, rows)]
+        groups += [lambda samples=samples: workbook_benchmarks(directory, samples, rows) for samples in samples_list]
+        for group in groups:
+            for name, (run, setup) in group().items():
+                if name_filter and name_filter not in name:
+                    continue
+                results[name] = time_call(run, setup, repeat)
+                print(f"{name:<45}{results[name]['median'] * 1000:>12.2f} ms")
+    return results
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "openpyxl": openpyxl.__version__,
+    }
+
+def save_baseline(path, results, args):
+    data = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "parameters": {"samples": args.samples, "rows": args.rows, "repeat": args.repeat},
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as baseline_file:
+        json.dump(data, baseline_file, indent=2)
+    print(f"Baseline written to '{path}'")
+
+def compare_with_baseline(path, results, tolerance):
+    """
+    Prints every benchmark next to its baseline.
+
+    Args:
+        path (str): Baseline JSON written by --save-baseline.
+        results (dict): This run's results.
+        tolerance (float): Allowed slowdown as a fraction, e.g. 0.25 for 25%.
+
+    Returns:
+        list: Names of the benchmarks that regressed.
+    """
+    with open(path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get("environment") != environment():
+        print("Warning: the baseline was recorded in a different environment, timings may not be comparable.")
+    regressions = []
+    print(f"\n{'benchmark':<45}{'now ms':>10}{'baseline ms':>13}{'change':>9}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<45}{result['median'] * 1000:>10.2f}{'-':>13}{'new':>9}")
+            continue
+        change = result["median"] / before["median"] - 1 if before["median"] else 0.0
+        regressed = change > tolerance and result["median"] - before["median"] > MIN_REGRESSION
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<45}{result['median'] * 1000:>10.2f}{before['median'] * 1000:>13.2f}{change:>+9.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the extraction, insert, statistics and load/save paths on synthetic inputs.")
+    parser.add_argument("--samples", type=int, nargs="+", default=[100, 1000], help="filled sample columns per workbook")
+    parser.add_argument("--rows", type=int, default=31, help="spore type rows per workbook and report")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per benchmark, the median is kept")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a baseline JSON file")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with a baseline JSON file and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.samples, args.rows, args.repeat, args.filter)
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, args)
+    if args.baseline:
+        regressions = compare_with_baseline(args.baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {args.tolerance:.0%}.")
+            return 1
+        print("No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
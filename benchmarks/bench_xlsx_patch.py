@@ -0,0 +1,127 @@
+"""
+Times inserting one report with openpyxl (load, insert, statistics, save) against patching the
+worksheet XML with xlsx_patch, on synthetic tracking workbooks of several sizes, and checks that
+both produce the same cell values when the results are opened in openpyxl.
+
+Usage:
+    python benchmarks/bench_xlsx_patch.py [--samples 200 1000 4000] [--rows 40]
+"""
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from xml.etree import ElementTree
+from openpyxl import Workbook, load_workbook
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from mold_processing import STAT_HEADERS, update_statistics  # noqa: E402
+from batch import insert_report  # noqa: E402
+from duplicates import DuplicateIndex  # noqa: E402
+from xlsx_patch import patch_report  # noqa: E402
+
+#CONSTANTS
+FREE_SLOTS = 10
+
+def make_workbook(path, samples, rows):
+    """A tracking workbook with `samples` filled sample columns, a few free slots and every statistic column."""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.cell(row=3, column=1, value="Lab Ref No.")
+    for row in range(4, rows + 4):
+        sheet.cell(row=row, column=1, value=f"Spore {row - 3}")
+    for col in range(2, samples + 2):
+        sheet.cell(row=3, column=col, value=f"M{col:06d}-1")
+        for row in range(4, rows + 4):
+            sheet.cell(row=row, column=col, value=(col * 7 + row * 13) % 40)
+    total_col = samples + 2 + FREE_SLOTS
+    for offset, header in enumerate(STAT_HEADERS):
+        sheet.cell(row=3, column=total_col + offset, value=header)
+    update_statistics(sheet)
+    # Record one PDF so the hidden '_ingested' sheet exists, as it does after the first GUI insert
+    insert_report(sheet, "seed.pdf", [({"Spore 1": 1}, "SEED")], duplicates=DuplicateIndex(workbook, sheet), digest="0" * 64)
+    workbook.save(path)
+
+def make_report(rows):
+    return [({f"Spore {row}": (row * 5) % 11 for row in range(1, rows + 1)}, "M999999-1")]
+
+def run_openpyxl(path, report):
+    workbook = load_workbook(path)
+    sheet = workbook.active
+    insert_report(sheet, "report.pdf", report, duplicates=DuplicateIndex(workbook, sheet), digest="1" * 64)
+    update_statistics(sheet)
+    workbook.save(path)
+
+def run_patch(path, report):
+    patch_report(path, "report.pdf", report, "1" * 64, aliases={})
+
+def measure(run, template, report, directory, name):
+    path = os.path.join(directory, name)
+    shutil.copy(template, path)
+    started = time.perf_counter()
+    run(path, report)
+    elapsed = time.perf_counter() - started
+    shutil.copy(template, path)
+    tracemalloc.start()
+    run(path, report)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return path, elapsed, peak
+
+def same_values(first_path, second_path):
+    """Opens both workbooks in openpyxl and compares every cell value, allowing float rounding."""
+    first = load_workbook(first_path)
+    second = load_workbook(second_path)
+    if first.sheetnames != second.sheetnames:
+        return False
+    for name in first.sheetnames:
+        first_sheet, second_sheet = first[name], second[name]
+        # The ingestion time differs between the two runs
+        max_col = 3 if name == "_ingested" else max(first_sheet.max_column, second_sheet.max_column)
+        for first_row, second_row in zip(
+            first_sheet.iter_rows(max_col=max_col, values_only=True),
+            second_sheet.iter_rows(max_col=max_col, values_only=True),
+        ):
+            for x, y in zip(first_row, second_row):
+                if isinstance(x, float) and isinstance(y, float) and math.isclose(x, y):
+                    continue
+                if x != y:
+                    return False
+    return True
+
+def well_formed(path):
+    """Parses every XML part of the patched file."""
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            if name.endswith(".xml") or name.endswith(".rels"):
+                ElementTree.fromstring(archive.read(name))
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the openpyxl load/save path with the xlsx XML patcher.")
+    parser.add_argument("--samples", type=int, nargs="+", default=[200, 1000, 4000], help="filled sample columns per workbook")
+    parser.add_argument("--rows", type=int, default=40, help="spore type rows per workbook")
+    args = parser.parse_args(argv)
+
+    print(f"{'samples':>8}{'size MB':>9}{'openpyxl s':>12}{'patch s':>10}{'openpyxl MB':>13}{'patch MB':>10}  round trip")
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for samples in args.samples:
+            template = os.path.join(directory, f"template_{samples}.xlsx")
+            make_workbook(template, samples, args.rows)
+            report = make_report(args.rows)
+            openpyxl_path, openpyxl_time, openpyxl_peak = measure(run_openpyxl, template, report, directory, "openpyxl.xlsx")
+            patch_path, patch_time, patch_peak = measure(run_patch, template, report, directory, "patch.xlsx")
+            ok = well_formed(patch_path) and same_values(openpyxl_path, patch_path)
+            failed = failed or not ok
+            size = os.path.getsize(template) / 1e6
+            print(f"{samples:>8}{size:>9.2f}{openpyxl_time:>12.3f}{patch_time:>10.3f}"
+                  f"{openpyxl_peak / 1e6:>13.1f}{patch_peak / 1e6:>10.1f}  {'ok' if ok else 'MISMATCH'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
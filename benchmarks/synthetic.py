@@ -0,0 +1,178 @@
+"""
+Builds synthetic lab result PDFs and tracking workbooks for the benchmarks, locally and without
+any PDF library.
+
+The PDFs copy the layout find_mold_values expects: a cover page, then a ruled results table on
+page 2 with the spore types in the first column and, per sample, a header cell ('Outdoor' or a
+room name), the lab reference number one row down and the counts two columns to the right. The
+workbooks copy sample/Example.xlsx: lab reference numbers in row 3 from column B, spore types in
+column A from row 4 and the statistic columns after the samples.
+"""
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+#CONSTANTS
+SPORE_TYPES = [
+    "Basidiospores non-specified", "Ascospores non-specified", "Cladosporium", "Ganoderma",
+    "Aspergillus/Penicillium-like", "Coprinus", "Non-specified spores", "Myxomycetes/Periconia/Rusts/Smuts",
+    "Alternaria/Ulocladium-like", "Epicoccum", "Polythrincium", "Pithomyces-like", "Cercospora", "Oidium-like",
+    "Botrytis", "Helicospores", "Arthrinium", "Torula", "Curvularia", "Bipolaris/Drechslera/Exserohilum/Helminthosporium",
+    "Peronospora", "Fusicladium", "Scopulariopsis", "Fusarium-like", "Nigrospora", "Pestalotiopsis", "Stemphylium",
+    "Exosporiella", "Stachybotrys", "Chaetomium-like", "Rhizopus",
+]
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+LABEL_WIDTH = 170
+CELL_WIDTH = 48
+ROW_HEIGHT = 14
+FONT_SIZE = 7
+HEADER_FONT = Font(name='Arial', size=11, bold=True)
+VALUE_FONT = Font(name='Arial', size=11)
+
+def spore_types(rows):
+    """Returns `rows` spore type names, the real ones from the sample workbook first."""
+    return [SPORE_TYPES[row] if row < len(SPORE_TYPES) else f"Synthetic spore {row + 1}" for row in range(rows)]
+
+def sample_count(row, sample):
+    """A deterministic, fairly spread count with some empty cells and zeros."""
+    value = (row * 7919 + sample * 104729) % 97
+    if value < 10:
+        return None
+    return 0 if value < 25 else value * (13 if row % 3 else 160)
+
+def escape_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def page_stream(lines, table=None, top=720):
+    """PDF content drawing some lines of text and, optionally, a ruled table below them."""
+    ops = []
+    for offset, line in enumerate(lines):
+        ops.append(f"BT /F1 10 Tf 40 {top - offset * 14} Td ({escape_text(line)}) Tj ET")
+    if table:
+        widths = [LABEL_WIDTH] + [CELL_WIDTH] * (max(len(row) for row in table) - 1)
+        edges = [40]
+        for width in widths:
+            edges.append(edges[-1] + width)
+        y0 = top - len(lines) * 14 - 10
+        ops.append("0.5 w")
+        for row in range(len(table) + 1):
+            y = y0 - row * ROW_HEIGHT
+            ops.append(f"{edges[0]} {y} m {edges[-1]} {y} l S")
+        for x in edges:
+            ops.append(f"{x} {y0} m {x} {y0 - len(table) * ROW_HEIGHT} l S")
+        for row, cells in enumerate(table):
+            for col, text in enumerate(cells):
+                if text:
+                    ops.append(f"BT /F1 {FONT_SIZE} Tf {edges[col] + 2} {y0 - (row + 1) * ROW_HEIGHT + 4} Td ({escape_text(text)}) Tj ET")
+    return "\n".join(ops).encode("latin-1")
+
+def write_pdf(path, pages):
+    """Writes a minimal PDF with one Helvetica font and the given page content streams."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{4 + 2 * i} 0 R' for i in range(len(pages)))}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    for number, content in enumerate(pages):
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * number} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(output)
+
+def results_table(rows, lab_reference_number, indoor_samples=1, seed=0):
+    """
+    The page-2 results table: one indoor room per `indoor_samples`, then the outdoor control.
+    Indoor rooms are numbered on from the outdoor suffix ('M900001-3', 'M900001-4', ... for
+    'M900001-2'), so no room shares the outdoor lab reference number.
+
+    Returns:
+        tuple: (table rows, expected) where expected is the (mold_dict, lab_reference_number) the
+            outdoor column should extract as.
+    """
+    names = [f"Room {number + 1}" for number in range(indoor_samples)] + ["Outdoor"]
+    prefix, _, suffix = lab_reference_number.rpartition("-")
+    first_indoor = int(suffix) + 1 if prefix and suffix.isdigit() else 1
+    header = ["Sample"]
+    references = ["Lab Reference No."]
+    units = ["Spore type"]
+    for number, name in enumerate(names):
+        header += [name, "", ""]
+        references += [f"{prefix or lab_reference_number}-{first_indoor + number}" if name != "Outdoor" else lab_reference_number, "", ""]
+        units += ["raw ct.", "%", "spores/m3"]
+    table = [header, references, units]
+    expected = {}
+    for row, spore_type in enumerate(spore_types(rows)):
+        cells = [spore_type]
+        for number in range(len(names)):
+            count = sample_count(row + seed, number)
+            cells += [str(count // 13) if count else "", "", f"{count:,}" if count is not None else ""]
+        table.append(cells)
+        expected[spore_type] = sample_count(row + seed, len(names) - 1)
+    return table, (expected, lab_reference_number)
+
+def make_report_pdf(path, rows=len(SPORE_TYPES), lab_reference_number="M900001-2", indoor_samples=1, seed=0):
+    """
+    Writes a synthetic two-page result PDF.
+
+    Args:
+        path (str): Where to write the PDF.
+        rows (int, optional): Spore type rows in the results table, which must fit on the page.
+        lab_reference_number (str, optional): Lab reference number of the outdoor sample.
+        indoor_samples (int, optional): Indoor sample columns before the outdoor one.
+        seed (int, optional): Varies the counts between reports.
+
+    Returns:
+        tuple: The (mold_dict, lab_reference_number) find_mold_values should return for it.
+    """
+    table, expected = results_table(rows, lab_reference_number, indoor_samples, seed)
+    cover = page_stream(["Synthetic Laboratory", "Spore Trap Analysis Report", f"Report {lab_reference_number}"])
+    results = page_stream(["Analysis results"], table)
+    write_pdf(path, [cover, results])
+    return expected
+
+def make_tracking_workbook(path, samples, rows=len(SPORE_TYPES), free_slots=0, statistics=True):
+    """
+    Writes a tracking workbook shaped like sample/Example.xlsx.
+
+    Args:
+        path (str): Where to save the workbook.
+        samples (int): Filled sample columns.
+        rows (int, optional): Spore type rows.
+        free_slots (int, optional): Empty sample columns left before 'Total'.
+        statistics (bool, optional): Fill in the statistic columns, otherwise only their headers are written.
+
+    Returns:
+        None
+    """
+    # Imported here so the PDF helpers work without the src folder on the path
+    from mold_processing import STAT_HEADERS, update_statistics
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Sheet1"
+    sheet.cell(row=3, column=1, value="Lab Ref No.").font = HEADER_FONT
+    sheet.column_dimensions["A"].width = 28.86
+    sheet.freeze_panes = "B4"
+    for row, spore_type in enumerate(spore_types(rows), start=4):
+        sheet.cell(row=row, column=1, value=spore_type).font = VALUE_FONT
+    for sample in range(samples):
+        col = sample + 2
+        sheet.cell(row=3, column=col, value=f"M{318000 + sample}-2").font = HEADER_FONT
+        for row in range(rows):
+            value = sample_count(row, sample)
+            if value is not None:
+                sheet.cell(row=row + 4, column=col, value=value).font = VALUE_FONT
+    total_col = samples + 2 + free_slots
+    for offset, header in enumerate(STAT_HEADERS):
+        sheet.cell(row=3, column=total_col + offset, value=header).font = HEADER_FONT
+    if statistics:
+        update_statistics(sheet, "values")
+    workbook.save(path)
@@ -0,0 +1,188 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from mold_processing import LAB_REFERENCE_NUMBER_STYLE, OTHER_STYLE, STAT_HEADERS, ZERO_WHEN_EMPTY_HEADERS, SampleMatrix
+from spore_index import FIRST_SPORE_ROW
+from duplicates import reference_key
+
+#CONSTANTS
+ALL_SITES = "All sites"
+SUMMARY_HEADERS = ["Site", "Spore type"] + STAT_HEADERS
+SOURCE_HEADERS = ["Workbook", "Site", "Samples", "Duplicates skipped", "Error"]
+CHUNK_SIZE = 4  # workbooks handed to a worker process at a time
+
+def collect_workbook_paths(sources, exclude=()):
+    """
+    Expands a mix of workbook files, directories (searched recursively) and glob patterns into a
+    sorted list of .xlsx paths. Excel lock files ('~$...') are left out.
+
+    Args:
+        sources (list): File paths, directory paths or glob patterns.
+        exclude (tuple, optional): Paths to leave out, e.g. the summary workbook being written.
+
+    Returns:
+        list: Unique workbook paths in sorted order.
+    """
+    excluded = {os.path.abspath(path) for path in exclude}
+    workbook_paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            matches = glob.glob(os.path.join(source, "**", "*.xlsx"), recursive=True)
+        elif os.path.isfile(source):
+            matches = [source]
+        else:
+            matches = glob.glob(source, recursive=True)
+        for path in matches:
+            if path.lower().endswith(".xlsx") and not os.path.basename(path).startswith("~$"):
+                workbook_paths.add(os.path.abspath(path))
+    return sorted(workbook_paths - excluded)
+
+def site_name(workbook_path, root=None):
+    """Returns the site a workbook stands for: its path below root without the extension, e.g. 'north/site-12'."""
+    if root is not None and os.path.isdir(root):
+        workbook_path = os.path.relpath(workbook_path, root)
+    else:
+        workbook_path = os.path.basename(workbook_path)
+    return os.path.splitext(workbook_path)[0].replace(os.sep, "/")
+
+def read_archive_workbook(workbook_path):
+    """
+    Streams the samples out of one tracking workbook opened read-only, so only the rows being read
+    are held in memory. Runs in a worker process.
+
+    Errors are returned as text rather than raised, like extract_worker does.
+
+    Args:
+        workbook_path (str): Path to the workbook.
+
+    Returns:
+        tuple: (samples, rows, error)
+            samples (list): Lab reference numbers of the sample columns, column B up to 'Total'.
+                Columns without a header are skipped.
+            rows (list): (spore type, values) per spore type row, values holding one cell value per sample.
+            error (str): A message, or None.
+    """
+    workbook = None
+    try:
+        workbook = load_workbook(workbook_path, read_only=True, data_only=True)
+        sheet = workbook.active
+        rows = sheet.iter_rows(min_row=FIRST_SPORE_ROW - 1, values_only=True)
+        header_row = next(rows, None)
+        if header_row is None or "Total" not in header_row:
+            return [], [], "The 'Total' column header is missing in the Excel sheet."
+        total_col_index = header_row.index("Total")
+        columns = [col for col in range(1, total_col_index) if header_row[col] is not None and str(header_row[col]).strip()]
+        samples = [str(header_row[col]).strip() for col in columns]
+        spore_rows = []
+        for row in rows:
+            if not row or row[0] is None or not str(row[0]).strip():
+                continue
+            spore_rows.append((str(row[0]).strip(), [row[col] if col < len(row) else None for col in columns]))
+        return samples, spore_rows, None
+    except Exception as e:
+        return [], [], f"Failed to read workbook: {e}"
+    finally:
+        if workbook is not None:
+            # Read-only workbooks keep their zip file open until closed
+            workbook.close()
+
+def query_archive(workbook_paths, root=None, by_site=False, aliases=None, workers=None):
+    """
+    Combines the samples of many tracking workbooks and computes the statistic columns over them.
+
+    Workbooks are read in a process pool and their samples appended to one SampleMatrix. Spore
+    types are matched across workbooks by their normalized name and the alias table, in the order
+    they are first seen. A lab reference
+    number found in more than one workbook is counted once, in the first workbook in path order.
+    Every statistic covers all the samples of the group, so unlike the workbook's own columns
+    Min through Count include each site's last sample.
+
+    Args:
+        workbook_paths (list): Workbooks to combine, e.g. from collect_workbook_paths.
+        root (str, optional): Directory site names are taken relative to.
+        by_site (bool, optional): Also compute the statistics of every site on its own.
+        aliases (dict, optional): Alias table from load_aliases, the default table if omitted.
+        workers (int, optional): Worker processes, defaults to the number of CPUs. 1 reads in this process.
+
+    Returns:
+        tuple: (labels, groups, sources)
+            labels (list): Spore type label per statistics row.
+            groups (list): (site, stats) for 'All sites' followed by each site if by_site.
+            sources (list): One row per workbook as in SOURCE_HEADERS.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(workbook_paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(workbook_paths))) as executor:
+            results = list(executor.map(read_archive_workbook, workbook_paths, chunksize=CHUNK_SIZE))
+    else:
+        results = [read_archive_workbook(path) for path in workbook_paths]
+
+    matrix = SampleMatrix([], aliases)
+    seen = set()
+    sites = []
+    sources = []
+    for workbook_path, (samples, spore_rows, error) in zip(workbook_paths, results):
+        site = site_name(workbook_path, root)
+        if error is not None:
+            sources.append([workbook_path, site, 0, 0, error])
+            continue
+        start = len(matrix)
+        for col, lab_reference_number in enumerate(samples):
+            if reference_key(lab_reference_number) in seen:
+                continue
+            seen.add(reference_key(lab_reference_number))
+            matrix.append({label: values[col] for label, values in spore_rows}, lab_reference_number, add_missing=True)
+        # Each workbook's samples are one contiguous run of columns
+        sites.append((site, start, len(matrix)))
+        sources.append([workbook_path, site, len(matrix) - start, len(samples) - (len(matrix) - start), ""])
+    groups = [(ALL_SITES, matrix.statistics())]
+    if by_site:
+        groups += [(site, matrix.statistics(start, stop)) for site, start, stop in sites]
+    return list(matrix.spore_types), groups, sources
+
+def write_summary_workbook(output_path, labels, groups, sources):
+    """
+    Writes the query results to a new workbook in write-only mode: a 'Summary' sheet with one row
+    per site and spore type, and a 'Sources' sheet listing every workbook read.
+
+    Args:
+        output_path (str): Where to save the summary workbook.
+        labels (list): Spore type labels from query_archive.
+        groups (list): (site, stats) pairs from query_archive.
+        sources (list): Workbook rows from query_archive.
+
+    Returns:
+        None
+    """
+    workbook = Workbook(write_only=True)
+    summary = workbook.create_sheet("Summary")
+    summary.freeze_panes = "C2"
+    summary.append(header_cells(summary, SUMMARY_HEADERS))
+    for site, stats in groups:
+        for row, label in enumerate(labels):
+            values = []
+            for header in STAT_HEADERS:
+                value = stats[header][row]
+                values.append(0 if value is None and header in ZERO_WHEN_EMPTY_HEADERS else value)
+            summary.append([value_cell(summary, value) for value in [site, label] + values])
+    source_sheet = workbook.create_sheet("Sources")
+    source_sheet.append(header_cells(source_sheet, SOURCE_HEADERS))
+    for source in sources:
+        source_sheet.append([value_cell(source_sheet, value) for value in source])
+    workbook.save(output_path)
+    return
+
+def header_cells(sheet, headers):
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = LAB_REFERENCE_NUMBER_STYLE
+        cells.append(cell)
+    return cells
+
+def value_cell(sheet, value):
+    cell = WriteOnlyCell(sheet, value=value)
+    cell.font = OTHER_STYLE
+    return cell
@@ -0,0 +1,289 @@
+import csv
+import glob
+import os
+import time
+from contextlib import nullcontext
+from openpyxl import load_workbook
+from mold_processing import extract_report, insert_columns_into_excel, replace_column_in_excel, update_statistics, statistics_mode
+from pipeline import ExtractionPipeline, DEFAULT_TIMEOUT
+from extraction_cache import cached_extract_report, file_digest
+from running_stats import update_statistics_incrementally
+from spore_index import SporeRowIndex, load_aliases, DEFAULT_ALIAS_PATH
+from duplicates import DuplicateIndex
+from metrics import measure, record_file, record_stage, workbook_cells
+
+#CONSTANTS
+SUMMARY_FIELDS = ["pdf_path", "status", "lab_reference_number", "message"]
+STATUS_SUCCESS = "success"
+STATUS_SKIPPED = "skipped"
+STATUS_ERROR = "error"
+
+class BatchCancelled(Exception):
+    """Raised by process_batch when it is cancelled before the workbook is saved. Nothing has been written."""
+
+class StageTimer:
+    """
+    Adds up the time spent in each stage of a run (load, extract, insert, stats, save) and passes
+    progress to an optional callback, e.g. a GUI that shows it while the work runs elsewhere.
+
+    The callback is called as progress(stage, done, total, seconds), where seconds is the total
+    time spent in that stage so far.
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.seconds = {}
+        self.started = time.perf_counter()
+
+    def done(self, stage, done=1, total=1):
+        """Books the time since the previous stage ended to this stage, reports it and returns it."""
+        now = time.perf_counter()
+        elapsed = now - self.started
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + elapsed
+        self.started = now
+        if self.progress is not None:
+            self.progress(stage, done, total, self.seconds[stage])
+        return elapsed
+
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise BatchCancelled("Cancelled before the workbook was saved.")
+
+def collect_pdf_paths(sources):
+    """
+    Expands a mix of PDF files, directories and glob patterns into a sorted list of PDF paths.
+
+    Args:
+        sources (list): File paths, directory paths or glob patterns.
+
+    Returns:
+        list: Unique PDF paths in sorted order.
+    """
+    pdf_paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            matches = glob.glob(os.path.join(source, "*.pdf")) + glob.glob(os.path.join(source, "*.PDF"))
+        elif os.path.isfile(source):
+            matches = [source]
+        else:
+            matches = glob.glob(source)
+        pdf_paths.update(os.path.abspath(path) for path in matches if path.lower().endswith(".pdf"))
+    return sorted(pdf_paths)
+
+def default_summary_path(excel_path):
+    """Returns the summary CSV path written next to the workbook, e.g. 'tracking_summary.csv'."""
+    return os.path.splitext(excel_path)[0] + "_summary.csv"
+
+def make_result(pdf_path, status, lab_reference_number=None, message=""):
+    """Builds one row of the per-file summary."""
+    return {
+        "pdf_path": pdf_path,
+        "status": status,
+        "lab_reference_number": lab_reference_number,
+        "message": message,
+    }
+
+def write_summary(results, summary_path):
+    """
+    Writes the per-file results of a batch run to a CSV file.
+
+    Args:
+        results (list): Result dictionaries from process_batch.
+        summary_path (str): Path of the CSV file to write.
+
+    Returns:
+        None
+    """
+    with open(summary_path, "w", newline="", encoding="utf-8") as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+    return
+
+def insert_report(sheet, pdf_path, matches, index=None, duplicates=None, policy="skip", digest=None):
+    """
+    Inserts every extracted sample of one report into the sheet and returns its summary row.
+    Spore types that match no row in the sheet are listed in the message.
+
+    With a DuplicateIndex, the report is checked before anything is written. A PDF inserted before,
+    or a sample whose lab reference number is already a header, is handled by the policy: "skip"
+    leaves it out, "replace" overwrites the existing column in place and "error" rejects the report.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        pdf_path (str): Path of the PDF the report came from.
+        matches (list): (mold_dict, lab_reference_number) pairs as returned by extract_report.
+        index (SporeRowIndex, optional): Spore type row index shared across the batch.
+        duplicates (DuplicateIndex, optional): Reports already in the workbook.
+        policy (str, optional): "skip", "replace" or "error" for duplicates.
+        digest (str, optional): SHA-256 hex digest of the PDF, recorded once it is inserted.
+
+    Returns:
+        dict: The summary row for this PDF.
+    """
+    if not matches:
+        return make_result(pdf_path, STATUS_SKIPPED, message="No matching samples found in the PDF.")
+    lab_reference_numbers = "; ".join(str(lab_reference_number) for mold_dict, lab_reference_number in matches)
+    replacements = []
+    duplicate_references = []
+    if duplicates is not None:
+        ingested_as = duplicates.ingested_as(digest) if digest is not None else None
+        if ingested_as is not None and policy != "replace":
+            status = STATUS_SKIPPED if policy == "skip" else STATUS_ERROR
+            return make_result(pdf_path, status, lab_reference_numbers, f"PDF was already inserted as {ingested_as}.")
+        new_matches = []
+        for mold_dict, lab_reference_number in matches:
+            col = duplicates.column_of(lab_reference_number)
+            if col is None:
+                new_matches.append((mold_dict, lab_reference_number))
+            else:
+                replacements.append((col, mold_dict))
+                duplicate_references.append(str(lab_reference_number))
+        if duplicate_references and policy != "replace":
+            message = "Already in the workbook: " + ", ".join(duplicate_references)
+            if policy == "error" or not new_matches:
+                status = STATUS_SKIPPED if policy == "skip" else STATUS_ERROR
+                return make_result(pdf_path, status, lab_reference_numbers, message)
+            replacements = []
+        matches = new_matches
+    try:
+        unmatched = []
+        for col, mold_dict in replacements:
+            unmatched.extend(replace_column_in_excel(mold_dict, sheet, col, index))
+        if matches:
+            sample_slots, missing = insert_columns_into_excel(matches, sheet, index)
+            unmatched.extend(missing)
+            if duplicates is not None:
+                duplicates.add_columns(sample_slots, [lab_reference_number for mold_dict, lab_reference_number in matches])
+        if duplicates is not None and digest is not None:
+            duplicates.record(digest, lab_reference_numbers, pdf_path)
+    except Exception as e:
+        return make_result(pdf_path, STATUS_ERROR, lab_reference_numbers, f"Failed to insert into Excel: {e}")
+    messages = []
+    if len(matches) > 1:
+        messages.append(f"{len(matches)} samples inserted")
+    if duplicate_references:
+        verb = "Replaced" if replacements else "Skipped"
+        messages.append(f"{verb} samples already in the workbook: " + ", ".join(duplicate_references))
+    if unmatched:
+        messages.append("Unmatched spore types: " + ", ".join(dict.fromkeys(unmatched)))
+    message = "; ".join(messages)
+    return make_result(pdf_path, STATUS_SUCCESS, lab_reference_numbers, message)
+
+def extract_sequentially(pdf_paths, cache=None, engine="tables", samples="outdoor"):
+    """
+    Extracts PDFs one after another in this process.
+
+    Args:
+        pdf_paths (list): Paths of the PDF reports to extract.
+        cache (ExtractionCache, optional): Cache consulted before parsing each PDF.
+        engine (str, optional): The find_mold_values engine to use.
+        samples (str, optional): "outdoor", "indoor" or "all" sample columns.
+
+    Yields:
+        tuple: (pdf_path, matches, error) in the same shape as ExtractionPipeline.
+    """
+    for pdf_path in pdf_paths:
+        try:
+            if cache is not None:
+                yield pdf_path, cached_extract_report(pdf_path, cache, engine, samples), None
+            else:
+                yield pdf_path, extract_report(pdf_path, engine, samples), None
+        except Exception as e:
+            yield pdf_path, None, f"Failed to read PDF: {e}"
+
+def refresh_statistics(sheet, stats_mode=None, state_path=None, rebuild=False):
+    """
+    Brings the statistic columns up to date after reports were inserted.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        stats_mode (str, optional): "values" or "formulas". Defaults to what the workbook already uses.
+        state_path (str, optional): Running statistics file for an incremental update of values.
+        rebuild (bool, optional): Rebuild the running statistics instead of extending them.
+
+    Returns:
+        RunningStatistics: The state to save once the workbook is saved, or None if there is none.
+    """
+    if (stats_mode or statistics_mode(sheet)) == "formulas":
+        update_statistics(sheet, "formulas")
+        return None
+    if state_path is not None and statistics_mode(sheet) == "values":
+        return update_statistics_incrementally(sheet, state_path, rebuild=rebuild)
+    update_statistics(sheet, "values")
+    return None
+
+def process_batch(pdf_paths, excel_path, summary_path=None, workers=1, timeout=DEFAULT_TIMEOUT, cache=None, engine="tables", samples="outdoor", state_path=None, alias_path=DEFAULT_ALIAS_PATH, duplicate_policy="skip", stats_mode=None, progress=None, cancel_event=None):
+    """
+    Inserts every PDF into one workbook with a single load, one statistics pass and a single save.
+
+    Args:
+        pdf_paths (list): Paths of the PDF reports to process, in insertion order.
+        excel_path (str): Path of the tracking workbook to update.
+        summary_path (str, optional): Where to write the per-file CSV summary. Defaults to
+            '<workbook>_summary.csv' next to the workbook.
+        workers (int, optional): Number of extraction processes. 1 extracts in this process.
+        timeout (float, optional): Seconds a single PDF may take when extracting with workers.
+        cache (ExtractionCache, optional): Cache of earlier extractions, so unchanged PDFs are not parsed again.
+        engine (str, optional): The find_mold_values engine to use ("tables" or "words").
+        samples (str, optional): Which sample columns to insert: "outdoor", "indoor" or "all".
+        state_path (str, optional): Running statistics file. When given, only the new sample columns
+            are read to update the statistics, see update_statistics_incrementally.
+        alias_path (str, optional): CSV alias table mapping report spore type names to workbook rows.
+        duplicate_policy (str, optional): What to do with reports already in the workbook: "skip",
+            "replace" or "error". See insert_report.
+        stats_mode (str, optional): "values" to write computed statistics or "formulas" to write
+            Excel formulas that keep themselves current. Defaults to what the workbook already uses.
+        progress (callable, optional): Called with (stage, done, total, seconds) as the run goes, see StageTimer.
+        cancel_event (threading.Event, optional): Set from another thread to stop before the next PDF.
+
+    Returns:
+        list: One result dictionary per PDF with its status (success, skipped or error).
+
+    Raises:
+        BatchCancelled: If cancel_event was set before the save. The workbook is left untouched.
+    """
+    timer = StageTimer(progress)
+    if workers > 1:
+        # Workers start extracting while the workbook is still loading
+        extraction = ExtractionPipeline(pdf_paths, workers=workers, timeout=timeout, cache=cache, engine=engine, samples=samples)
+    else:
+        extraction = nullcontext(extract_sequentially(pdf_paths, cache, engine, samples))
+    results = []
+    with extraction as extractions:
+        with measure("load") as counters:
+            workbook = load_workbook(excel_path)
+            counters["cells"] = workbook_cells(workbook)
+        sheet = workbook.active
+        index = SporeRowIndex(sheet, load_aliases(alias_path))
+        duplicates = DuplicateIndex(workbook, sheet)
+        timer.done("load")
+        for number, (pdf_path, matches, error) in enumerate(extractions, start=1):
+            # Only the time spent waiting for the extraction counts, workers may have finished it already
+            waited = timer.done("extract", number, len(pdf_paths))
+            if workers > 1:
+                record_stage("extract", waited)
+            if error is not None:
+                results.append(make_result(pdf_path, STATUS_ERROR, message=error))
+            else:
+                try:
+                    digest = file_digest(pdf_path)
+                    results.append(insert_report(sheet, pdf_path, matches, index, duplicates, duplicate_policy, digest))
+                except OSError as e:
+                    results.append(make_result(pdf_path, STATUS_ERROR, message=f"Failed to read PDF: {e}"))
+            timer.done("insert", number, len(pdf_paths))
+            record_file(pdf_path, results[-1])
+            check_cancelled(cancel_event)
+    if any(result["status"] == STATUS_SUCCESS for result in results):
+        # Replaced columns change values the running statistics already hold
+        state = refresh_statistics(sheet, stats_mode, state_path, rebuild=duplicate_policy == "replace")
+        timer.done("stats")
+        check_cancelled(cancel_event)
+        with measure("save") as counters:
+            workbook.save(excel_path)
+            counters["cells"] = workbook_cells(workbook)
+        if state is not None:
+            state.save(state_path)
+        timer.done("save")
+    write_summary(results, summary_path or default_summary_path(excel_path))
+    return results
@@ -0,0 +1,175 @@
+"""
+Headless command line for scripts and schedulers, with no GUI and fast startup. Run it from src/:
+
+    python -m cli extract report.pdf [--engine words] [--samples all]
+    python -m cli insert reports/ -w tracking.xlsx
+    python -m cli stats -w tracking.xlsx [--verify]
+    python -m cli check report.pdf [-w tracking.xlsx]
+
+pdfplumber, openpyxl and numpy are only imported inside the commands that need them. So `check`
+against the extraction cache and `extract` of a cached PDF never load them.
+benchmarks/bench_startup.py keeps the cold start within budget.
+"""
+import argparse
+import json
+import os
+import sys
+from extraction_cache import ExtractionCache, DEFAULT_CACHE_PATH, file_digest, extraction_mode
+from duplicates import DUPLICATE_POLICIES
+
+#CONSTANTS
+ENGINES = ("tables", "words")  # mold_processing.EXTRACTION_ENGINES, repeated so --help stays light
+SAMPLES = ("outdoor", "indoor", "all")  # mold_processing.SAMPLE_SELECTIONS
+STATS_MODES = ("values", "formulas")  # mold_processing.STATISTICS_MODES
+
+def open_cache(args):
+    return None if args.no_cache else ExtractionCache(args.cache)
+
+def run_extract(args):
+    """Prints one JSON line per PDF with its samples, parsing only PDFs the cache does not have."""
+    cache = open_cache(args)
+    mode = extraction_mode(args.engine, args.samples)
+    failed = 0
+    try:
+        for pdf_path in args.pdfs:
+            record = {"pdf_path": pdf_path}
+            try:
+                digest = file_digest(pdf_path)
+                matches = cache.get(digest, mode) if cache is not None else None
+                record["cached"] = matches is not None
+                if matches is None:
+                    from mold_processing import extract_report
+                    matches = extract_report(pdf_path, args.engine, args.samples)
+                    if cache is not None:
+                        cache.put(digest, matches, mode)
+                record["samples"] = [{"lab_reference_number": lab_reference_number, "counts": mold_dict} for mold_dict, lab_reference_number in matches]
+            except Exception as e:
+                failed += 1
+                record["error"] = f"Failed to read PDF: {e}"
+            print(json.dumps(record, ensure_ascii=False))
+    finally:
+        if cache is not None:
+            cache.close()
+    return 1 if failed else 0
+
+def run_insert(args):
+    from batch import collect_pdf_paths, process_batch, default_summary_path, STATUS_SUCCESS, STATUS_SKIPPED, STATUS_ERROR
+    pdf_paths = collect_pdf_paths(args.pdfs)
+    if not pdf_paths:
+        print("No PDF files found.")
+        return 1
+    summary_path = default_summary_path(args.workbook)
+    cache = open_cache(args)
+    try:
+        results = process_batch(pdf_paths, args.workbook, summary_path, cache=cache, engine=args.engine, samples=args.samples,
+                                duplicate_policy=args.duplicates, stats_mode=args.stats)
+    except PermissionError:
+        print(f"Permission denied: Unable to save to '{args.workbook}'. Please close the file if it is open.")
+        return 1
+    finally:
+        if cache is not None:
+            cache.close()
+    for result in results:
+        print(f"{result['status']:<8} {result['pdf_path']} {result['message']}".rstrip())
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in (STATUS_SUCCESS, STATUS_SKIPPED, STATUS_ERROR)}
+    print(f"{counts[STATUS_SUCCESS]} inserted, {counts[STATUS_SKIPPED]} skipped, {counts[STATUS_ERROR]} failed. Summary written to '{summary_path}'")
+    return 1 if counts[STATUS_ERROR] else 0
+
+def run_stats(args):
+    from openpyxl import load_workbook
+    workbook = load_workbook(args.workbook)
+    sheet = workbook.active
+    if args.verify:
+        from running_stats import verify_statistics
+        drift = verify_statistics(sheet)
+        for source, row, spore_type, header, actual, expected in drift:
+            location = f"row {row} ({spore_type})" if spore_type is not None else f"row {row}"
+            print(f"{source:<6} {location} {header}: found {actual!r}, expected {expected!r}")
+        print(f"{len(drift)} statistics out of date." if drift else "No drift found.")
+        return 1 if drift else 0
+    from mold_processing import update_statistics
+    update_statistics(sheet, args.mode)
+    try:
+        workbook.save(args.workbook)
+    except PermissionError:
+        print(f"Permission denied: Unable to save to '{args.workbook}'. Please close the file if it is open.")
+        return 1
+    print(f"Statistics of '{args.workbook}' updated.")
+    return 0
+
+def load_ingested(excel_path):
+    """Returns the DuplicateIndex of a workbook, opened read-only."""
+    from openpyxl import load_workbook
+    from duplicates import DuplicateIndex
+    workbook = load_workbook(excel_path, read_only=True)
+    try:
+        return DuplicateIndex(workbook)
+    finally:
+        workbook.close()
+
+def run_check(args):
+    """
+    Prints, per PDF, whether the workbook already holds it (by content hash or lab reference number)
+    and whether the cache has its extraction. No PDF is parsed and the workbook is not written.
+
+    Exit status 1 if any PDF is already in the workbook.
+    """
+    cache = open_cache(args)
+    duplicates = load_ingested(args.workbook) if args.workbook else None
+    mode = extraction_mode(args.engine, args.samples)
+    found = 0
+    try:
+        for pdf_path in args.pdfs:
+            if not os.path.isfile(pdf_path):
+                print(f"missing  {pdf_path}")
+                continue
+            digest = file_digest(pdf_path)
+            cached = cache is not None and cache.contains(digest, mode)
+            status, detail = "new", ""
+            if duplicates is not None:
+                ingested_as = duplicates.ingested_as(digest)
+                if ingested_as is not None:
+                    status, detail = "ingested", f"as {ingested_as}"
+                elif cached:
+                    references = [lab_reference_number for mold_dict, lab_reference_number in cache.get(digest, mode)]
+                    present = [reference for reference in references if duplicates.column_of(reference) is not None]
+                    if present:
+                        status, detail = "ingested", "lab reference " + ", ".join(present)
+            found += status == "ingested"
+            print(f"{status:<8} {pdf_path} {'cached' if cached else 'not cached'} {detail}".rstrip())
+    finally:
+        if cache is not None:
+            cache.close()
+    return 1 if found else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m cli", description="Headless PDF to Excel commands with fast startup.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    cache_options = argparse.ArgumentParser(add_help=False)
+    cache_options.add_argument("--engine", choices=ENGINES, default="tables", help="PDF extraction engine (default: tables)")
+    cache_options.add_argument("--samples", choices=SAMPLES, default="outdoor", help="Which sample columns of each report to use (default: outdoor)")
+    cache_options.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Extraction cache database (default: %(default)s)")
+    cache_options.add_argument("--no-cache", action="store_true", help="Do not use the extraction cache")
+    extract_parser = subparsers.add_parser("extract", parents=[cache_options], help="Print the samples of PDFs as JSON lines")
+    extract_parser.add_argument("pdfs", nargs="+", help="PDF files")
+    insert_parser = subparsers.add_parser("insert", parents=[cache_options], help="Insert PDFs into a workbook")
+    insert_parser.add_argument("pdfs", nargs="+", help="PDF files, directories or glob patterns")
+    insert_parser.add_argument("-w", "--workbook", required=True, help="Excel workbook to update")
+    insert_parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES, default="skip", help="Reports already in the workbook (default: skip)")
+    insert_parser.add_argument("--stats", choices=STATS_MODES, help="Write the statistics as values or as Excel formulas (default: whatever the workbook uses)")
+    stats_parser = subparsers.add_parser("stats", help="Recompute or verify the statistic columns of a workbook")
+    stats_parser.add_argument("-w", "--workbook", required=True, help="Excel workbook")
+    stats_parser.add_argument("--mode", choices=STATS_MODES, help="Write the statistics as values or as Excel formulas (default: whatever the workbook uses)")
+    stats_parser.add_argument("--verify", action="store_true", help="Only list statistics that are out of date")
+    check_parser = subparsers.add_parser("check", parents=[cache_options], help="Show whether PDFs are cached and already in a workbook")
+    check_parser.add_argument("pdfs", nargs="+", help="PDF files")
+    check_parser.add_argument("-w", "--workbook", help="Excel workbook to check for duplicates")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    commands = {"extract": run_extract, "insert": run_insert, "stats": run_stats, "check": run_check}
+    return commands[args.command](args)
+
+if __name__ == "__main__":
+    sys.exit(main())
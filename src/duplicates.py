@@ -0,0 +1,79 @@
+import datetime
+import os
+from spore_index import find_total_count_index
+
+#CONSTANTS
+DUPLICATE_POLICIES = ("skip", "replace", "error")
+INGESTED_SHEET = "_ingested"  # Hidden sheet listing the content hash of every PDF inserted into the workbook
+INGESTED_HEADERS = ["digest", "lab_reference_numbers", "pdf_name", "ingested_at"]
+
+def reference_key(lab_reference_number):
+    """Returns the form lab reference numbers are compared in, so 'M318047 ' and 'M318047' are the same report."""
+    return str(lab_reference_number).strip().casefold()
+
+class DuplicateIndex:
+    """
+    Lab reference numbers already in row 3 of the sheet and content hashes of PDFs already inserted,
+    so a report can be checked before any insert work.
+
+    The hashes are kept in a hidden sheet of the workbook, so they are saved and moved with it.
+    Sample columns never move once written, which keeps the reference -> column map valid while
+    a batch inserts more reports.
+    """
+
+    def __init__(self, workbook, sheet=None):
+        self.workbook = workbook
+        self.sheet = sheet if sheet is not None else workbook.active
+        self.columns = {}
+        header_row = list(self.sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+        for col in range(2, find_total_count_index(self.sheet) + 1):
+            header = header_row[col - 1]
+            if header is not None and str(header).strip():
+                self.columns.setdefault(reference_key(header), col)
+        self.digests = {}
+        if INGESTED_SHEET in workbook.sheetnames:
+            self.ingested = workbook[INGESTED_SHEET]
+            for digest, lab_reference_numbers, *rest in self.ingested.iter_rows(min_row=2, values_only=True):
+                if digest:
+                    self.digests[digest] = lab_reference_numbers or ""
+        else:
+            self.ingested = None
+
+    def column_of(self, lab_reference_number):
+        """Returns the 1-based column already holding this lab reference number, or None."""
+        if lab_reference_number is None:
+            return None
+        return self.columns.get(reference_key(lab_reference_number))
+
+    def ingested_as(self, digest):
+        """Returns the lab reference numbers a PDF with this hash was inserted as, or None if it is new."""
+        return self.digests.get(digest)
+
+    def add_columns(self, sample_slots, lab_reference_numbers):
+        """Records newly written sample columns."""
+        for col, lab_reference_number in zip(sample_slots, lab_reference_numbers):
+            self.columns.setdefault(reference_key(lab_reference_number), col)
+        return
+
+    def record(self, digest, lab_reference_numbers, pdf_path):
+        """
+        Records an inserted PDF in the hidden sheet, creating the sheet the first time.
+
+        Args:
+            digest (str): SHA-256 hex digest of the PDF.
+            lab_reference_numbers (str): The lab reference numbers it was inserted as.
+            pdf_path (str): Path of the PDF.
+
+        Returns:
+            None
+        """
+        if self.digests.get(digest) == lab_reference_numbers:
+            return
+        if self.ingested is None:
+            self.ingested = self.workbook.create_sheet(INGESTED_SHEET)
+            self.ingested.sheet_state = "hidden"
+            self.ingested.append(INGESTED_HEADERS)
+        ingested_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self.ingested.append([digest, lab_reference_numbers, os.path.basename(pdf_path), ingested_at])
+        self.digests[digest] = lab_reference_numbers
+        return
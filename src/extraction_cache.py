@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from metrics import instrumented, extracted_cells
+
+#CONSTANTS
+EXTRACTOR_VERSION = "2"  # Bump whenever find_mold_values can return different results for the same PDF
+DEFAULT_CACHE_PATH = os.environ.get(
+    "PDF_TO_EXCEL_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "pdf-to-excel", "extractions.sqlite3"),
+)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CACHE_SCHEMA_VERSION = 2  # Stored in PRAGMA user_version, older cache files are rebuilt
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+def file_digest(pdf_path):
+    """
+    Returns the SHA-256 hex digest of a file's bytes.
+
+    Args:
+        pdf_path (str): Path to the file.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    # Read in chunks rather than with hashlib.file_digest, which needs Python 3.11
+    with open(pdf_path, "rb") as pdf_file:
+        for chunk in iter(lambda: pdf_file.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """
+    On-disk cache of extract_report results keyed by PDF content hash, extractor version and extraction mode.
+
+    Entries are evicted least recently used first once the stored results exceed max_bytes, and
+    entries written by other extractor versions are dropped first. Hit and miss counts are kept
+    in the database so they add up across runs. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, version=EXTRACTOR_VERSION):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != CACHE_SCHEMA_VERSION:
+                self.connection.execute("DROP TABLE IF EXISTS extractions")
+                self.connection.execute("DROP TABLE IF EXISTS counters")
+                self.connection.execute(f"PRAGMA user_version = {CACHE_SCHEMA_VERSION}")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                " digest TEXT NOT NULL, version TEXT NOT NULL, matches_json TEXT NOT NULL,"
+                " size INTEGER NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (digest, version))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def _count(self, name):
+        self.connection.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def _key_version(self, mode):
+        return f"{self.version}/{mode}"
+
+    def get(self, digest, mode):
+        """
+        Looks up a cached extraction.
+
+        Args:
+            digest (str): SHA-256 hex digest of the PDF.
+            mode (str): The extraction mode the result must come from, see extraction_mode.
+
+        Returns:
+            list: (mold_dict, lab_reference_number) pairs as extract_report returned them, or None on a miss.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT matches_json FROM extractions WHERE digest = ? AND version = ?",
+                (digest, self._key_version(mode)),
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            self._count("hits")
+            self.connection.execute(
+                "UPDATE extractions SET last_used = ? WHERE digest = ? AND version = ?",
+                (time.time(), digest, self._key_version(mode)),
+            )
+        return [tuple(match) for match in json.loads(row[0])]
+
+    def put(self, digest, matches, mode):
+        """
+        Stores an extraction result and evicts old entries if the cache is over its size limit.
+
+        Args:
+            digest (str): SHA-256 hex digest of the PDF.
+            matches (list): (mold_dict, lab_reference_number) pairs as returned by extract_report.
+            mode (str): The extraction mode that produced the result, see extraction_mode.
+
+        Returns:
+            None
+        """
+        matches_json = json.dumps([list(match) for match in matches], ensure_ascii=False)
+        size = len(digest) + len(matches_json)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO extractions (digest, version, matches_json, size, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (digest, self._key_version(mode), matches_json, size, time.time()),
+            )
+            self._evict()
+        return
+
+    def _evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        prefix = self._key_version("")
+        self.connection.execute("DELETE FROM extractions WHERE substr(version, 1, ?) != ?", (len(prefix), prefix))
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        rows = self.connection.execute("SELECT rowid, size FROM extractions ORDER BY last_used").fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        self.connection.executemany("DELETE FROM extractions WHERE rowid = ?", evicted)
+        if evicted:
+            self.connection.execute(
+                "INSERT INTO counters (name, value) VALUES ('evictions', ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (len(evicted),),
+            )
+
+    def contains(self, digest, mode):
+        """Returns True if an extraction is cached, without counting a hit or miss."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM extractions WHERE digest = ? AND version = ?",
+                (digest, self._key_version(mode)),
+            ).fetchone()
+        return row is not None
+
+    def stats(self):
+        """
+        Returns cache usage and the hit/miss counters accumulated across runs.
+
+        Returns:
+            dict: entries, size_bytes, max_bytes, hits, misses and evictions.
+        """
+        with self.lock:
+            entries, size = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions"
+            ).fetchone()
+            counters = dict(self.connection.execute("SELECT name, value FROM counters").fetchall())
+        return {
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+        }
+
+    def clear(self):
+        """Removes every cached extraction and resets the counters."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM extractions")
+            self.connection.execute("DELETE FROM counters")
+        return
+
+def extraction_mode(engine="tables", samples="outdoor"):
+    """Returns the cache key part for an extract_report engine and sample selection, e.g. 'tables-outdoor'."""
+    return f"{engine}-{samples}"
+
+@instrumented("extract", cells=extracted_cells)
+def cached_extract_report(pdf_path, cache, engine="tables", samples="outdoor"):
+    """
+    Returns the extract_report result for a PDF, parsing it only when the cache has no entry.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        cache (ExtractionCache): The cache to read from and fill.
+        engine (str, optional): The find_mold_values engine to use.
+        samples (str, optional): "outdoor", "indoor" or "all" sample columns.
+
+    Returns:
+        list: (mold_dict, lab_reference_number) for each selected sample column in the PDF.
+    """
+    digest = file_digest(pdf_path)
+    mode = extraction_mode(engine, samples)
+    matches = cache.get(digest, mode)
+    if matches is None:
+        # Imported here so cache hits never load pdfplumber
+        from mold_processing import extract_report
+        matches = extract_report(pdf_path, engine, samples)
+        cache.put(digest, matches, mode)
+    return matches
@@ -0,0 +1,298 @@
+import io
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout, wait
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from pipeline import terminate_executor
+
+#CONSTANTS
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_LIMIT = 16  # requests allowed to wait for a free worker before new ones get 503
+DEFAULT_REQUEST_TIMEOUT = 60.0  # seconds one extraction may take before the request gets 504
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+LATENCY_WINDOW = 1000  # most recent requests the latency figures are taken over
+ENGINES = ("tables", "words")  # mold_processing.EXTRACTION_ENGINES, kept out of the server process
+
+def warm_worker():
+    """Process pool initializer: pays the pdfplumber import once per worker instead of once per request."""
+    import mold_processing  # noqa: F401
+
+def extract_upload(data, engine="tables"):
+    """
+    Runs find_mold_values on an uploaded PDF in a worker process.
+
+    Errors are returned as text rather than raised, since pdfminer exceptions do not always survive pickling.
+
+    Args:
+        data (bytes): The PDF file.
+        engine (str, optional): The find_mold_values engine to use.
+
+    Returns:
+        tuple: ((mold_dict, lab_reference_number), error) where error is a message or None.
+    """
+    from mold_processing import find_mold_values
+    try:
+        return find_mold_values(io.BytesIO(data), engine), None
+    except Exception as e:
+        return None, f"Failed to read PDF: {e}"
+
+class QueueFull(Exception):
+    pass
+
+class ExtractionService:
+    """
+    A warm process pool serving find_mold_values to concurrent requests.
+
+    At most workers + queue_limit requests are admitted at a time, the rest are turned away at
+    once so a burst cannot pile up unbounded work. Admitted requests wait for one of `workers`
+    slots before their PDF is submitted, so the pool never holds a queue of its own and the timeout
+    only runs while the extraction does. An extraction running past it has its pool killed and
+    replaced, as ExtractionPipeline does, so a PDF that hangs pdfminer cannot hold a worker
+    forever. Requests that were running on the killed pool are told to retry.
+    """
+
+    def __init__(self, workers=None, queue_limit=DEFAULT_QUEUE_LIMIT, timeout=DEFAULT_REQUEST_TIMEOUT):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.workers)
+        self.executor = None
+        self.admitted = 0
+        self.running = 0
+        self.peak_admitted = 0
+        self.started_at = time.time()
+        self.counts = {"requests": 0, "ok": 0, "not_found": 0, "failed": 0, "rejected": 0, "timeouts": 0, "restarts": 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.queue_waits = deque(maxlen=LATENCY_WINDOW)
+
+    def new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+
+    def start(self):
+        """Starts the pool and waits until every worker has imported the extractor."""
+        self.executor = self.new_pool()
+        # Workers are spawned on demand, so keep them all busy at once to fork the full pool now
+        wait([self.executor.submit(time.sleep, 0.2) for _ in range(self.workers)])
+        return self
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def restart(self, broken):
+        """Replaces a pool that hung or crashed, unless another request already did."""
+        with self.lock:
+            if self.executor is not broken:
+                return
+            # A replacement pool warms each worker as it spawns, with no warm-up task in the way of requests
+            self.executor = self.new_pool()
+            self.counts["restarts"] += 1
+        terminate_executor(broken)
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def extract(self, data, engine="tables"):
+        """
+        Extracts one uploaded PDF on the pool.
+
+        Args:
+            data (bytes): The PDF file.
+            engine (str, optional): The find_mold_values engine to use.
+
+        Returns:
+            tuple: (mold_dict, lab_reference_number), (None, None) if there is no 'Outdoor' section.
+
+        Raises:
+            QueueFull: If workers + queue_limit requests are already admitted.
+            TimeoutError: If the extraction ran past the timeout.
+            ValueError: If the PDF could not be read.
+            RuntimeError: If the pool was restarted while the request was running.
+        """
+        with self.lock:
+            self.counts["requests"] += 1
+            if self.admitted >= self.workers + self.queue_limit:
+                self.counts["rejected"] += 1
+                raise QueueFull(f"{self.admitted} requests already in progress or queued.")
+            self.admitted += 1
+            self.peak_admitted = max(self.peak_admitted, self.admitted)
+        started = time.perf_counter()
+        try:
+            # Waiting for a free worker is bounded by the admission limit, not by the timeout
+            with self.slots:
+                with self.lock:
+                    self.running += 1
+                    self.queue_waits.append(time.perf_counter() - started)
+                    executor = self.executor
+                try:
+                    return self.run(executor, data, engine)
+                finally:
+                    with self.lock:
+                        self.running -= 1
+        finally:
+            with self.lock:
+                self.admitted -= 1
+                self.latencies.append(time.perf_counter() - started)
+
+    def run(self, executor, data, engine):
+        """Runs one extraction on a worker this request holds a slot for, see extract."""
+        if executor is None:
+            raise RuntimeError("The service is shutting down.")
+        future = executor.submit(extract_upload, data, engine)
+        try:
+            result, error = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.count("timeouts")
+            self.restart(executor)
+            raise TimeoutError(f"Extraction took longer than {self.timeout:g} seconds.")
+        except BrokenProcessPool:
+            self.count("failed")
+            self.restart(executor)
+            raise RuntimeError("The extraction worker stopped, please retry.")
+        if error is not None:
+            self.count("failed")
+            raise ValueError(error)
+        self.count("ok" if result[0] is not None else "not_found")
+        return result
+
+    def metrics(self):
+        """Returns the request counters, current concurrency and latency figures."""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            queue_waits = sorted(self.queue_waits)
+            metrics = {
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "timeout_s": self.timeout,
+                "in_progress": self.running,
+                "queued": self.admitted - self.running,
+                "peak_concurrency": self.peak_admitted,
+                **self.counts,
+            }
+        if latencies:
+            metrics["latency_ms"] = percentiles_ms(latencies)
+        if queue_waits:
+            metrics["queue_wait_ms"] = percentiles_ms(queue_waits)
+        return metrics
+
+def percentiles_ms(durations):
+    """Mean, p50, p95 and max of sorted durations in seconds, as milliseconds."""
+    return {
+        "mean": round(statistics.fmean(durations) * 1000, 1),
+        "p50": round(durations[len(durations) // 2] * 1000, 1),
+        "p95": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 1),
+        "max": round(durations[-1] * 1000, 1),
+    }
+
+class ExtractionRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /extract with the PDF as the request body returns its 'Outdoor' counts as JSON.
+    GET /metrics returns ExtractionService.metrics and GET /health returns {"status": "ok"}.
+    """
+    server_version = "pdf-to-excel-extraction/1"
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self.send_json(HTTPStatus.OK, {"status": "ok"})
+        elif path == "/metrics":
+            self.send_json(HTTPStatus.OK, self.server.service.metrics())
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path '{path}'."})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/extract":
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path '{url.path}'."})
+            return
+        engine = parse_qs(url.query).get("engine", ["tables"])[0]
+        if engine not in ENGINES:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": f"Unknown extraction engine '{engine}', expected one of {ENGINES}."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            self.send_json(HTTPStatus.LENGTH_REQUIRED, {"error": "Send the PDF as the request body with a Content-Length."})
+            return
+        if length < 0:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": f"Invalid Content-Length {length}."})
+            self.close_connection = True
+            return
+        if length > MAX_UPLOAD_BYTES:
+            self.send_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": f"PDFs over {MAX_UPLOAD_BYTES} bytes are not accepted."})
+            self.close_connection = True
+            return
+        data = self.rfile.read(length)
+        started = time.perf_counter()
+        try:
+            mold_dict, lab_reference_number = self.server.service.extract(data, engine)
+        except QueueFull as e:
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": f"Too many requests: {e}"}, {"Retry-After": "1"})
+            return
+        except TimeoutError as e:
+            self.send_json(HTTPStatus.GATEWAY_TIMEOUT, {"error": str(e)})
+            return
+        except RuntimeError as e:
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(e)}, {"Retry-After": "1"})
+            return
+        except ValueError as e:
+            self.send_json(HTTPStatus.UNPROCESSABLE_ENTITY, {"error": str(e)})
+            return
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        if mold_dict is None:
+            self.send_json(HTTPStatus.UNPROCESSABLE_ENTITY, {"error": "No 'Outdoor' section found in the PDF.", "elapsed_ms": elapsed_ms})
+            return
+        self.send_json(HTTPStatus.OK, {"lab_reference_number": lab_reference_number, "counts": mold_dict, "elapsed_ms": elapsed_ms})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, queue_limit=DEFAULT_QUEUE_LIMIT, timeout=DEFAULT_REQUEST_TIMEOUT, quiet=False):
+    """
+    Starts the worker pool and binds the HTTP server, without serving yet.
+
+    Args:
+        host (str, optional): Interface to listen on. Keep the default to stay local to this machine.
+        port (int, optional): Port to listen on, 0 for any free port.
+        workers (int, optional): Extraction processes, defaults to the number of CPUs.
+        queue_limit (int, optional): Requests that may wait for a free worker.
+        timeout (float, optional): Seconds one extraction may take.
+        quiet (bool, optional): Do not log every request.
+
+    Returns:
+        ThreadingHTTPServer: Call serve_forever(), and server_close() plus service.close() when done.
+    """
+    service = ExtractionService(workers, queue_limit, timeout).start()
+    try:
+        server = ThreadingHTTPServer((host, port), ExtractionRequestHandler)
+    except OSError:
+        service.close()
+        raise
+    server.daemon_threads = True
+    server.service = service
+    server.quiet = quiet
+    return server
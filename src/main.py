@@ -1,72 +1,510 @@
+import argparse
+import os
+import queue
+import signal
+import sys
+import threading
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from openpyxl import load_workbook
-from mold_processing import (
-    find_mold_values, insert_into_excel, total_count, mean_count, stdv_count,
-    display_mold_type_frequency, find_min, fifth_percentile, find_median,
-    find_ninety_fifth_percentile, find_max, find_count, clear_old_stats
+from mold_processing import find_all_mold_values, update_statistics, EXTRACTION_ENGINES, SAMPLE_SELECTIONS, STATISTICS_MODES, MEMORY_LIMIT_ENV
+from pipeline import DEFAULT_TIMEOUT
+from extraction_cache import ExtractionCache, DEFAULT_CACHE_PATH, file_digest
+from running_stats import RunningStatistics, default_state_path, update_statistics_incrementally, verify_statistics
+from spore_index import load_aliases, DEFAULT_ALIAS_PATH
+from duplicates import DuplicateIndex, DUPLICATE_POLICIES
+from xlsx_patch import patch_report, PatchNotPossible
+from metrics import recording, profiling, measure, record_file, workbook_cells, METRICS_ENV, PROFILE_ENV
+from sample_store import SampleStore, render_workbook, write_statistics_csv, DEFAULT_STORE_PATH
+from archive_query import collect_workbook_paths, query_archive, write_summary_workbook
+from extraction_service import make_server, DEFAULT_HOST, DEFAULT_PORT, DEFAULT_QUEUE_LIMIT, DEFAULT_REQUEST_TIMEOUT
+from watch_folder import WatchService, DEFAULT_DEBOUNCE, DEFAULT_MAX_DELAY, DEFAULT_POLL_INTERVAL
+from batch import (
+    collect_pdf_paths, extract_sequentially, process_batch, insert_report, make_result, check_cancelled, default_summary_path, BatchCancelled, StageTimer,
+    STATUS_SUCCESS, STATUS_SKIPPED, STATUS_ERROR
 )
 
-def show_progress(root, message="Processing..."):
-    progress_win = tk.Toplevel(root)
-    progress_win.title("Please wait")
-    progress_win.geometry("300x80")
-    progress_win.resizable(False, False)
-    label = tk.Label(progress_win, text=message, padx=20, pady=20)
-    label.pack(expand=True)
-    progress_win.protocol("WM_DELETE_WINDOW", lambda: None)
-    progress_win.update()
-    return progress_win
+#CONSTANTS
+EVENT_POLL_MS = 100  # how often the GUI picks up progress from the worker thread
+STAGES = ("load", "extract", "insert", "stats", "save")
+MAX_MESSAGE_LINES = 15
+
+class ProgressWindow:
+    """
+    Progress dialog for a workbook update running on a worker thread.
+
+    Tk widgets may only be used from the main thread, so the worker only puts events on a queue
+    (through report and finish) and the dialog drains it every EVENT_POLL_MS. Cancel asks the
+    worker to stop before it saves anything.
+    """
+
+    def __init__(self, root, pdf_paths, excel_path):
+        self.root = root
+        self.pdf_paths = pdf_paths
+        self.excel_path = excel_path
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.seconds = {}
+        self.window = tk.Toplevel(root)
+        self.window.title("Please wait")
+        self.window.resizable(False, False)
+        first_step = "Extracting report 1 of 1..." if len(pdf_paths) == 1 else "Loading the workbook..."
+        self.label = tk.Label(self.window, text=first_step, width=45, anchor="w", padx=20, pady=10)
+        self.label.pack()
+        # Every report counts once it is inserted, the statistics and the save count once each
+        self.bar = ttk.Progressbar(self.window, mode="determinate", length=320, maximum=len(pdf_paths) + 2)
+        self.bar.pack(padx=20)
+        self.cancel_button = tk.Button(self.window, text="Cancel", width=10, command=self.cancel)
+        self.cancel_button.pack(pady=10)
+        self.window.protocol("WM_DELETE_WINDOW", self.cancel)
+
+    def report(self, stage, done, total, seconds):
+        """Progress callback for the worker thread, see StageTimer."""
+        self.events.put(("progress", stage, done, total, seconds))
+
+    def finish(self, outcome, value=None):
+        """Called once by the worker thread with 'done' and the results, 'cancelled', or 'error' and a message."""
+        self.events.put((outcome, value))
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state="disabled")
+        self.label.config(text="Cancelling...")
+
+    def poll(self):
+        """Applies the queued events on the main thread and schedules itself again until the worker finishes."""
+        try:
+            while True:
+                event = self.events.get_nowait()
+                if event[0] == "progress":
+                    self.show_progress(*event[1:])
+                else:
+                    self.window.destroy()
+                    show_outcome(self.excel_path, event[0], event[1], self.seconds)
+                    self.root.quit()
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(EVENT_POLL_MS, self.poll)
+
+    def show_progress(self, stage, done, total, seconds):
+        self.seconds[stage] = seconds
+        count = len(self.pdf_paths)
+        if stage == "insert":
+            self.bar.config(value=done)
+        elif stage in ("stats", "save"):
+            self.bar.config(value=count + (1 if stage == "stats" else 2))
+        if self.cancel_event.is_set():
+            return
+        # The label names the step that starts now
+        if stage == "load" or stage == "insert" and done < count:
+            text = f"Extracting report {done + 1 if stage == 'insert' else 1} of {count}..."
+        elif stage == "extract":
+            text = f"Inserting report {done} of {count}..."
+        elif stage == "insert":
+            text = "Updating statistics..."
+        elif stage == "stats":
+            text = "Saving..."
+        else:
+            return
+        self.label.config(text=text)
+
 def main_gui():
     root = tk.Tk()
     root.withdraw()  # Hide the main window
 
-    pdf_path = filedialog.askopenfilename(title="Select PDF file", filetypes=[("PDF files", "*.pdf")])
-    if not pdf_path:
+    pdf_paths = filedialog.askopenfilenames(title="Select PDF files", filetypes=[("PDF files", "*.pdf")])
+    if not pdf_paths:
         return
 
     excel_path = filedialog.askopenfilename(title="Select Excel file", filetypes=[("Excel files", "*.xlsx")])
     if not excel_path:
         return
 
-    progress_win = show_progress(root, "Processing files, please wait...")
-    root.after(100, lambda: process_files(pdf_path, excel_path, progress_win, root))
+    progress = ProgressWindow(root, list(pdf_paths), excel_path)
+    worker = threading.Thread(target=process_files, args=(progress.pdf_paths, excel_path, progress), name="workbook-update", daemon=True)
+    worker.start()
+    root.after(EVENT_POLL_MS, progress.poll)
     root.mainloop()
 
-def process_files(pdf_path, excel_path, progress_win, root):
+def insert_with_openpyxl(pdf_path, excel_path, matches, digest, timer=None, cancel_event=None):
+    timer = timer or StageTimer()
+    with measure("load") as counters:
+        workbook = load_workbook(excel_path)
+        counters["cells"] = workbook_cells(workbook)
+    sheet = workbook.active
+    timer.done("load")
+    # Reports already in the workbook are skipped rather than added a second time
+    result = insert_report(sheet, pdf_path, matches, duplicates=DuplicateIndex(workbook, sheet), digest=digest)
+    timer.done("insert")
+    if result["status"] != STATUS_SUCCESS:
+        return result
+    # Only the new columns are read, the rest comes from the running statistics file
+    state_path = default_state_path(excel_path)
+    state = update_statistics_incrementally(sheet, state_path)
+    timer.done("stats")
+    check_cancelled(cancel_event)
+    with measure("save") as counters:
+        workbook.save(excel_path)
+        counters["cells"] = workbook_cells(workbook)
+    if state is not None:
+        state.save(state_path)
+    timer.done("save")
+    return result
+
+def insert_single_report(pdf_path, excel_path, progress=None, cancel_event=None):
+    """Inserts one PDF, patching the worksheet XML where possible. Returns its summary row."""
+    timer = StageTimer(progress)
+    matches = find_all_mold_values(pdf_path)
+    timer.done("extract")
+    if not matches:
+        return make_result(pdf_path, STATUS_SKIPPED, message="No 'Outdoor' section found in the PDF. No data to insert into Excel.")
+    digest = file_digest(pdf_path)
+    check_cancelled(cancel_event)
     try:
-        info = find_mold_values(pdf_path)
-        if info is not None:
-            mold_dict, lab_reference_number = info
-            try:
-                workbook = load_workbook(excel_path)
-                sheet = workbook.active
-                clear_old_stats(sheet)  # Clear previous stats before recalculating
-                insert_into_excel(mold_dict, sheet, lab_reference_number)
-                total_count(sheet)
-                mean_count(sheet)
-                stdv_count(sheet)
-                display_mold_type_frequency(sheet)
-                find_min(sheet)
-                fifth_percentile(sheet)
-                find_median(sheet)
-                find_ninety_fifth_percentile(sheet)
-                find_max(sheet)
-                find_count(sheet)
-                workbook.save(excel_path)
-                progress_win.destroy()
-                messagebox.showinfo("Success", f"Saved updated Excel file as '{excel_path}'")
-            except PermissionError:
-                progress_win.destroy()
-                messagebox.showerror("Error", f"Permission denied: Unable to save to '{excel_path}'. Please close the file if it is open.")
-            except Exception as e:
-                progress_win.destroy()
-                messagebox.showerror("Error", f"An error occurred while processing the Excel file: {e}")
-        else:
-            progress_win.destroy()
-            messagebox.showerror("Error", "No 'Outdoor' section found in the PDF. No data to insert into Excel.")
+        # Patching the sheet XML avoids loading and saving the whole workbook
+        with measure("save"):
+            result = patch_report(excel_path, pdf_path, matches, digest, state_path=default_state_path(excel_path))
+        # The patch inserts, updates the statistics and saves in one pass
+        timer.done("save")
+        return result
+    except PatchNotPossible:
+        return insert_with_openpyxl(pdf_path, excel_path, matches, digest, timer, cancel_event)
+
+def process_files(pdf_paths, excel_path, progress):
+    """
+    Runs on the worker thread: inserts the PDFs into the workbook with a single update and hands
+    the outcome to the progress window.
+
+    Args:
+        pdf_paths (list): Paths of the selected PDFs.
+        excel_path (str): Path of the tracking workbook.
+        progress (ProgressWindow): Receives the progress events and the outcome.
+
+    Returns:
+        None
+    """
+    try:
+        # The GUI has no options, so metrics and profiles are only switched on through the environment
+        with recording(os.environ.get(METRICS_ENV), "gui"), profiling(os.environ.get(PROFILE_ENV)):
+            if len(pdf_paths) == 1:
+                results = [insert_single_report(pdf_paths[0], excel_path, progress.report, progress.cancel_event)]
+                record_file(pdf_paths[0], results[0])
+            else:
+                results = process_batch(pdf_paths, excel_path, state_path=default_state_path(excel_path), progress=progress.report, cancel_event=progress.cancel_event)
+        progress.finish("done", results)
+    except BatchCancelled:
+        progress.finish("cancelled")
+    except PermissionError:
+        progress.finish("error", f"Permission denied: Unable to save to '{excel_path}'. Please close the file if it is open.")
+    except Exception as e:
+        progress.finish("error", f"An error occurred while processing the Excel file: {e}")
+
+def format_timings(seconds):
+    """Returns e.g. 'extract 1.2 s, insert 0.3 s, stats 0.1 s, save 0.4 s' for the stages that ran."""
+    return ", ".join(f"{stage} {seconds[stage]:.1f} s" for stage in STAGES if stage in seconds)
+
+def show_outcome(excel_path, outcome, value, seconds):
+    if outcome == "cancelled":
+        messagebox.showinfo("Cancelled", f"Nothing was saved to '{excel_path}'.")
+        return
+    if outcome == "error":
+        messagebox.showerror("Error", value)
+        return
+    results = value
+    if len(results) == 1:
+        lines = [results[0]["message"].replace("; ", "\n")] if results[0]["message"] else []
+    else:
+        lines = [f"{os.path.basename(r['pdf_path'])}: {r['status']} {r['message']}".rstrip() for r in results if r["status"] != STATUS_SUCCESS or r["message"]]
+        if len(lines) > MAX_MESSAGE_LINES:
+            lines = lines[:MAX_MESSAGE_LINES] + [f"... and {len(lines) - MAX_MESSAGE_LINES} more, see '{default_summary_path(excel_path)}'"]
+    inserted = sum(1 for r in results if r["status"] == STATUS_SUCCESS)
+    if not inserted:
+        messagebox.showerror("Error", "\n\n".join([f"Nothing was inserted into '{excel_path}'."] + lines))
+        return
+    message = f"Saved updated Excel file as '{excel_path}'"
+    if len(results) > 1:
+        message += f"\n{inserted} of {len(results)} PDFs inserted."
+    if lines:
+        message += "\n\n" + "\n".join(lines)
+    message += "\n\nTime taken: " + format_timings(seconds)
+    messagebox.showinfo("Success", message)
+
+def run_batch(args):
+    pdf_paths = collect_pdf_paths(args.pdfs)
+    if not pdf_paths:
+        print("No PDF files found.")
+        return 1
+    summary_path = args.summary or default_summary_path(args.workbook)
+    cache = None if args.no_cache else ExtractionCache(args.cache)
+    try:
+        results = process_batch(pdf_paths, args.workbook, summary_path, workers=args.workers, timeout=args.timeout, cache=cache, engine=args.engine, samples=args.samples,
+                                state_path=default_state_path(args.workbook) if args.incremental else None, alias_path=args.aliases, duplicate_policy=args.duplicates, stats_mode=args.stats)
+    except PermissionError:
+        print(f"Permission denied: Unable to save to '{args.workbook}'. Please close the file if it is open.")
+        return 1
+    finally:
+        if cache is not None:
+            cache.close()
+    for result in results:
+        print(f"{result['status']:<8} {result['pdf_path']} {result['message']}".rstrip())
+    counts = {status: sum(1 for r in results if r["status"] == status) for status in (STATUS_SUCCESS, STATUS_SKIPPED, STATUS_ERROR)}
+    print(f"{counts[STATUS_SUCCESS]} inserted, {counts[STATUS_SKIPPED]} skipped, {counts[STATUS_ERROR]} failed. Summary written to '{summary_path}'")
+    return 1 if counts[STATUS_ERROR] else 0
+
+def run_watch(args):
+    cache = None if args.no_cache else ExtractionCache(args.cache)
+    service = WatchService(args.inbox, args.workbook, outcome_root=args.outcome_root, status_path=args.status, debounce=args.debounce, max_delay=args.max_delay,
+                           poll_interval=args.poll_interval, polling=args.poll, cache=cache, engine=args.engine, samples=args.samples, alias_path=args.aliases,
+                           duplicate_policy=args.duplicates, stats_mode=args.stats, state_path=default_state_path(args.workbook) if args.incremental else None)
+    # Ctrl+C and service managers stop the service, which saves what is pending first
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: service.stop())
+    if not args.once:
+        print(f"Watching '{service.inbox}' for PDFs, status in '{service.status_path}'. Press Ctrl+C to stop.")
+    try:
+        counts = service.run(once=args.once)
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"{counts[STATUS_SUCCESS]} inserted, {counts[STATUS_SKIPPED]} skipped, {counts[STATUS_ERROR]} failed.")
+    return 1 if counts[STATUS_ERROR] else 0
+
+def run_serve(args):
+    server = make_server(args.host, args.port, args.workers, args.queue_limit, args.timeout, quiet=args.quiet)
+    # shutdown() waits for serve_forever to return, so it cannot run on the thread serving
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    host, port = server.server_address[:2]
+    print(f"Serving extractions on http://{host}:{port} with {server.service.workers} workers. Press Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.service.close()
+    metrics = server.service.metrics()
+    print(f"{metrics['ok']} extracted, {metrics['not_found'] + metrics['failed']} failed, {metrics['rejected']} rejected, {metrics['timeouts']} timed out.")
+    return 0
+
+def run_store_add(args):
+    pdf_paths = collect_pdf_paths(args.pdfs)
+    if not pdf_paths:
+        print("No PDF files found.")
+        return 1
+    cache = None if args.no_cache else ExtractionCache(args.cache)
+    failed = 0
+    try:
+        with SampleStore(args.store, load_aliases(args.aliases)) as store:
+            for pdf_path, matches, error in extract_sequentially(pdf_paths, cache, args.engine, args.samples):
+                if error is not None:
+                    failed += 1
+                    print(f"{STATUS_ERROR:<8} {pdf_path} {error}")
+                    continue
+                added, skipped = store.add_report(matches, file_digest(pdf_path), os.path.basename(pdf_path))
+                status = STATUS_SUCCESS if added else STATUS_SKIPPED
+                message = f"Already in the store: {', '.join(skipped)}" if skipped else ""
+                print(f"{status:<8} {pdf_path} {message}".rstrip())
     finally:
-        root.quit()
+        if cache is not None:
+            cache.close()
+    return 1 if failed else 0
+
+def run_store_import(args):
+    workbook = load_workbook(args.workbook)
+    with SampleStore(args.store, load_aliases(args.aliases)) as store:
+        added, skipped = store.import_workbook(workbook.active)
+    print(f"{len(added)} samples imported into '{args.store}', {len(skipped)} already there.")
+    return 0
+
+def run_store_render(args):
+    with SampleStore(args.store, load_aliases(args.aliases)) as store:
+        try:
+            added, unmatched = render_workbook(store, args.workbook, args.template, args.stats)
+        except PermissionError:
+            print(f"Permission denied: Unable to save to '{args.workbook}'. Please close the file if it is open.")
+            return 1
+    print(f"{len(added)} samples added to '{args.workbook}'.")
+    if unmatched:
+        print("Unmatched spore types: " + ", ".join(unmatched))
+    return 0
+
+def run_store_stats(args):
+    with SampleStore(args.store, load_aliases(args.aliases)) as store:
+        labels, stats = store.statistics()
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as csv_file:
+            write_statistics_csv(labels, stats, csv_file)
+        print(f"Statistics for {len(labels)} spore types written to '{args.csv}'")
+    else:
+        write_statistics_csv(labels, stats, sys.stdout)
+    return 0
+
+def run_query(args):
+    workbook_paths = collect_workbook_paths(args.sources, exclude=[args.output])
+    if not workbook_paths:
+        print("No workbooks found.")
+        return 1
+    root = args.sources[0] if len(args.sources) == 1 else None
+    labels, groups, sources = query_archive(workbook_paths, root, args.by_site, load_aliases(args.aliases), args.workers)
+    for workbook_path, site, samples, duplicates, error in sources:
+        if error:
+            print(f"{STATUS_ERROR:<8} {workbook_path} {error}")
+    try:
+        write_summary_workbook(args.output, labels, groups, sources)
+    except PermissionError:
+        print(f"Permission denied: Unable to save to '{args.output}'. Please close the file if it is open.")
+        return 1
+    read = sum(1 for source in sources if not source[4])
+    print(f"{sum(source[2] for source in sources)} samples from {read} workbooks summarized in '{args.output}'.")
+    return 1 if read < len(sources) else 0
+
+def run_cache_stats(args):
+    with ExtractionCache(args.cache) as cache:
+        if args.clear:
+            cache.clear()
+            print(f"Cleared extraction cache '{args.cache}'")
+            return 0
+        stats = cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = (stats["hits"] / lookups) * 100 if lookups else 0
+    print(f"Cache:     {args.cache}")
+    print(f"Entries:   {stats['entries']} ({stats['size_bytes']} of {stats['max_bytes']} bytes)")
+    print(f"Hits:      {stats['hits']}")
+    print(f"Misses:    {stats['misses']}")
+    print(f"Hit rate:  {hit_rate:.1f}%")
+    print(f"Evictions: {stats['evictions']}")
+    return 0
+
+def run_verify_stats(args):
+    state_path = args.state or default_state_path(args.workbook)
+    workbook = load_workbook(args.workbook)
+    sheet = workbook.active
+    state = RunningStatistics.load(state_path)
+    drift = verify_statistics(sheet, state)
+    for source, row, spore_type, header, actual, expected in drift:
+        location = f"row {row} ({spore_type})" if spore_type is not None else f"row {row}"
+        print(f"{source:<6} {location} {header}: found {actual!r}, expected {expected!r}")
+    if state is None:
+        print(f"No running statistics found at '{state_path}', checked the sheet only.")
+    if args.rebuild:
+        state = RunningStatistics.from_sheet(sheet)
+        update_statistics(sheet, args.stats)
+        try:
+            workbook.save(args.workbook)
+        except PermissionError:
+            print(f"Permission denied: Unable to save to '{args.workbook}'. Please close the file if it is open.")
+            return 1
+        state.save(state_path)
+        print(f"Recomputed the statistics and rebuilt '{state_path}'")
+        return 0
+    print(f"{len(drift)} values drifted." if drift else "No drift found.")
+    return 1 if drift else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Extract mold counts from lab PDFs into the tracking workbook. Runs the GUI when no command is given.")
+    subparsers = parser.add_subparsers(dest="command")
+    instrumentation = argparse.ArgumentParser(add_help=False)
+    instrumentation.add_argument("--metrics", default=os.environ.get(METRICS_ENV), help=f"Append per-file and per-run stage metrics to this JSON lines file (or set {METRICS_ENV})")
+    instrumentation.add_argument("--profile", default=os.environ.get(PROFILE_ENV), help=f"Write a cProfile of the run to this pstats file (or set {PROFILE_ENV})")
+    instrumentation.add_argument("--memory-limit", type=float, metavar="MB", help=f"Fail a PDF whose extraction adds more than this much memory (or set {MEMORY_LIMIT_ENV})")
+    batch_parser = subparsers.add_parser("batch", parents=[instrumentation], help="Insert many PDFs into one workbook with a single load and save")
+    batch_parser.add_argument("pdfs", nargs="+", help="PDF files, directories or glob patterns")
+    batch_parser.add_argument("-w", "--workbook", required=True, help="Excel workbook to update")
+    batch_parser.add_argument("--summary", help="CSV file for the per-file summary (default: <workbook>_summary.csv)")
+    batch_parser.add_argument("-j", "--workers", type=int, default=1, help="Number of processes extracting PDFs in parallel (default: 1)")
+    batch_parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"Seconds allowed per PDF when using workers (default: {DEFAULT_TIMEOUT})")
+    batch_parser.add_argument("--engine", choices=EXTRACTION_ENGINES, default="tables", help="PDF extraction engine; 'words' reads the text layer and falls back to 'tables' (default: tables)")
+    batch_parser.add_argument("--samples", choices=SAMPLE_SELECTIONS, default="outdoor", help="Which sample columns of each report to insert (default: outdoor)")
+    batch_parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Extraction cache database (default: %(default)s)")
+    batch_parser.add_argument("--no-cache", action="store_true", help="Parse every PDF even if it was extracted before")
+    batch_parser.add_argument("--incremental", action="store_true", help="Update the statistics from a running statistics file next to the workbook instead of rescanning every sample")
+    batch_parser.add_argument("--aliases", default=DEFAULT_ALIAS_PATH, help="CSV table of spore type aliases (default: %(default)s)")
+    batch_parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES, default="skip", help="Reports already in the workbook: skip them, replace their columns in place, or fail them (default: skip)")
+    batch_parser.add_argument("--stats", choices=STATISTICS_MODES, help="Write the statistics as values or as Excel formulas (default: whatever the workbook uses)")
+    watch_parser = subparsers.add_parser("watch", parents=[instrumentation], help="Keep inserting PDFs dropped into an inbox folder, saving after each burst")
+    watch_parser.add_argument("inbox", help="Folder to watch for PDFs")
+    watch_parser.add_argument("-w", "--workbook", required=True, help="Excel workbook to update")
+    watch_parser.add_argument("--outcome-root", help="Folder holding the processed/, skipped/ and failed/ folders PDFs are moved to (default: the inbox)")
+    watch_parser.add_argument("--status", help="JSON status file (default: <workbook>_watch.json)")
+    watch_parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE, help="Seconds without a new report before saving (default: %(default)s)")
+    watch_parser.add_argument("--max-delay", type=float, default=DEFAULT_MAX_DELAY, help="Longest a report waits for a save while files keep arriving (default: %(default)s)")
+    watch_parser.add_argument("--poll", action="store_true", help="Poll the inbox instead of using inotify")
+    watch_parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between inbox scans when polling (default: %(default)s)")
+    watch_parser.add_argument("--once", action="store_true", help="Process the PDFs already in the inbox, save and exit")
+    watch_parser.add_argument("--engine", choices=EXTRACTION_ENGINES, default="tables", help="PDF extraction engine (default: tables)")
+    watch_parser.add_argument("--samples", choices=SAMPLE_SELECTIONS, default="outdoor", help="Which sample columns of each report to insert (default: outdoor)")
+    watch_parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Extraction cache database (default: %(default)s)")
+    watch_parser.add_argument("--no-cache", action="store_true", help="Parse every PDF even if it was extracted before")
+    watch_parser.add_argument("--incremental", action="store_true", help="Update the statistics from a running statistics file next to the workbook")
+    watch_parser.add_argument("--aliases", default=DEFAULT_ALIAS_PATH, help="CSV table of spore type aliases (default: %(default)s)")
+    watch_parser.add_argument("--duplicates", choices=DUPLICATE_POLICIES, default="skip", help="Reports already in the workbook: skip, replace or fail them (default: skip)")
+    watch_parser.add_argument("--stats", choices=STATISTICS_MODES, help="Write the statistics as values or as Excel formulas (default: whatever the workbook uses)")
+    store_options = argparse.ArgumentParser(add_help=False)
+    store_options.add_argument("--store", default=DEFAULT_STORE_PATH, help="Sample store database (default: %(default)s)")
+    store_options.add_argument("--aliases", default=DEFAULT_ALIAS_PATH, help="CSV table of spore type aliases (default: %(default)s)")
+    store_add_parser = subparsers.add_parser("store-add", parents=[store_options], help="Extract PDFs into the sample store")
+    store_add_parser.add_argument("pdfs", nargs="+", help="PDF files, directories or glob patterns")
+    store_add_parser.add_argument("--engine", choices=EXTRACTION_ENGINES, default="tables", help="PDF extraction engine (default: tables)")
+    store_add_parser.add_argument("--samples", choices=SAMPLE_SELECTIONS, default="outdoor", help="Which sample columns of each report to store (default: outdoor)")
+    store_add_parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Extraction cache database (default: %(default)s)")
+    store_add_parser.add_argument("--no-cache", action="store_true", help="Parse every PDF even if it was extracted before")
+    store_import_parser = subparsers.add_parser("store-import", parents=[store_options], help="Copy the samples of an existing workbook into the sample store")
+    store_import_parser.add_argument("-w", "--workbook", required=True, help="Excel workbook to import")
+    store_render_parser = subparsers.add_parser("store-render", parents=[store_options], help="Create or refresh a workbook from the sample store")
+    store_render_parser.add_argument("-w", "--workbook", required=True, help="Excel workbook to create or bring up to date")
+    store_render_parser.add_argument("--template", help="Workbook whose spore type rows a new workbook starts from, e.g. sample/Example.xlsx")
+    store_render_parser.add_argument("--stats", choices=STATISTICS_MODES, help="Write the statistics as values or as Excel formulas (default: whatever the workbook uses)")
+    store_stats_parser = subparsers.add_parser("store-stats", parents=[store_options], help="Compute the statistics from the sample store without a workbook")
+    store_stats_parser.add_argument("--csv", help="Write the statistics to this CSV file instead of the console")
+    query_parser = subparsers.add_parser("query", help="Compute the statistics across a directory of tracking workbooks")
+    query_parser.add_argument("sources", nargs="+", help="Workbooks, directories (searched recursively) or glob patterns")
+    query_parser.add_argument("-o", "--output", required=True, help="Summary workbook to write")
+    query_parser.add_argument("--by-site", action="store_true", help="Also compute the statistics of every workbook on its own")
+    query_parser.add_argument("-j", "--workers", type=int, help="Number of processes reading workbooks (default: one per CPU)")
+    query_parser.add_argument("--aliases", default=DEFAULT_ALIAS_PATH, help="CSV table of spore type aliases (default: %(default)s)")
+    serve_parser = subparsers.add_parser("serve", help="Serve PDF extraction over HTTP on this machine from a warm process pool")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to listen on (default: %(default)s)")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on, 0 for any free port (default: %(default)s)")
+    serve_parser.add_argument("-j", "--workers", type=int, help="Number of extraction processes kept running (default: one per CPU)")
+    serve_parser.add_argument("--queue-limit", type=int, default=DEFAULT_QUEUE_LIMIT, help="Requests that may wait for a free worker before new ones get 503 (default: %(default)s)")
+    serve_parser.add_argument("--timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT, help="Seconds allowed per PDF before the request gets 504 (default: %(default)s)")
+    serve_parser.add_argument("--quiet", action="store_true", help="Do not log every request")
+    cache_parser = subparsers.add_parser("cache-stats", help="Show extraction cache hit/miss counts")
+    cache_parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Extraction cache database (default: %(default)s)")
+    cache_parser.add_argument("--clear", action="store_true", help="Remove every cached extraction and reset the counters")
+    verify_parser = subparsers.add_parser("verify-stats", help="Recompute the statistics from scratch and report any drift")
+    verify_parser.add_argument("-w", "--workbook", required=True, help="Excel workbook to check")
+    verify_parser.add_argument("--state", help="Running statistics file (default: <workbook>_stats.json)")
+    verify_parser.add_argument("--rebuild", action="store_true", help="Rewrite the statistics and the running statistics file from scratch")
+    verify_parser.add_argument("--stats", choices=STATISTICS_MODES, help="With --rebuild, switch the statistics to values or Excel formulas")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command in ("batch", "watch"):
+        if args.memory_limit:
+            # Set in the environment so worker processes pick it up too
+            os.environ[MEMORY_LIMIT_ENV] = str(args.memory_limit)
+        with recording(args.metrics, args.command), profiling(args.profile):
+            return run_batch(args) if args.command == "batch" else run_watch(args)
+    if args.command == "store-add":
+        return run_store_add(args)
+    if args.command == "store-import":
+        return run_store_import(args)
+    if args.command == "store-render":
+        return run_store_render(args)
+    if args.command == "store-stats":
+        return run_store_stats(args)
+    if args.command == "query":
+        return run_query(args)
+    if args.command == "serve":
+        return run_serve(args)
+    if args.command == "cache-stats":
+        return run_cache_stats(args)
+    if args.command == "verify-stats":
+        return run_verify_stats(args)
+    main_gui()
+    return 0
 
 if __name__ == "__main__":
-    main_gui()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,238 @@
+import cProfile
+import datetime
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is left out there
+    resource = None
+
+#CONSTANTS
+METRICS_ENV = "PDF_TO_EXCEL_METRICS"  # JSON lines file run metrics are appended to
+PROFILE_ENV = "PDF_TO_EXCEL_PROFILE"  # pstats file a cProfile of the run is written to
+FILE_STAGES = ("extract", "insert")  # stages reported per PDF, the rest (load, stats, save) per run
+
+_active = None  # The MetricsRecorder of the run in progress, if metrics are being recorded
+
+def peak_rss_mb():
+    """Returns the highest resident memory of this process so far in MB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def current_rss_mb():
+    """Returns the resident memory of this process right now in MB, or None where it cannot be read (outside Linux)."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+def extracted_cells(args, result):
+    """Cell count for the metrics of the extraction functions: the mold values read."""
+    if isinstance(result, tuple):
+        return len(result[0] or {})
+    return sum(len(match[0]) for match in result)
+
+def workbook_cells(workbook):
+    """Returns the number of cells openpyxl holds for every sheet of a workbook."""
+    return sum(len(sheet._cells) for sheet in workbook.worksheets)
+
+class MetricsRecorder:
+    """
+    Adds up calls, wall time, CPU time and cells touched per stage and appends them to a JSON
+    lines file: one line per processed PDF with its extract and insert stages, and one line for the
+    run with the load, stats and save stages and the totals.
+
+    Only the outermost measured call is counted, so a measured function calling another one (like
+    insert_into_excel calling insert_columns_into_excel) is not counted twice. CPU time is this
+    process only, so extraction in worker processes shows up as wall time spent waiting.
+
+    Memory per stage is the largest growth of resident memory over one call, read before and after
+    it (Linux only). The peak RSS of the process, which covers its whole lifetime, is only written
+    in the run line.
+    """
+
+    def __init__(self, path, command=None):
+        self.path = path
+        self.command = command
+        self.run_id = f"{datetime.datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}"
+        self.depth = 0
+        self.stages = {}
+        self.run_stages = {}
+        self.files = 0
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    @contextmanager
+    def measure(self, stage):
+        """
+        Measures the block as one call of a stage.
+
+        Yields:
+            dict: Set its 'cells' entry to the number of cells the block read or wrote.
+        """
+        counters = {"cells": None}
+        outermost = self.depth == 0
+        self.depth += 1
+        rss = current_rss_mb() if outermost else None
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield counters
+        finally:
+            self.depth -= 1
+            if outermost:
+                wall = time.perf_counter() - wall
+                cpu = time.process_time() - cpu
+                after = current_rss_mb()
+                growth = round(after - rss, 1) if rss is not None and after is not None else None
+                self.add(stage, wall, cpu, counters["cells"], growth)
+
+    def add(self, stage, wall, cpu, cells=None, rss_growth=None):
+        entry = self.stages.setdefault(stage, new_stage_entry())
+        entry["calls"] += 1
+        entry["wall_s"] += wall
+        entry["cpu_s"] += cpu
+        entry["cells"] += cells or 0
+        entry["max_rss_growth_mb"] = larger(entry["max_rss_growth_mb"], rss_growth)
+        return
+
+    def write(self, record):
+        record = {"run_id": self.run_id, "time": datetime.datetime.now().isoformat(timespec="seconds"), **record}
+        with open(self.path, "a", encoding="utf-8") as metrics_file:
+            metrics_file.write(json.dumps(record) + "\n")
+        return
+
+    def record_file(self, pdf_path, result):
+        """Writes the line for one processed PDF and moves its stages into the run totals."""
+        stages = {stage: self.stages.pop(stage) for stage in FILE_STAGES if stage in self.stages}
+        for stage, entry in stages.items():
+            merge_stage(self.run_stages, stage, entry)
+        self.files += 1
+        self.write({"record": "file", "pdf_path": pdf_path, "status": result["status"], "stages": rounded(stages)})
+        return
+
+    def record_run(self):
+        """Writes the line for the whole run."""
+        for stage, entry in self.stages.items():
+            merge_stage(self.run_stages, stage, entry)
+        self.stages = {}
+        self.write({
+            "record": "run",
+            "command": self.command,
+            "files": self.files,
+            "wall_s": round(time.perf_counter() - self.started, 6),
+            "cpu_s": round(time.process_time() - self.cpu_started, 6),
+            "process_peak_rss_mb": peak_rss_mb(),
+            "stages": rounded(self.run_stages),
+        })
+        return
+
+def new_stage_entry():
+    return {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "cells": 0, "max_rss_growth_mb": None}
+
+def larger(first, second):
+    """Returns the larger of two values, either of which may be None."""
+    if first is None or second is None:
+        return first if second is None else second
+    return max(first, second)
+
+def merge_stage(stages, stage, entry):
+    total = stages.setdefault(stage, new_stage_entry())
+    for key in ("calls", "wall_s", "cpu_s", "cells"):
+        total[key] += entry[key]
+    total["max_rss_growth_mb"] = larger(total["max_rss_growth_mb"], entry["max_rss_growth_mb"])
+
+def rounded(stages):
+    return {stage: {key: round(value, 6) if isinstance(value, float) else value for key, value in entry.items()} for stage, entry in stages.items()}
+
+@contextmanager
+def recording(path, command=None):
+    """
+    Records metrics for everything run inside the block, if a path is given.
+
+    Args:
+        path (str): JSON lines file to append to, or None to record nothing.
+        command (str, optional): Name of the command, written in the run line.
+
+    Yields:
+        MetricsRecorder: The recorder, or None.
+    """
+    global _active
+    if not path:
+        yield None
+        return
+    recorder = MetricsRecorder(path, command)
+    _active = recorder
+    try:
+        yield recorder
+    finally:
+        _active = None
+        recorder.record_run()
+
+@contextmanager
+def measure(stage):
+    """Measures a block as one call of a stage when metrics are being recorded. See MetricsRecorder.measure."""
+    if _active is None:
+        yield {"cells": None}
+        return
+    with _active.measure(stage) as counters:
+        yield counters
+
+def record_stage(stage, wall, cpu=0.0, cells=None):
+    """Adds a call measured some other way to a stage, e.g. time spent waiting for worker processes."""
+    if _active is not None:
+        _active.add(stage, wall, cpu, cells)
+
+def record_file(pdf_path, result):
+    """Writes the metrics line of one processed PDF when metrics are being recorded."""
+    if _active is not None:
+        _active.record_file(pdf_path, result)
+
+def instrumented(stage, cells=None):
+    """
+    Decorator measuring every call of a function as a call of a stage when metrics are being recorded.
+
+    Args:
+        stage (str): "extract", "insert", "stats", ...
+        cells (callable, optional): Called with (args, result) to count the cells the call read or wrote.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return function(*args, **kwargs)
+            with _active.measure(stage) as counters:
+                result = function(*args, **kwargs)
+                if cells is not None:
+                    counters["cells"] = cells(args, result)
+                return result
+        return wrapper
+    return decorate
+
+@contextmanager
+def profiling(path):
+    """
+    Runs the block under cProfile and writes the stats to a pstats file, if a path is given.
+    Only the calling thread is profiled.
+
+    Read the file with: python -m pstats PATH
+    """
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
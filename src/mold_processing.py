@@ -1,18 +1,605 @@
+import gc
+import os
+import re
+from collections import Counter
 import pdfplumber
 from openpyxl.styles import Font, Alignment
 import math
+from bisect import bisect_right
+import numpy as np
+from openpyxl.utils import get_column_letter, quote_sheetname
+from openpyxl.workbook.defined_name import DefinedName
+from spore_index import SporeRowIndex, FIRST_SPORE_ROW, find_total_count_index
+from metrics import instrumented, current_rss_mb, extracted_cells
 
 #CONSTNATS
+EXTRACTION_ENGINES = ("tables", "words")
+SAMPLE_SELECTIONS = ("outdoor", "indoor", "all")
+MEMORY_LIMIT_ENV = "PDF_TO_EXCEL_MEMORY_LIMIT"  # MB the extraction of one PDF may add to the process, unset for no limit
+WORD_LINE_TOLERANCE = 3  # points between word tops that still count as one line
+COLUMN_SNAP_TOLERANCE = 3  # points a word may sit outside its column
 LAB_REFERENCE_NUMBER_STYLE = Font(name='Arial', size=11, bold=True)
 OTHER_STYLE = Font(name='Arial', size=11)
+STAT_HEADERS = ["Total", "Mean", "Stdv", "Frequency", "Min", "5th Percentile", "Median", "95th Percentile", "Max", "Count"]
+# Columns that clear_old_stats resets to 0 and the per-row functions leave untouched when a row has no values
+ZERO_WHEN_EMPTY_HEADERS = ["Min", "5th Percentile", "Median", "95th Percentile", "Max"]
+SAMPLE_RESERVE_BLOCK = 10  # empty sample columns added at a time when the sample area is full
+STATISTICS_MODES = ("values", "formulas")
+MIN_MATRIX_CAPACITY = 16  # sample columns a SampleMatrix starts with, doubled whenever it fills up
+SAMPLE_BLOCK_NAME = "SampleBlock"  # Defined name over the sample values, rows 4 down, columns B up to 'Total'
+SAMPLE_HEADERS_NAME = "SampleHeaders"  # Defined name over the sample headers in row 3
+ORDERED_BLOCK_NAME = "OrderedBlock"  # Defined name over the sample values Min through Count read, see sample_range_references
+STATISTICS_SCOPE_NAME = "StatisticsScope"  # Defined name marking workbooks whose Min through Count cover every sample
+EVERY_SAMPLE_SCOPE = '"all"'  # Its value, a text constant Excel leaves alone
+SAMPLE_ROW = f"INDEX({SAMPLE_BLOCK_NAME},ROW()-ROW({SAMPLE_BLOCK_NAME})+1,0)"
+ORDERED_ROW = f"INDEX({ORDERED_BLOCK_NAME},ROW()-ROW({ORDERED_BLOCK_NAME})+1,0)"
+# The same formula works on every row. Blanks where the value is undefined and 0s match write_statistics.
+STAT_FORMULAS = {
+    "Total": f"=SUM({SAMPLE_ROW})",
+    "Mean": f'=IF(COUNT({SAMPLE_ROW})=0,"",AVERAGE({SAMPLE_ROW}))',
+    "Stdv": f'=IF(COUNT({SAMPLE_ROW})<2,"",_xlfn.STDEV.S({SAMPLE_ROW}))',
+    "Frequency": f'=IF(COUNTA({SAMPLE_HEADERS_NAME})=0,0,ROUND((COUNTIF({SAMPLE_ROW},">0")+COUNTIF({SAMPLE_ROW},"<0"))/COUNTA({SAMPLE_HEADERS_NAME})*100,2))',
+    "Min": f"=MIN({ORDERED_ROW})",
+    "5th Percentile": f"=IF(COUNT({ORDERED_ROW})=0,0,SMALL({ORDERED_ROW},MAX(ROUNDUP(COUNT({ORDERED_ROW})*5/100,0),1)))",
+    "Median": f"=IF(COUNT({ORDERED_ROW})=0,0,MEDIAN({ORDERED_ROW}))",
+    "95th Percentile": f"=IF(COUNT({ORDERED_ROW})=0,0,SMALL({ORDERED_ROW},MAX(ROUNDUP(COUNT({ORDERED_ROW})*95/100,0),1)))",
+    "Max": f"=MAX({ORDERED_ROW})",
+    "Count": f"=COUNT({ORDERED_ROW})",
+}
 
-def find_mold_values(pdf_path):
+def inserted_cells(args, result):
+    """Cell count for the metrics of the insert functions: the header and values written per sample."""
+    if isinstance(args[0], list):
+        return sum(len(mold_dict) + 1 for mold_dict, lab_reference_number in args[0])
+    return len(args[0]) + 1
+
+def statistic_cells(args, result):
+    """Cell count for the metrics of a single statistic function: one cell per spore type row."""
+    return max(args[0].max_row - 3, 0)
+
+def statistic_block_cells(args, result):
+    """Cell count for the metrics of a function writing every statistic column."""
+    return max(args[0].max_row - 3, 0) * len(STAT_HEADERS)
+
+class ReportTemplate:
+    """
+    One lab's results table layout, described declaratively.
+
+    Rows are counted in the extracted table from 0: the lab reference number of a sample is on
+    `reference_row`, the spore type counts start on `data_row` and each sample's values are
+    `value_offset` columns right of its header. The header keywords are regular expressions that
+    must match a whole cell, compiled once into a single matcher.
+
+    A report is given a template when every `text_patterns` regex is found in the text of its first
+    page and every `metadata_patterns` regex in that field of the PDF metadata (e.g. 'Producer').
+    Matching is case-insensitive. A template without patterns never matches by fingerprint and is
+    only used as the fallback.
+    """
+
+    def __init__(self, name, header_keywords, reference_row=1, data_row=3, value_offset=2, text_patterns=(), metadata_patterns=None):
+        self.name = name
+        self.header = re.compile("|".join(f"(?:{keyword})" for keyword in header_keywords))
+        self.reference_row = reference_row
+        self.data_row = data_row
+        self.value_offset = value_offset
+        self.text_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in text_patterns]
+        self.metadata_patterns = {field: re.compile(pattern, re.IGNORECASE) for field, pattern in (metadata_patterns or {}).items()}
+
+    def is_header(self, text):
+        """Returns True if a table cell or word is the 'Outdoor' sample header of this layout."""
+        return self.header.fullmatch(text.strip()) is not None
+
+    def has_fingerprint(self):
+        return bool(self.text_patterns or self.metadata_patterns)
+
+    def matches(self, first_page_text, metadata):
+        """Returns True if a report's first page text and metadata carry this template's fingerprint."""
+        if not self.has_fingerprint():
+            return False
+        if not all(pattern.search(first_page_text) for pattern in self.text_patterns):
+            return False
+        return all(pattern.search(str(metadata.get(field) or "")) for field, pattern in self.metadata_patterns.items())
+
+    def uses_default_rows(self):
+        """The words engine only knows the header, reference, sub-header, data line order of the default layout."""
+        return (self.reference_row, self.data_row, self.value_offset) == (1, 3, 2)
+
+# Register new report formats here, and bump EXTRACTOR_VERSION in extraction_cache.py so cached results are redone
+DEFAULT_TEMPLATE = ReportTemplate("default", [r"(?i:outdoor)", "outdoors", "extérieur"])
+REPORT_TEMPLATES = [DEFAULT_TEMPLATE]
+TEMPLATE_HITS = Counter()  # Reports extracted with each template in this process, plus 'fallback' retries
+
+def register_template(template):
+    """Adds a report template to the registry, replacing one with the same name."""
+    REPORT_TEMPLATES[:] = [existing for existing in REPORT_TEMPLATES if existing.name != template.name] + [template]
+    return template
+
+def identify_template(pdf):
+    """
+    Picks the template of a report from its first page text and metadata only, without any table
+    detection. The text is only read when some template has a fingerprint.
+
+    Args:
+        pdf (PDF): An open pdfplumber document.
+
+    Returns:
+        ReportTemplate: The one template whose fingerprint matches, or DEFAULT_TEMPLATE when none
+        or more than one does.
+    """
+    candidates = [template for template in REPORT_TEMPLATES if template.has_fingerprint()]
+    if not candidates or not pdf.pages:
+        return DEFAULT_TEMPLATE
+    page = pdf.pages[0]
+    text = page.extract_text() or ""
+    page.close()
+    matching = [template for template in candidates if template.matches(text, pdf.metadata or {})]
+    return matching[0] if len(matching) == 1 else DEFAULT_TEMPLATE
+
+def template_hits():
+    """Returns how many reports each template extracted in this process, with 'fallback' counting retries."""
+    return dict(TEMPLATE_HITS)
+
+def is_outdoor_header(text, template=None):
+    """Returns True if a table cell or word is the 'Outdoor' sample header."""
+    return (template or DEFAULT_TEMPLATE).is_header(text)
+
+def build_mold_dict(mold_types, mold_values):
+    """
+    Pairs mold type names with their raw value strings, keeping whole-number counts and None otherwise.
+
+    Args:
+        mold_types (list): Mold type names, already stripped of commas.
+        mold_values (list): Raw value strings from the value column.
+
+    Returns:
+        dict: Dictionary mapping mold types to their values.
+    """
+    mold_dict = {}
+    cleaned = ""
+    for mold_type, value in zip(mold_types, mold_values):
+        if mold_type and mold_type.strip():
+            cleaned = value.strip().replace(",", "") if value else ""
+        mold_dict[mold_type.strip()] = int(cleaned) if (cleaned and cleaned.isdigit()) else None
+    return mold_dict
+
+def locate_outdoor_header(transposed, template=None):
+    """
+    Finds the 'Outdoor' header cell in a transposed table, scanning column by column.
+
+    Args:
+        transposed (list): The table's columns.
+        template (ReportTemplate, optional): The report's layout, DEFAULT_TEMPLATE if omitted.
+
+    Returns:
+        tuple: (col_index, row_index) of the header, or (None, None) if there is none.
+    """
+    for col_idx, col in enumerate(transposed):
+        for row_idx, cell in enumerate(col):
+            if cell and is_outdoor_header(cell, template):
+                return col_idx, row_idx
+    return None, None
+
+def read_outdoor_table(table, template=None):
+    """
+    Reads the 'Outdoor' column from one extracted table.
+
+    Args:
+        table (list): Rows of cell strings from pdfplumber.
+        template (ReportTemplate, optional): The report's layout, DEFAULT_TEMPLATE if omitted.
+
+    Returns:
+        tuple: (mold_dict, lab_reference_number), or None if the table has no 'Outdoor' column.
+    """
+    template = template or DEFAULT_TEMPLATE
+    transposed = list(zip(*table))
+    outdoor_col_index, outdoor_row_index = locate_outdoor_header(transposed, template)
+    if outdoor_col_index is None:
+        return None
+    mold_col_index = outdoor_col_index + template.value_offset
+    if mold_col_index >= len(transposed):
+        return None
+    lab_reference_number = transposed[outdoor_col_index][template.reference_row]
+    mold_types = list(mt.strip().replace(",","") if mt else "" for mt in transposed[0][template.data_row:])
+    mold_values = list(transposed[mold_col_index][template.data_row:])
+    return (build_mold_dict(mold_types, mold_values), lab_reference_number)
+
+def read_sample_columns(table, template=None):
+    """
+    Reads every sample column (indoor rooms as well as the outdoor control) from one results table.
+
+    Sample headers are the non-empty cells on the same row as the 'Outdoor' header. Each sample
+    uses the same layout as the outdoor one, by default the lab reference on row 1 and the values
+    two columns right.
+
+    Args:
+        table (list): Rows of cell strings from pdfplumber.
+        template (ReportTemplate, optional): The report's layout, DEFAULT_TEMPLATE if omitted.
+
+    Returns:
+        list: (mold_dict, lab_reference_number, sample_name) for each sample, left to right,
+        or None if the table has no 'Outdoor' column.
+    """
+    template = template or DEFAULT_TEMPLATE
+    transposed = list(zip(*table))
+    outdoor_col_index, outdoor_row_index = locate_outdoor_header(transposed, template)
+    if outdoor_col_index is None:
+        return None
+    mold_types = list(mt.strip().replace(",","") if mt else "" for mt in transposed[0][template.data_row:])
+    samples = []
+    for col_idx in range(1, len(transposed) - template.value_offset):
+        sample_name = transposed[col_idx][outdoor_row_index]
+        if sample_name and sample_name.strip():
+            mold_dict = build_mold_dict(mold_types, list(transposed[col_idx + template.value_offset][template.data_row:]))
+            samples.append((mold_dict, transposed[col_idx][template.reference_row], sample_name.strip()))
+    return samples
+
+def find_outdoor_tables(page, first_only=False, template=None):
+    """
+    Reads the 'Outdoor' column from every table on a page with pdfplumber's ruled-table detection.
+
+    Args:
+        page (Page): The pdfplumber page to search.
+        first_only (bool, optional): Stop extracting tables as soon as one has an 'Outdoor' column.
+        template (ReportTemplate, optional): The report's layout, DEFAULT_TEMPLATE if omitted.
+
+    Returns:
+        list: (mold_dict, lab_reference_number) for each table with an 'Outdoor' column, top to bottom.
+    """
+    matches = []
+    for table in page.find_tables():
+        info = read_outdoor_table(table.extract(), template)
+        if info is not None:
+            matches.append(info)
+            if first_only:
+                break
+    return matches
+
+def group_word_lines(words):
+    """
+    Groups pdfplumber words into text lines and each line into cells.
+
+    Words on the same line closer together than half their height are joined into one cell,
+    so multi-word names like 'Ascospores non-specified' stay together.
+
+    Args:
+        words (list): Words from page.extract_words().
+
+    Returns:
+        list: Lines from top to bottom, each a list of cell dicts with text, x0, x1 and top.
+    """
+    lines = []
+    for word in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        if lines and abs(word["top"] - lines[-1][0]["top"]) <= WORD_LINE_TOLERANCE:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+    cell_lines = []
+    for line in lines:
+        cells = []
+        for word in sorted(line, key=lambda w: w["x0"]):
+            height = word["bottom"] - word["top"]
+            if cells and word["x0"] - cells[-1]["x1"] <= height * 0.5:
+                cells[-1]["text"] += " " + word["text"]
+                cells[-1]["x1"] = word["x1"]
+            else:
+                cells.append({"text": word["text"], "x0": word["x0"], "x1": word["x1"], "top": word["top"]})
+        cell_lines.append(cells)
+    return cell_lines
+
+def find_mold_values_in_words(page, words=None, template=None):
+    """
+    Reads the 'Outdoor' column from a page's text layer without ruled-table detection.
+
+    Column boundaries come from the sub-header line two lines below the 'Outdoor' header. The value
+    column is two columns right of the one 'Outdoor' starts in, matching the table path, and rows are
+    read until the spacing or the first column breaks.
+
+    Args:
+        page (Page): The pdfplumber page holding the results table.
+        words (list, optional): The page's words, if already extracted.
+        template (ReportTemplate, optional): The report's layout, DEFAULT_TEMPLATE if omitted.
+
+    Returns:
+        tuple: (mold_dict, lab_reference_number), (None, None) if the page has no 'Outdoor' header,
+        or None if the layout check fails and the table path should be used instead.
+    """
+    template = template or DEFAULT_TEMPLATE
+    if not template.uses_default_rows():
+        return None
+    if words is None:
+        words = page.extract_words()
+    if not any(is_outdoor_header(word["text"], template) for word in words):
+        return (None, None)
+    lines = group_word_lines(words)
+    outdoor_line_index = outdoor_cell = None
+    for line_index, cells in enumerate(lines):
+        outdoor_cell = next((cell for cell in cells if is_outdoor_header(cell["text"], template)), None)
+        if outdoor_cell is not None:
+            outdoor_line_index = line_index
+            break
+    if outdoor_line_index is None or outdoor_line_index + 2 >= len(lines):
+        return None
+    lab_cells = lines[outdoor_line_index + 1]
+    sub_headers = lines[outdoor_line_index + 2]
+    # Column i starts just left of its sub-header and runs up to the next one
+    boundaries = [float("-inf")]
+    boundaries.extend(cell["x0"] - COLUMN_SNAP_TOLERANCE for cell in sub_headers[1:])
+    boundaries.append(float("inf"))
+
+    def column_of(cell):
+        for col_index in range(len(sub_headers)):
+            if boundaries[col_index] <= cell["x0"] < boundaries[col_index + 1]:
+                if cell["x1"] > boundaries[col_index + 1] + COLUMN_SNAP_TOLERANCE:
+                    return None  # Straddles two columns
+                return col_index
+        return None
+
+    outdoor_col_index = column_of(outdoor_cell)
+    if outdoor_col_index is None or outdoor_col_index + 2 >= len(sub_headers):
+        return None
+    # Only a header left-aligned with its first sub-column tells us where the merged cell starts
+    if abs(outdoor_cell["x0"] - sub_headers[outdoor_col_index]["x0"]) > COLUMN_SNAP_TOLERANCE:
+        return None
+    lab_cell = next((cell for cell in lab_cells if abs(cell["x0"] - outdoor_cell["x0"]) <= COLUMN_SNAP_TOLERANCE), None)
+    if lab_cell is None:
+        return None
+    lab_reference_number = lab_cell["text"]
+
+    mold_col_index = outdoor_col_index + 2
+    row_pitch = sub_headers[0]["top"] - lab_cells[0]["top"]
+    mold_types = []
+    mold_values = []
+    previous_top = sub_headers[0]["top"]
+    for cells in lines[outdoor_line_index + 3:]:
+        gap = cells[0]["top"] - previous_top
+        if gap > row_pitch * 1.5:
+            break  # Past the bottom of the table
+        if gap < row_pitch * 0.75:
+            return None  # Wrapped text, only the ruled table can tell which row it belongs to
+        columns = [column_of(cell) for cell in cells]
+        if None in columns:
+            return None
+        if columns[0] != 0:
+            break
+        values = {col_index: cell["text"] for col_index, cell in zip(columns, cells)}
+        mold_types.append(values[0].strip().replace(",", ""))
+        mold_values.append(values.get(mold_col_index))
+        previous_top = cells[0]["top"]
+    if not mold_types:
+        return None
+    return (build_mold_dict(mold_types, mold_values), lab_reference_number)
+
+def memory_limit_mb():
+    """Returns the per-PDF memory ceiling set in PDF_TO_EXCEL_MEMORY_LIMIT in MB, or None if there is none."""
+    value = os.environ.get(MEMORY_LIMIT_ENV)
+    if not value:
+        return None
+    try:
+        limit = float(value)
+    except ValueError:
+        raise ValueError(f"{MEMORY_LIMIT_ENV} must be a number of MB, got '{value}'.")
+    return limit if limit > 0 else None
+
+def check_memory(pdf, baseline, limit):
+    """
+    Enforces the memory ceiling between pages. When the process has grown by more than `limit` MB
+    since the PDF was opened, the document's parsed object cache is dropped and garbage collected
+    before checking again.
+
+    Args:
+        pdf (PDF): The open pdfplumber document.
+        baseline (float): Resident memory in MB when the PDF was opened.
+        limit (float): MB the PDF may add, or None.
+
+    Raises:
+        MemoryError: If the PDF is still above its ceiling after the caches were dropped.
+    """
+    if limit is None or baseline is None or current_rss_mb() - baseline <= limit:
+        return
+    # pdfminer keeps every object it has parsed, they are parsed again if needed
+    getattr(pdf.doc, "_cached_objs", {}).clear()
+    getattr(pdf.doc, "_parsed_objs", {}).clear()
+    gc.collect()
+    used = current_rss_mb() - baseline
+    if used > limit:
+        raise MemoryError(f"Extraction used {used:.0f} MB, more than the {limit:.0f} MB limit set in {MEMORY_LIMIT_ENV}.")
+
+def iter_outdoor_pages(pdf, memory_limit=None, template=None):
+    """
+    Lazily indexes the pages whose text layer mentions an 'Outdoor' header.
+
+    Only words are extracted here, which is far cheaper than table detection. The second page is
+    checked first since that is where the results table usually is, then the rest in order.
+    Every page's cached layout objects are released once the caller moves on to the next page, so
+    memory stays at about one page however long the report is.
+
+    Args:
+        pdf (PDF): An open pdfplumber document.
+        memory_limit (float, optional): MB the document may add to the process, see check_memory.
+            Defaults to PDF_TO_EXCEL_MEMORY_LIMIT.
+        template (ReportTemplate, optional): The report's layout, DEFAULT_TEMPLATE if omitted.
+
+    Yields:
+        tuple: (page_index, page, words) for each page with an 'Outdoor' keyword.
+
+    Raises:
+        MemoryError: If the memory limit is exceeded.
+    """
+    if memory_limit is None:
+        memory_limit = memory_limit_mb()
+    baseline = current_rss_mb() if memory_limit is not None else None
+    page_order = list(range(len(pdf.pages)))
+    if len(page_order) > 1:
+        page_order.insert(0, page_order.pop(1))
+    for page_index in page_order:
+        check_memory(pdf, baseline, memory_limit)
+        page = pdf.pages[page_index]
+        words = page.extract_words()
+        if any(is_outdoor_header(word["text"], template) for word in words):
+            yield page_index, page, words
+        page.close()
+
+def iter_template_pages(pdf, extract_page, memory_limit=None):
+    """
+    Runs one page extraction over every 'Outdoor' page with the template identify_template picks.
+    If a fingerprinted template finds nothing in the whole report, the report is read again
+    with DEFAULT_TEMPLATE. TEMPLATE_HITS counts the template that found the samples.
+
+    Args:
+        pdf (PDF): An open pdfplumber document.
+        extract_page (callable): Called with (page, words, template), returns a list of results.
+        memory_limit (float, optional): MB the document may add to the process, see check_memory.
+
+    Yields:
+        tuple: (page_index, results) for each page with an 'Outdoor' keyword.
+    """
+    template = identify_template(pdf)
+    templates = [template] if template is DEFAULT_TEMPLATE else [template, DEFAULT_TEMPLATE]
+    for attempt, template in enumerate(templates):
+        if attempt:
+            TEMPLATE_HITS["fallback"] += 1
+        found = False
+        for page_index, page, words in iter_outdoor_pages(pdf, memory_limit, template):
+            results = extract_page(page, words, template)
+            if results and not found:
+                found = True
+                TEMPLATE_HITS[template.name] += 1
+            yield page_index, results
+        if found:
+            return
+
+def extract_page_matches(page, words, engine="tables", first_only=False, template=None):
+    """
+    Extracts the 'Outdoor' results from one indexed page.
+
+    Args:
+        page (Page): The pdfplumber page.
+        words (list): The page's words from iter_outdoor_pages.
+        engine (str, optional): "tables" or "words", see find_mold_values.
+        first_only (bool, optional): Stop at the first matching table.
+        template (ReportTemplate, optional): The report's layout, DEFAULT_TEMPLATE if omitted.
+
+    Returns:
+        list: (mold_dict, lab_reference_number) for each 'Outdoor' table on the page.
+    """
+    # The words engine only understands one results table per page
+    if engine == "words" and sum(1 for word in words if is_outdoor_header(word["text"], template)) == 1:
+        info = find_mold_values_in_words(page, words, template)
+        if info is not None:
+            return [info] if info[0] is not None else []
+    return find_outdoor_tables(page, first_only, template)
+
+@instrumented("extract", cells=extracted_cells)
+def find_all_mold_values(pdf_path, engine="tables"):
+    """
+    Extracts every 'Outdoor' results table in a PDF, across all pages.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        engine (str, optional): "tables" or "words", see find_mold_values.
+
+    Returns:
+        list: (mold_dict, lab_reference_number) for each match, second page first and then in page
+        order. Empty if no page has an 'Outdoor' section.
+    """
+    if engine not in EXTRACTION_ENGINES:
+        raise ValueError(f"Unknown extraction engine '{engine}', expected one of {EXTRACTION_ENGINES}.")
+    matches = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_index, page_matches in iter_template_pages(pdf, lambda page, words, template: extract_page_matches(page, words, engine, template=template)):
+            matches.extend(page_matches)
+    return matches
+
+@instrumented("extract", cells=extracted_cells)
+def find_all_samples(pdf_path, selection="all"):
     """
-    Extracts mold types and their corresponding values from the 'Outdoor' section
-    of the second page of a PDF.
+    Extracts every sample column from the 'Outdoor' results tables of a PDF in one parse.
 
     Args:
         pdf_path (str): Path to the PDF file.
+        selection (str, optional): "all" samples, only the "outdoor" ones, or only the "indoor" ones.
+
+    Returns:
+        list: (mold_dict, lab_reference_number, sample_name) for each selected sample, in page order.
+    """
+    if selection not in SAMPLE_SELECTIONS:
+        raise ValueError(f"Unknown sample selection '{selection}', expected one of {SAMPLE_SELECTIONS}.")
+    samples = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_index, page_samples in iter_template_pages(pdf, lambda page, words, template: read_page_samples(page, selection, template)):
+            samples.extend(page_samples)
+    return samples
+
+def iter_report_pages(pdf_path, engine="tables", samples="outdoor", memory_limit=None):
+    """
+    Extracts a report one page at a time, so the caller can use each page's samples before the
+    next page is parsed. Only one page's layout objects are held at a time, see iter_outdoor_pages.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        engine (str, optional): "tables" or "words", see extract_report.
+        samples (str, optional): "outdoor", "indoor" or "all" sample columns.
+        memory_limit (float, optional): MB the PDF may add to the process, see check_memory.
+
+    Yields:
+        tuple: (page_index, matches) for each page with an 'Outdoor' header, matches holding
+            (mold_dict, lab_reference_number) for each selected sample column on the page.
+
+    Raises:
+        ValueError: If the engine or sample selection is unknown.
+        MemoryError: If the memory limit is exceeded.
+    """
+    if engine not in EXTRACTION_ENGINES:
+        raise ValueError(f"Unknown extraction engine '{engine}', expected one of {EXTRACTION_ENGINES}.")
+    if samples not in SAMPLE_SELECTIONS:
+        raise ValueError(f"Unknown sample selection '{samples}', expected one of {SAMPLE_SELECTIONS}.")
+    def extract_page(page, words, template):
+        if samples == "outdoor":
+            return extract_page_matches(page, words, engine, template=template)
+        return [(mold_dict, lab_reference_number) for mold_dict, lab_reference_number, sample_name in read_page_samples(page, samples, template)]
+
+    with pdfplumber.open(pdf_path) as pdf:
+        yield from iter_template_pages(pdf, extract_page, memory_limit)
+
+def read_page_samples(page, selection="all", template=None):
+    """Returns (mold_dict, lab_reference_number, sample_name) for each selected sample column on one page."""
+    samples = []
+    for table in page.find_tables():
+        for mold_dict, lab_reference_number, sample_name in read_sample_columns(table.extract(), template) or []:
+            if selection == "all" or is_outdoor_header(sample_name, template) == (selection == "outdoor"):
+                samples.append((mold_dict, lab_reference_number, sample_name))
+    return samples
+
+@instrumented("extract", cells=extracted_cells)
+def extract_report(pdf_path, engine="tables", samples="outdoor"):
+    """
+    Extracts the sample columns a workbook should receive from one report.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        engine (str, optional): "tables" or "words", see find_mold_values. Only the outdoor
+            selection can use the words engine, the others always use table detection.
+        samples (str, optional): "outdoor", "indoor" or "all" sample columns.
+
+    Returns:
+        list: (mold_dict, lab_reference_number) for each selected sample column.
+    """
+    return [match for page_index, matches in iter_report_pages(pdf_path, engine, samples) for match in matches]
+
+@instrumented("extract", cells=extracted_cells)
+def find_mold_values(pdf_path, engine="tables"):
+    """
+    Extracts mold types and their corresponding values from the first 'Outdoor' section of a PDF.
+
+    Pages are indexed by their text layer first, so table extraction only runs on pages that
+    mention 'Outdoor', starting with the second page, and stops at the first matching table. The
+    layout comes from the report's template, see identify_template.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        engine (str, optional): "tables" uses pdfplumber's ruled-table detection. "words" reads the
+            text layer directly, which is much faster, and falls back to "tables" when the page
+            layout does not pass its checks.
 
     Returns:
         tuple: (mold_dict, lab_reference_number)
@@ -20,63 +607,140 @@ def find_mold_values(pdf_path):
             lab_reference_number (str): The lab reference number found in the table.
         or (None, None) if 'Outdoor' section is not found.
     """
+    if engine not in EXTRACTION_ENGINES:
+        raise ValueError(f"Unknown extraction engine '{engine}', expected one of {EXTRACTION_ENGINES}.")
     with pdfplumber.open(pdf_path) as pdf:
-        page = pdf.pages[1]  # 0-based index, so 1 is the second page
-        tables = page.extract_tables()
-        for table_num, table in enumerate(tables):
-            transposed = list(zip(*table))
-            outdoor_col_index = None
-            outdoor_row_index = None
-            for col_idx, col in enumerate(transposed):
-                for row_idx, cell in enumerate(col):
-                    if cell and (cell.strip().lower() == "outdoor" or cell.strip() == "outdoors" or cell.strip() == "extérieur"):
-                        outdoor_col_index = col_idx
-                        outdoor_row_index = row_idx
-                        break
-                if outdoor_col_index is not None:
-                    break
-            if outdoor_col_index is not None:
-                outdoor_column = transposed[outdoor_col_index]
-                lab_reference_number = transposed[outdoor_col_index][1]
-                mold_col_index = outdoor_col_index + 2
-                mold_types = list(mt.strip().replace(",","") if mt else "" for mt in transposed[0][3:])
-                mold_values = list(transposed[mold_col_index][3:])
-                mold_dict = {}
-                for mold_type, value in zip(mold_types, mold_values):
-                    if mold_type and mold_type.strip():
-                        cleaned = value.strip().replace(",", "") if value else ""
-                    mold_dict[mold_type.strip()] = int(cleaned) if (cleaned and cleaned.isdigit()) else None
-                info = (mold_dict, lab_reference_number)
-            else:
-                print("'Outdoor' not found in this table.")
-                mold_dict = None
-                lab_reference_number = None
-                info = (mold_dict, lab_reference_number)
-    return info
+        pages = iter_template_pages(pdf, lambda page, words, template: extract_page_matches(page, words, engine, first_only=True, template=template))
+        for page_index, matches in pages:
+            if matches:
+                pages.close()
+                return matches[0]
+    return (None, None)
 
-def find_total_count_index(sheet):
+def plan_layout(sheet, new_samples=0, reserve_block=SAMPLE_RESERVE_BLOCK):
     """
-    Finds the index of the 'Total' column in the Excel sheet.
+    Works out the final column layout from a single read of header row 3, before anything moves.
+
+    Empty sample slots before 'Total' are used first. If they run out, sample columns are reserved
+    in whole blocks in front of 'Total' so later reports find free slots. Missing statistic headers
+    are placed directly after the statistic that precedes them, as the per-row functions would.
 
     Args:
         sheet (Worksheet): The active worksheet.
+        new_samples (int, optional): Number of sample columns about to be inserted.
+        reserve_block (int, optional): Block size used when reserving sample columns.
 
     Returns:
-        int: The 0-based index of the 'Total' column.
+        dict: The layout plan.
+            insertions (dict): Current column number -> labels of the columns inserted before it
+                (a statistic header, or None for a reserved sample column).
+            sample_slots (list): Final column numbers for the new samples, left to right.
+            stat_columns (dict): Final column number of every statistic header.
+            new_headers (dict): Final column number -> statistic header still to be written.
 
     Raises:
         ValueError: If the 'Total' column header is missing in the Excel sheet.
     """
     header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
-    try:
-        total_col_index = header_row.index("Total")
-    except ValueError:
+    if "Total" not in header_row:
         raise ValueError("The 'Total' column header is missing in the Excel sheet.")
-    return total_col_index
+    total_col = header_row.index("Total") + 1
+    insertions = {}
+    for prev_header, header in zip(STAT_HEADERS, STAT_HEADERS[1:]):
+        if header in header_row:
+            continue
+        # Consecutive missing headers chain off the last one that exists
+        anchor = prev_header
+        while anchor not in header_row:
+            anchor = STAT_HEADERS[STAT_HEADERS.index(anchor) - 1]
+        insertions.setdefault(header_row.index(anchor) + 2, []).append(header)
+    free_slots = [col for col in range(1, total_col) if header_row[col - 1] is None][:new_samples]
+    missing = new_samples - len(free_slots)
+    if missing > 0:
+        reserved = -(-missing // reserve_block) * reserve_block
+        insertions.setdefault(total_col, []).extend([None] * reserved)
+
+    points = sorted(insertions)
+    shifts = []
+    running = 0
+    for point in points:
+        running += len(insertions[point])
+        shifts.append(running)
+
+    def new_col(col):
+        position = bisect_right(points, col)
+        return col + (shifts[position - 1] if position else 0)
+
+    sample_slots = [new_col(col) for col in free_slots]
+    stat_columns = {header: new_col(header_row.index(header) + 1) for header in STAT_HEADERS if header in header_row}
+    new_headers = {}
+    for point in points:
+        first = new_col(point) - len(insertions[point])
+        for offset, label in enumerate(insertions[point]):
+            if label is None:
+                if len(sample_slots) < new_samples:
+                    sample_slots.append(first + offset)
+            else:
+                stat_columns[label] = first + offset
+                new_headers[first + offset] = label
+    return {
+        "insertions": insertions,
+        "sample_slots": sample_slots,
+        "stat_columns": stat_columns,
+        "new_headers": new_headers,
+    }
+
+def shift_columns(sheet, insertions):
+    """
+    Applies several column insertions in one pass, moving each cell once to its final column.
+    Equivalent to calling sheet.insert_cols for each insertion point, right to left.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        insertions (dict): Current column number -> number (or list) of columns inserted before it.
+
+    Returns:
+        int: Number of cells moved.
+    """
+    points = sorted(insertions)
+    shifts = []
+    running = 0
+    for point in points:
+        count = insertions[point]
+        running += count if isinstance(count, int) else len(count)
+        shifts.append(running)
+    if not running:
+        return 0
+    moved = 0
+    for row, col in sorted(sheet._cells, key=lambda key: key[1], reverse=True):
+        position = bisect_right(points, col)
+        if position:
+            sheet._move_cell(row, col, 0, shifts[position - 1])
+            moved += 1
+    return moved
+
+def apply_layout(sheet, plan):
+    """
+    Carries out a plan from plan_layout: one batched column shift, then the new statistic headers.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        plan (dict): Output of plan_layout.
 
+    Returns:
+        dict: Final column number of every statistic header.
+    """
+    shift_columns(sheet, plan["insertions"])
+    for col, header in plan["new_headers"].items():
+        sheet.cell(row=3, column=col, value=header).font = LAB_REFERENCE_NUMBER_STYLE
+    return plan["stat_columns"]
+
+@instrumented("insert", cells=inserted_cells)
 def insert_into_excel(mold_dict, sheet, lab_reference_number):
     """
     Inserts mold counts into the first empty column of an Excel sheet, using the lab reference number as the header.
+    The cells are written directly, as the workbook is what gets saved. SampleMatrix.append is the
+    in-memory counterpart and SampleMatrix.write_to_sheet dumps appended samples through here.
 
     Args:
         mold_dict (dict): Dictionary mapping mold types to their values.
@@ -84,25 +748,66 @@ def insert_into_excel(mold_dict, sheet, lab_reference_number):
         lab_reference_number (str): The lab reference number to use as the column header.
 
     Returns:
-        None
+        list: Spore type names from the PDF that matched no row in the sheet.
     """
-    total_count_index = find_total_count_index(sheet)
-    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
-    for col_index in range(total_count_index):
-        if header_row[col_index] is None:
-            break
-    else:
-        col_index = total_count_index
-        sheet.insert_cols(col_index + 1)
-    new_col_header = lab_reference_number
-    sheet.cell(row=3, column=col_index + 1, value=new_col_header).font = LAB_REFERENCE_NUMBER_STYLE
-    for row in range(4, sheet.max_row + 1):
-        spore_type = str(sheet.cell(row=row, column=1).value).strip()
-        if spore_type in mold_dict:
-            sheet.cell(row=row, column=col_index + 1, value=mold_dict[spore_type]).font = OTHER_STYLE
+    sample_slots, unmatched = insert_columns_into_excel([(mold_dict, lab_reference_number)], sheet)
+    return unmatched
 
-    return
+@instrumented("insert", cells=inserted_cells)
+def insert_columns_into_excel(columns, sheet, index=None):
+    """
+    Inserts several sample columns at once, filling empty sample slots first. Room for the rest,
+    and any missing statistic headers, is made with one batched column shift from plan_layout.
+
+    Args:
+        columns (list): (mold_dict, lab_reference_number) pairs, inserted left to right.
+        sheet (Worksheet): The active worksheet.
+        index (SporeRowIndex, optional): Spore type row index of the sheet, built from column A if omitted.
+            Pass the same index for every report going into one workbook.
+
+    Returns:
+        tuple: (sample_slots, unmatched)
+            sample_slots (list): The 1-based column numbers the samples were written to.
+            unmatched (list): Spore type names that matched no row, each listed once.
+    """
+    if index is None:
+        index = SporeRowIndex(sheet)
+    plan = plan_layout(sheet, len(columns))
+    apply_layout(sheet, plan)
+    unmatched = []
+    for col, (mold_dict, lab_reference_number) in zip(plan["sample_slots"], columns):
+        sheet.cell(row=3, column=col, value=lab_reference_number).font = LAB_REFERENCE_NUMBER_STYLE
+        row_values, missing = index.match(mold_dict)
+        for row, value in row_values.items():
+            sheet.cell(row=row, column=col, value=value).font = OTHER_STYLE
+        unmatched.extend(name for name in missing if name not in unmatched)
+    return plan["sample_slots"], unmatched
+
+@instrumented("insert", cells=inserted_cells)
+def replace_column_in_excel(mold_dict, sheet, col, index=None):
+    """
+    Overwrites the mold counts of an existing sample column, clearing values the new report no longer has.
+
+    Args:
+        mold_dict (dict): Dictionary mapping mold types to their values.
+        sheet (Worksheet): The active worksheet.
+        col (int): The 1-based column number of the sample to replace.
+        index (SporeRowIndex, optional): Spore type row index of the sheet, built from column A if omitted.
 
+    Returns:
+        list: Spore type names that matched no row.
+    """
+    if index is None:
+        index = SporeRowIndex(sheet)
+    row_values, unmatched = index.match(mold_dict)
+    for row in range(4, sheet.max_row + 1):
+        if (row, col) in sheet._cells:
+            sheet.cell(row=row, column=col).value = None
+    for row, value in row_values.items():
+        sheet.cell(row=row, column=col, value=value).font = OTHER_STYLE
+    return unmatched
+
+@instrumented("stats", cells=statistic_cells)
 def total_count(sheet):
     """
     Calculates and writes the sum of mold counts for each row into the 'Total' column of the Excel sheet.
@@ -122,6 +827,7 @@ def total_count(sheet):
                 count += int(cell_value)
         sheet.cell(row=row_idx, column=total_count_index + 1).value = count
     return
+@instrumented("stats", cells=statistic_cells)
 def clear_old_stats(sheet):
     """Clears previous Min/Percentile/Median/Max/Stdv values from the sheet."""
     header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
@@ -133,6 +839,7 @@ def clear_old_stats(sheet):
             except ValueError:
                 pass
 
+@instrumented("stats", cells=statistic_cells)
 def mean_count(sheet):
     """
     Calculates and writes the mean of mold counts for each row into a new column labeled 'Mean' in the Excel sheet.
@@ -162,6 +869,7 @@ def mean_count(sheet):
         sheet.cell(row=row_idx, column=mean_col_index + 1).value = mean
     return
 
+@instrumented("stats", cells=statistic_cells)
 def stdv_count(sheet):
     """
     Calculates and writes the standard deviation of mold counts for each row into a new column labeled 'Stdv' in the Excel sheet.
@@ -199,6 +907,7 @@ def stdv_count(sheet):
         sheet.cell(row=row_idx, column=stdv_col_index + 1).value = stdv
     return
 
+@instrumented("stats", cells=statistic_cells)
 def display_mold_type_frequency(sheet):
     """
     Calculates and writes the frequency (number of samples where each mold type appears)
@@ -239,6 +948,7 @@ def display_mold_type_frequency(sheet):
         sheet.cell(row=row, column=freq_col_index + 1, value=percent)
     return
 
+@instrumented("stats", cells=statistic_cells)
 def find_min(sheet):
     """
     Finds the minimum spore count of each spore
@@ -278,6 +988,7 @@ def find_min(sheet):
 
     return
 
+@instrumented("stats", cells=statistic_cells)
 def fifth_percentile(sheet):
     """ 
     Calculates and writes the 5th percentile of mold counts for each row into a new column labeled '5th Percentile' in the Excel sheet.
@@ -320,6 +1031,7 @@ def fifth_percentile(sheet):
         sheet.cell(row=row, column=fifth_percentile_col_index + 1, value=percentile_value)
     return
 
+@instrumented("stats", cells=statistic_cells)
 def find_median(sheet):
     """
     Calculates and writes the median of mold counts for each row into a new column labeled 'Median' in the Excel sheet.
@@ -363,6 +1075,7 @@ def find_median(sheet):
         sheet.cell(row=row, column=median_col_index + 1, value=median_value)
     return
 
+@instrumented("stats", cells=statistic_cells)
 def find_ninety_fifth_percentile(sheet):
     """
     
@@ -406,6 +1119,7 @@ def find_ninety_fifth_percentile(sheet):
         sheet.cell(row=row, column=ninty_fifth_percentile_col_index + 1, value=percentile_value)
     return
 
+@instrumented("stats", cells=statistic_cells)
 def find_max(sheet):
     """
     Finds the maximum spore count of each spore
@@ -445,6 +1159,7 @@ def find_max(sheet):
         sheet.cell(row=row, column=max_col_index + 1, value=max_value if found else None)
     return
 
+@instrumented("stats", cells=statistic_cells)
 def find_count(sheet):
     """
     Counts the number of non-blank cells in each row and writes the count into a new column labeled 'Count'.
@@ -474,4 +1189,509 @@ def find_count(sheet):
             cell_value = sheet.cell(row=row, column=col).value
             if cell_value is not None:
                 count += 1
-        sheet.cell(row=row, column=count_col_index + 1, value=count)
\ No newline at end of file
+        sheet.cell(row=row, column=count_col_index + 1, value=count)
+    return
+
+def ensure_stat_columns(sheet):
+    """
+    Makes sure every statistic header exists in row 3, adding any missing ones directly after the
+    statistic that precedes them in a single batched column shift.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+
+    Returns:
+        dict: Mapping of statistic header to its 1-based column number.
+    """
+    return apply_layout(sheet, plan_layout(sheet))
+
+def read_sample_block(sheet, total_col_index=None):
+    """
+    Reads every sample column (column B up to 'Total') for rows 4 onwards in a single pass.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        total_col_index (int, optional): The 0-based index of the 'Total' column, looked up if omitted.
+
+    Returns:
+        tuple: (values, present, nonzero)
+            values (ndarray): int64 matrix of counts, 0 where the cell is blank.
+            present (ndarray): Boolean mask of non-blank cells.
+            nonzero (ndarray): Boolean mask of cells counted by the 'Frequency' column.
+    """
+    if total_col_index is None:
+        total_col_index = find_total_count_index(sheet)
+    num_rows = max(sheet.max_row - 3, 0)
+    num_samples = max(total_col_index - 1, 0)
+    if num_rows == 0 or num_samples == 0:
+        return sample_block_arrays([], num_rows, num_samples)
+    rows = sheet.iter_rows(min_row=4, max_row=sheet.max_row, min_col=2, max_col=total_col_index, values_only=True)
+    return sample_block_arrays(rows, num_rows, num_samples)
+
+def sample_block_arrays(rows, num_rows, num_samples):
+    """
+    Converts rows of raw sample cell values into the arrays compute_statistics takes.
+
+    Args:
+        rows (iterable): One sequence of num_samples cell values per row, None for blank cells.
+        num_rows (int): Number of rows.
+        num_samples (int): Number of sample columns.
+
+    Returns:
+        tuple: (values, present, nonzero) as described in read_sample_block.
+    """
+    if num_rows == 0 or num_samples == 0:
+        empty = np.zeros((num_rows, num_samples), dtype=np.int64)
+        return empty, empty.astype(bool), empty.astype(bool)
+    values = []
+    present = []
+    nonzero = []
+    for row in rows:
+        values.append([int(v) if v is not None else 0 for v in row])
+        present.append([v is not None for v in row])
+        nonzero.append([v not in (None, 0, "", "0") for v in row])
+    return (np.array(values, dtype=np.int64).reshape(num_rows, num_samples),
+            np.array(present, dtype=bool).reshape(num_rows, num_samples),
+            np.array(nonzero, dtype=bool).reshape(num_rows, num_samples))
+
+def _nearest_rank(sorted_values, counts, fraction):
+    """Picks the nearest-rank percentile from each row of a sorted, blank-padded matrix."""
+    ranks = np.maximum(np.ceil(fraction * counts).astype(np.int64) - 1, 0)
+    ranks = np.minimum(ranks, sorted_values.shape[1] - 1)
+    return np.take_along_axis(sorted_values, ranks[:, None], axis=1)[:, 0]
+
+def compute_statistics(values, present, nonzero, legacy_last_column=False):
+    """
+    Computes every statistic column for all rows in one vectorized pass.
+
+    Every statistic covers every column given. Blank cells are ignored, zeros are counted, and
+    Frequency is the share of columns with a nonzero count.
+
+    Args:
+        values (ndarray): int64 matrix of counts from read_sample_block.
+        present (ndarray): Boolean mask of non-blank cells.
+        nonzero (ndarray): Boolean mask of cells counted by the 'Frequency' column.
+        legacy_last_column (bool, optional): Leave the last column out of Min, the percentiles,
+            Median, Max and Count, as the per-row functions do by reading columns B up to but not
+            including the one before 'Total'. Only the workbook statistics ask for this, so they
+            stay what the per-row functions wrote, unless the workbook is marked with
+            include_last_sample.
+
+    Returns:
+        dict: Mapping of statistic header to a list with one value per row (None where undefined).
+    """
+    num_rows, num_samples = values.shape
+    counts = present.sum(axis=1)
+    totals = np.where(present, values, 0).sum(axis=1)
+    means = totals / np.maximum(counts, 1)
+    deviations = np.where(present, values - means[:, None], 0.0)
+    variances = (deviations ** 2).sum(axis=1) / np.maximum(counts - 1, 1)
+    stdvs = np.sqrt(variances)
+    frequencies = nonzero.sum(axis=1)
+
+    ordered_present = present[:, :max(num_samples - 1, 0)] if legacy_last_column else present
+    ordered_counts = ordered_present.sum(axis=1)
+    if ordered_present.shape[1]:
+        # Blanks sort to the end so the first ordered_counts entries of each row are the real values
+        padded = np.where(ordered_present, values[:, :ordered_present.shape[1]], np.iinfo(np.int64).max)
+        sorted_values = np.sort(padded, axis=1)
+        fifths = _nearest_rank(sorted_values, ordered_counts, 0.05)
+        ninety_fifths = _nearest_rank(sorted_values, ordered_counts, 0.95)
+        upper = np.minimum(ordered_counts // 2, sorted_values.shape[1] - 1)
+        lower = np.where(ordered_counts % 2 == 0, np.maximum(upper - 1, 0), upper)
+        median_upper = np.take_along_axis(sorted_values, upper[:, None], axis=1)[:, 0]
+        median_lower = np.take_along_axis(sorted_values, lower[:, None], axis=1)[:, 0]
+        mins = sorted_values[:, 0]
+        maxes = np.take_along_axis(sorted_values, np.maximum(ordered_counts - 1, 0)[:, None], axis=1)[:, 0]
+    else:
+        fifths = ninety_fifths = median_upper = median_lower = mins = maxes = np.zeros(num_rows, dtype=np.int64)
+
+    stats = {header: [] for header in STAT_HEADERS}
+    for i in range(num_rows):
+        n = int(counts[i])
+        m = int(ordered_counts[i])
+        stats["Total"].append(int(totals[i]))
+        stats["Mean"].append(int(totals[i]) / n if n else None)
+        stats["Stdv"].append(float(stdvs[i]) if n > 1 else None)
+        if num_samples > 0:
+            stats["Frequency"].append(round((int(frequencies[i]) / num_samples) * 100, 2))
+        else:
+            stats["Frequency"].append(0)
+        stats["Min"].append(int(mins[i]) if m else None)
+        stats["5th Percentile"].append(int(fifths[i]) if m else None)
+        if not m:
+            stats["Median"].append(None)
+        elif m % 2 == 0:
+            stats["Median"].append((int(median_lower[i]) + int(median_upper[i])) / 2)
+        else:
+            stats["Median"].append(int(median_upper[i]))
+        stats["95th Percentile"].append(int(ninety_fifths[i]) if m else None)
+        stats["Max"].append(int(maxes[i]) if m else None)
+        stats["Count"].append(m)
+    return stats
+
+class SampleMatrix:
+    """
+    The sample block of a tracking workbook held as arrays instead of openpyxl cells: an int32
+    matrix of counts (one row per spore type row, one column per sample) and a separate mask telling
+    blank cells from zeros. That is 5 bytes per count against a few hundred for a Cell.
+
+    Columns are allocated with spare capacity, which doubles when it runs out, so appending a
+    sample is amortized O(1). Rows are the spore type rows of the sheet in order, blank ones
+    included, so row i is workbook row FIRST_SPORE_ROW + i.
+    """
+    __slots__ = ("spore_types", "references", "index", "counts", "valid", "size")
+
+    def __init__(self, spore_types, aliases=None, capacity=MIN_MATRIX_CAPACITY):
+        self.spore_types = list(spore_types)
+        self.references = []
+        self.index = SporeRowIndex(aliases=aliases)
+        self.index.add_labels(enumerate(self.spore_types))
+        self.counts = np.zeros((len(self.spore_types), max(capacity, 1)), dtype=np.int32)
+        self.valid = np.zeros(self.counts.shape, dtype=bool)
+        self.size = 0
+
+    @classmethod
+    def from_sheet(cls, sheet, aliases=None):
+        """
+        Loads the sample block of a sheet in the row 3 header layout in one streaming pass, so it
+        also works on worksheets opened with read_only=True.
+
+        Every column from B up to 'Total' is loaded. Columns without a header are kept as empty
+        slots with a reference of None, such as the ones plan_layout reserves. They are not
+        samples, so num_samples and the statistics leave them out.
+
+        Args:
+            sheet (Worksheet): The tracking sheet.
+            aliases (dict, optional): Alias table used when appending reports, see SporeRowIndex.
+
+        Returns:
+            SampleMatrix: The loaded samples.
+
+        Raises:
+            ValueError: If the 'Total' column header is missing in the Excel sheet.
+        """
+        rows = sheet.iter_rows(min_row=FIRST_SPORE_ROW - 1, values_only=True)
+        header_row = next(rows, ())
+        if "Total" not in header_row:
+            raise ValueError("The 'Total' column header is missing in the Excel sheet.")
+        total_col_index = header_row.index("Total")
+        spore_types = []
+        columns = []
+        for row in rows:
+            spore_types.append(row[0] if row else None)
+            columns.append(row[1:total_col_index])
+        matrix = cls(spore_types, aliases, total_col_index - 1)
+        for row, cells in enumerate(columns):
+            for col, value in enumerate(cells):
+                if value is not None:
+                    matrix.counts[row, col] = int(value)
+                    matrix.valid[row, col] = True
+        matrix.references = list(header_row[1:total_col_index])
+        matrix.size = total_col_index - 1
+        return matrix
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def num_samples(self):
+        """Sample columns with a lab reference number."""
+        return sum(1 for reference in self.references if reference is not None)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the count and mask arrays, spare capacity included."""
+        return self.counts.nbytes + self.valid.nbytes
+
+    def reserve(self, columns):
+        """Makes room for `columns` more samples, doubling the capacity as often as needed."""
+        capacity = self.counts.shape[1]
+        if self.size + columns <= capacity:
+            return
+        while capacity < self.size + columns:
+            capacity *= 2
+        for name in ("counts", "valid"):
+            old = getattr(self, name)
+            grown = np.zeros((old.shape[0], capacity), dtype=old.dtype)
+            grown[:, :self.size] = old[:, :self.size]
+            setattr(self, name, grown)
+        return
+
+    def add_spore_type(self, label):
+        """Adds a spore type row at the bottom and returns its index. Copies the arrays, so it is meant to be rare."""
+        self.spore_types.append(label)
+        row = len(self.spore_types) - 1
+        self.index.add_labels([(row, label)])
+        self.counts = np.vstack([self.counts, np.zeros((1, self.counts.shape[1]), dtype=self.counts.dtype)])
+        self.valid = np.vstack([self.valid, np.zeros((1, self.valid.shape[1]), dtype=bool)])
+        return row
+
+    def append(self, mold_dict, lab_reference_number, add_missing=False):
+        """
+        Appends one sample column, matching spore types to rows the way insert_into_excel does.
+
+        Args:
+            mold_dict (dict): Dictionary mapping mold types to their values.
+            lab_reference_number (str): The lab reference number of the sample.
+            add_missing (bool, optional): Add spore types that match no row as new rows, in
+                mold_dict order, instead of reporting them.
+
+        Returns:
+            list: Spore type names that matched no row, in PDF order.
+        """
+        self.reserve(1)
+        col = self.size
+        if add_missing:
+            for name in mold_dict:
+                if name and name.strip() and self.index.row_for(name) is None:
+                    self.add_spore_type(name)
+        row_values, unmatched = self.index.match(mold_dict)
+        for row, value in row_values.items():
+            if value is not None:
+                self.counts[row, col] = int(value)
+                self.valid[row, col] = True
+        self.references.append(lab_reference_number)
+        self.size += 1
+        return unmatched
+
+    def column(self, col):
+        """Returns sample `col` as (mold_dict, lab_reference_number), with None for blank cells."""
+        mold_dict = {}
+        for row, label in enumerate(self.spore_types):
+            if label is not None and str(label).strip():
+                mold_dict.setdefault(str(label), int(self.counts[row, col]) if self.valid[row, col] else None)
+        return mold_dict, self.references[col]
+
+    def arrays(self, start=0, stop=None):
+        """
+        Returns the (values, present, nonzero) arrays compute_statistics takes for the samples in
+        columns start to stop. Empty slots are left out. Values are widened to int64 so totals
+        cannot overflow.
+        """
+        stop = self.size if stop is None else min(stop, self.size)
+        samples = [col for col in range(start, stop) if self.references[col] is not None]
+        if len(samples) == stop - start:
+            counts = self.counts[:, start:stop]
+            valid = self.valid[:, start:stop]
+        else:
+            counts = self.counts[:, samples]
+            valid = self.valid[:, samples]
+        return counts.astype(np.int64), valid, valid & (counts != 0)
+
+    def statistics(self, start=0, stop=None, legacy_last_column=False):
+        """
+        Computes every statistic column over all the samples in columns start to stop, the last one
+        included. Empty slots are left out.
+
+        Args:
+            start (int, optional): First column.
+            stop (int, optional): Column to stop before, defaults to every column.
+            legacy_last_column (bool, optional): Leave the last sample out of Min through Count, as
+                update_statistics does for a workbook, see compute_statistics.
+
+        Returns:
+            dict: Mapping of statistic header to a list with one value per row (None where undefined).
+        """
+        return compute_statistics(*self.arrays(start, stop), legacy_last_column=legacy_last_column)
+
+    def write_to_sheet(self, sheet, start=0, index=None):
+        """
+        Dumps samples from `start` on into a sheet in the row 3 header layout, e.g. the ones appended
+        since the matrix was loaded with from_sheet. Empty slots are skipped.
+
+        Args:
+            sheet (Worksheet): The tracking sheet, with its spore type rows in column A.
+            start (int, optional): First sample column to write.
+            index (SporeRowIndex, optional): Spore type row index of the sheet, built from column A if omitted.
+
+        Returns:
+            tuple: (sample_slots, unmatched) as returned by insert_columns_into_excel.
+        """
+        columns = [self.column(col) for col in range(start, self.size) if self.references[col] is not None]
+        if not columns:
+            return [], []
+        return insert_columns_into_excel(columns, sheet, index)
+
+def sheet_statistics(sheet):
+    """
+    Computes the statistic columns of a tracking sheet without writing them.
+
+    Only sample columns with a lab reference number count, so the empty slots plan_layout reserves
+    change neither Frequency nor which sample Min through Count leave out. That is the last one,
+    as with the per-row functions (see compute_statistics), unless the workbook is marked with
+    include_last_sample.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+
+    Returns:
+        dict: Mapping of statistic header to a list with one value per row (None where undefined).
+    """
+    return SampleMatrix.from_sheet(sheet).statistics(legacy_last_column=skips_last_sample(sheet.parent))
+
+def skips_last_sample(workbook):
+    """Returns whether the workbook's Min through Count leave out the last sample, as the per-row functions do. True unless include_last_sample marked it."""
+    defined = workbook.defined_names.get(STATISTICS_SCOPE_NAME)
+    return defined is None or defined.attr_text != EVERY_SAMPLE_SCOPE
+
+def include_last_sample(workbook):
+    """
+    Marks a workbook so that Min through Count cover every sample, like the other statistics, in
+    values, statistic formulas and the running statistics alike. Run update_statistics afterwards.
+
+    Args:
+        workbook (Workbook): The tracking workbook.
+
+    Returns:
+        None
+    """
+    workbook.defined_names[STATISTICS_SCOPE_NAME] = DefinedName(STATISTICS_SCOPE_NAME, attr_text=EVERY_SAMPLE_SCOPE)
+    return
+
+def write_statistics(sheet, stats, columns, zero_fill_headers=ZERO_WHEN_EMPTY_HEADERS):
+    """
+    Writes computed statistics back to the sheet, one row at a time across all statistic columns.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        stats (dict): Output of compute_statistics.
+        columns (dict): Mapping of statistic header to its 1-based column number.
+        zero_fill_headers (list, optional): Headers whose empty results are written as 0 instead of blank.
+
+    Returns:
+        None
+    """
+    for offset in range(len(stats["Total"])):
+        row = offset + 4
+        for header in STAT_HEADERS:
+            value = stats[header][offset]
+            if value is None and header in zero_fill_headers:
+                value = 0
+            sheet.cell(row=row, column=columns[header]).value = value
+    return
+
+def statistics_mode(sheet):
+    """
+    Tells whether the statistic columns hold static values or the formulas from write_statistic_formulas.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+
+    Returns:
+        str: "formulas" if the first row's 'Total' cell is a formula, otherwise "values".
+    """
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    if "Total" not in header_row:
+        return "values"
+    value = sheet.cell(row=4, column=header_row.index("Total") + 1).value
+    return "formulas" if isinstance(value, str) and value.startswith("=") else "values"
+
+def sample_range_references(sheet_title, total_col_index, sample_cols, max_row, legacy_last_column=True):
+    """
+    Works out where the defined names the statistic formulas read should point.
+
+    SampleBlock and SampleHeaders cover every column from B up to 'Total', empty slots included,
+    which add nothing to the sums and counts. OrderedBlock, read by Min through Count, stops short
+    of the last sample with a lab reference number, as sheet_statistics does. Without a second
+    sample it points at the spore type labels in column A, which those functions ignore.
+
+    Args:
+        sheet_title (str): Title of the sheet the samples are in.
+        total_col_index (int): The 0-based index of the 'Total' column.
+        sample_cols (list): 1-based column numbers of the samples with a lab reference number.
+        max_row (int): The last row of the sheet.
+        legacy_last_column (bool, optional): False makes OrderedBlock the same as SampleBlock, see skips_last_sample.
+
+    Returns:
+        dict: Defined name -> the reference it should hold.
+    """
+    prefix = quote_sheetname(sheet_title)
+    last_col = get_column_letter(total_col_index)
+    last_row = max(max_row, 4)
+    ordered_col = max(sample_cols) - 1 if sample_cols else 1
+    if not legacy_last_column:
+        ordered = f"{prefix}!$B$4:${last_col}${last_row}"
+    elif ordered_col >= 2:
+        ordered = f"{prefix}!$B$4:${get_column_letter(ordered_col)}${last_row}"
+    else:
+        ordered = f"{prefix}!$A$4:$A${last_row}"
+    return {
+        SAMPLE_BLOCK_NAME: f"{prefix}!$B$4:${last_col}${last_row}",
+        SAMPLE_HEADERS_NAME: f"{prefix}!$B$3:${last_col}$3",
+        ORDERED_BLOCK_NAME: ordered,
+    }
+
+def update_sample_ranges(sheet, total_col_index=None):
+    """
+    Points the defined names the statistic formulas read at the current sample columns and spore
+    type rows, see sample_range_references. Has to run after every insert, since OrderedBlock
+    follows the last sample.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        total_col_index (int, optional): The 0-based index of the 'Total' column, looked up if omitted.
+
+    Returns:
+        None
+    """
+    if total_col_index is None:
+        total_col_index = find_total_count_index(sheet)
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    sample_cols = [col for col in range(2, total_col_index + 1) if header_row[col - 1] is not None]
+    names = sheet.parent.defined_names
+    references = sample_range_references(sheet.title, total_col_index, sample_cols, sheet.max_row, skips_last_sample(sheet.parent))
+    for name, reference in references.items():
+        names[name] = DefinedName(name, attr_text=reference)
+    return
+
+@instrumented("stats", cells=statistic_block_cells)
+def write_statistic_formulas(sheet):
+    """
+    Writes Excel formulas into every statistic column instead of computed values, so Excel keeps the
+    statistics current by itself. They read the sample columns through the defined names from
+    sample_range_references and give the same results as sheet_statistics. Inserting samples only
+    moves the names. Nothing is read from the sample columns.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+
+    Returns:
+        dict: Mapping of statistic header to its 1-based column number.
+    """
+    if find_total_count_index(sheet) < 2:
+        # The names need at least one sample column between column A and 'Total'
+        apply_layout(sheet, plan_layout(sheet, new_samples=1))
+    columns = ensure_stat_columns(sheet)
+    update_sample_ranges(sheet, columns["Total"] - 1)
+    for row in range(4, sheet.max_row + 1):
+        for header in STAT_HEADERS:
+            cell = sheet.cell(row=row, column=columns[header])
+            if cell.value != STAT_FORMULAS[header]:
+                cell.value = STAT_FORMULAS[header]
+    return columns
+
+@instrumented("stats", cells=statistic_block_cells)
+def update_statistics(sheet, mode=None):
+    """
+    Recalculates every statistic column (Total through Count) with a single read of the sample block.
+    Replaces calling clear_old_stats and the ten per-row statistic functions one after another.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        mode (str, optional): "values" or "formulas". Defaults to the mode the sheet already uses,
+            see statistics_mode. In "formulas" mode nothing is computed, see write_statistic_formulas.
+
+    Returns:
+        dict: Mapping of statistic header to the list of values written, one per row, or None in "formulas" mode.
+    """
+    if (mode or statistics_mode(sheet)) == "formulas":
+        write_statistic_formulas(sheet)
+        return None
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    # clear_old_stats only zeroes columns that already exist, freshly created ones stay blank
+    zero_fill_headers = [header for header in ZERO_WHEN_EMPTY_HEADERS if header in header_row]
+    columns = ensure_stat_columns(sheet)
+    stats = sheet_statistics(sheet)
+    write_statistics(sheet, stats, columns, zero_fill_headers)
+    return stats
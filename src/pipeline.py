@@ -0,0 +1,211 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from mold_processing import extract_report
+from extraction_cache import file_digest, extraction_mode
+
+#CONSTANTS
+DEFAULT_TIMEOUT = 120  # seconds a single PDF may spend in a worker
+DEFAULT_QUEUE_SIZE = 16  # extracted reports waiting for the writer before workers are held back
+POLL_INTERVAL = 0.5
+
+def extract_worker(pdf_path, engine="tables", samples="outdoor"):
+    """
+    Runs extract_report in a worker process.
+
+    Errors are returned as text rather than raised, since pdfminer exceptions do not always survive pickling.
+
+    Args:
+        pdf_path (str): Path to the PDF file.
+        engine (str, optional): The find_mold_values engine to use.
+        samples (str, optional): "outdoor", "indoor" or "all" sample columns.
+
+    Returns:
+        tuple: (matches, error) where matches is the extract_report result and error is a message or None.
+    """
+    try:
+        return extract_report(pdf_path, engine, samples), None
+    except Exception as e:
+        return None, f"Failed to read PDF: {e}"
+
+def terminate_executor(executor):
+    """Stops a process pool without waiting for hung or crashed workers."""
+    # ProcessPoolExecutor has no public way to kill a running worker before Python 3.14
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        if process.is_alive():
+            process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+class ExtractionPipeline:
+    """
+    Extracts PDFs across a process pool and hands the results to a single consumer.
+
+    A producer thread keeps at most `workers` PDFs in flight and pushes results into a bounded
+    queue, so a slow writer holds back new submissions. Iterating the pipeline yields
+    (pdf_path, matches, error) in the order of pdf_paths, whatever order the workers finish in,
+    which keeps the workbook identical to a sequential run. Nothing is submitted `workers` or more
+    places past the next PDF the consumer is waiting for, so when one PDF is slow the others wait
+    for it rather than piling up out of order in memory. With an ExtractionCache, PDFs already
+    in the cache are answered from it without reaching the pool, and new results are stored.
+
+    A PDF that runs past the timeout is reported as an error and the pool is restarted. When a
+    worker crashes, the PDFs that were in flight are retried one at a time so only the one that
+    crashes on its own is reported. Either way the rest of the batch carries on.
+
+    Use as a context manager so the pool is always shut down:
+
+        with ExtractionPipeline(pdf_paths, workers=4) as extractions:
+            for pdf_path, matches, error in extractions:
+                ...
+    """
+
+    def __init__(self, pdf_paths, workers=None, timeout=DEFAULT_TIMEOUT, queue_size=DEFAULT_QUEUE_SIZE, cache=None, engine="tables", samples="outdoor"):
+        self.pdf_paths = list(pdf_paths)
+        self.engine = engine
+        self.samples = samples
+        self.mode = extraction_mode(engine, samples)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.timeout = timeout
+        self.cache = cache
+        self.digests = {}
+        self.result_queue = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.window = threading.Condition()
+        self.next_index = 0  # the PDF the consumer is waiting for, submissions stay within `workers` of it
+        self.producer = threading.Thread(target=self._produce, name="pdf-extraction", daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def start(self):
+        """Starts extracting in the background, before the consumer begins iterating."""
+        if not self.producer.is_alive():
+            self.producer.start()
+
+    def close(self):
+        """Stops the producer and shuts the process pool down."""
+        self.stop_event.set()
+        if self.producer.is_alive():
+            self.producer.join()
+
+    def __iter__(self):
+        self.start()
+        finished = {}
+        next_index = 0
+        while next_index < len(self.pdf_paths):
+            item = self.result_queue.get()
+            if item is None:
+                break
+            index, pdf_path, matches, error = item
+            finished[index] = (pdf_path, matches, error)
+            while next_index in finished:
+                result = finished.pop(next_index)
+                next_index += 1
+                # Move the window before yielding, so the pool keeps working while the consumer writes
+                self._advance(next_index)
+                yield result
+        # The producer stopped early, report whatever it never got to
+        for index in range(next_index, len(self.pdf_paths)):
+            if index in finished:
+                yield finished.pop(index)
+            else:
+                yield self.pdf_paths[index], None, "Extraction did not complete."
+
+    def _advance(self, next_index):
+        with self.window:
+            self.next_index = next_index
+            self.window.notify_all()
+
+    def _in_window(self, index):
+        return index < self.next_index + self.workers
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.result_queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        todo = deque(enumerate(self.pdf_paths))
+        suspects = deque()
+        try:
+            while (todo or suspects) and not self.stop_event.is_set():
+                self._run_pool(todo, suspects)
+        finally:
+            self._put(None)
+
+    def _run_pool(self, todo, suspects):
+        """Runs one process pool until the work runs out or the pool has to be restarted."""
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        in_flight = {}
+        restart = False
+        try:
+            while (todo or suspects or in_flight) and not restart and not self.stop_event.is_set():
+                # Suspects from a crashed pool run alone so a second crash identifies the culprit
+                isolating = bool(suspects) or any(entry[3] for entry in in_flight.values())
+                limit = 1 if isolating else self.workers
+                source = suspects if suspects else todo
+                while len(in_flight) < limit and source and self._in_window(source[0][0]):
+                    index, pdf_path = source.popleft()
+                    if self.cache is not None and index not in self.digests:
+                        try:
+                            self.digests[index] = file_digest(pdf_path)
+                        except OSError as e:
+                            self._put((index, pdf_path, None, f"Failed to read PDF: {e}"))
+                            continue
+                        matches = self.cache.get(self.digests[index], self.mode)
+                        if matches is not None:
+                            self._put((index, pdf_path, matches, None))
+                            continue
+                    future = executor.submit(extract_worker, pdf_path, self.engine, self.samples)
+                    in_flight[future] = (index, pdf_path, time.monotonic(), source is suspects)
+                if not in_flight:
+                    if source:
+                        # Every worker is idle until the consumer catches up with the window
+                        with self.window:
+                            self.window.wait_for(lambda: self._in_window(source[0][0]), POLL_INTERVAL)
+                    continue
+                done, _ = wait(in_flight, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, pdf_path, started, isolated = in_flight.pop(future)
+                    try:
+                        matches, error = future.result()
+                    except BrokenProcessPool:
+                        restart = True
+                        if isolated:
+                            self._put((index, pdf_path, None, "Worker process crashed while reading the PDF."))
+                        else:
+                            suspects.append((index, pdf_path))
+                        continue
+                    except Exception as e:
+                        matches, error = None, f"Failed to read PDF: {e}"
+                    if error is None and index in self.digests:
+                        self.cache.put(self.digests[index], matches, self.mode)
+                    if not self._put((index, pdf_path, matches, error)):
+                        return
+                now = time.monotonic()
+                for future, (index, pdf_path, started, isolated) in list(in_flight.items()):
+                    if self.timeout and not future.done() and now - started > self.timeout:
+                        del in_flight[future]
+                        restart = True
+                        self._put((index, pdf_path, None, f"Timed out after {self.timeout} seconds."))
+            # Work still in flight when the pool goes down is innocent and goes back in line
+            for index, pdf_path, started, isolated in sorted(in_flight.values(), reverse=True):
+                (suspects if isolated else todo).appendleft((index, pdf_path))
+        finally:
+            if restart or self.stop_event.is_set():
+                terminate_executor(executor)
+            else:
+                executor.shutdown(wait=True)
@@ -0,0 +1,407 @@
+import json
+import math
+import os
+from bisect import bisect_left, insort
+from mold_processing import (
+    STAT_HEADERS, ZERO_WHEN_EMPTY_HEADERS, STAT_FORMULAS, sample_range_references, skips_last_sample, ensure_stat_columns, find_total_count_index, sheet_statistics, write_statistics,
+    statistics_mode, write_statistic_formulas, statistic_block_cells
+)
+from metrics import instrumented
+
+#CONSTANTS
+STATE_FORMAT_VERSION = 2  # Bump when the sidecar layout changes, older files are rebuilt
+DRIFT_TOLERANCE = 1e-9
+COMPACT_AFTER_LINES = 256  # appended sample lines after which save writes a fresh snapshot, bounding what load replays
+
+def default_state_path(excel_path):
+    """Returns the running statistics file kept next to the workbook, e.g. 'tracking_stats.json'."""
+    return os.path.splitext(excel_path)[0] + "_stats.json"
+
+def read_cell(value):
+    """Returns (value, present, nonzero) for one sample cell, read the same way as read_sample_block."""
+    if value is None:
+        return 0, False, False
+    return int(value), True, value not in (0, "", "0")
+
+class RowAggregate:
+    """
+    Running aggregates for one spore type row: count, total, Welford mean and M2, nonzero count and
+    the sorted values the min, max, median and nearest-rank percentiles are read from.
+    """
+
+    def __init__(self, count=0, total=0, mean=0.0, m2=0.0, nonzero=0, values=None):
+        self.count = count
+        self.total = total
+        self.mean = mean
+        self.m2 = m2
+        self.nonzero = nonzero
+        self.values = values if values is not None else []
+
+    def add(self, value, present, nonzero):
+        """Folds one sample cell into the aggregates."""
+        if nonzero:
+            self.nonzero += 1
+        if not present:
+            return
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        insort(self.values, value)
+
+    def results(self, num_columns, last_value=None):
+        """
+        Returns this row's statistics, matching compute_statistics.
+
+        Args:
+            num_columns (int): Number of sample columns with a lab reference number.
+            last_value (int, optional): The row's value in the last of them, which Min through
+                Count leave out as with legacy_last_column. None if that cell is blank or every
+                sample counts.
+
+        Returns:
+            dict: Mapping of statistic header to its value (None where undefined).
+        """
+        n = self.count
+        values = self.values
+        if num_columns > 0:
+            frequency = round((self.nonzero / num_columns) * 100, 2)
+        else:
+            frequency = 0
+        # Min through Count read the sorted values as if the last column's value was taken out
+        skip = bisect_left(values, last_value) if last_value is not None else n
+        if skip >= n or values[skip] != last_value:
+            skip = n
+        m = n - 1 if skip < n else n
+
+        def ordered(k):
+            return values[k] if k < skip else values[k + 1]
+
+        results = {
+            "Total": self.total,
+            "Mean": self.total / n if n else None,
+            "Stdv": math.sqrt(max(self.m2, 0.0) / (n - 1)) if n > 1 else None,
+            "Frequency": frequency,
+            "Count": m,
+        }
+        if not m:
+            results.update({"Min": None, "5th Percentile": None, "Median": None, "95th Percentile": None, "Max": None})
+            return results
+        if m % 2 == 0:
+            median = (ordered(m // 2 - 1) + ordered(m // 2)) / 2
+        else:
+            median = ordered(m // 2)
+        results.update({
+            "Min": ordered(0),
+            "5th Percentile": ordered(max(math.ceil(0.05 * m) - 1, 0)),
+            "Median": median,
+            "95th Percentile": ordered(max(math.ceil(0.95 * m) - 1, 0)),
+            "Max": ordered(m - 1),
+        })
+        return results
+
+    def to_list(self):
+        return [self.count, self.total, self.mean, self.m2, self.nonzero, self.values]
+
+    @classmethod
+    def from_list(cls, data):
+        return cls(*data)
+
+class RunningStatistics:
+    """
+    Per-row running aggregates for every sample column folded in so far, so appending a report
+    only reads the new columns instead of the whole sample block.
+
+    The state is saved next to the workbook and remembers the spore type rows and the header of
+    every sample column it has seen. If the workbook no longer matches, it is rebuilt from the
+    sheet. Hand edits to existing sample values are not noticed, verify_statistics finds those.
+
+    The file is a JSON lines log: a snapshot of the aggregates, then one line per sample column
+    folded in after it. Appending a report appends a line instead of rewriting every row.
+    """
+
+    def __init__(self, spore_types, samples=None, rows=None):
+        self.spore_types = list(spore_types)
+        self.samples = dict(samples or {})
+        self.rows = rows if rows is not None else [RowAggregate() for _ in self.spore_types]
+        self.unsaved = []  # [col, header, values] per column folded in since the last save
+        self.saved_as = None  # (path, size) of the file this state was last loaded from or saved to
+        self.appended = 0  # sample lines in that file after its snapshot
+
+    @classmethod
+    def from_sheet(cls, sheet, total_col_index=None):
+        """
+        Builds the aggregates from scratch with a single read of the sample block. Empty slots
+        without a lab reference number are left out, as in sheet_statistics.
+
+        Args:
+            sheet (Worksheet): The active worksheet.
+            total_col_index (int, optional): The 0-based index of the 'Total' column, looked up if omitted.
+
+        Returns:
+            RunningStatistics: The rebuilt state.
+        """
+        if total_col_index is None:
+            total_col_index = find_total_count_index(sheet)
+        state = cls(read_spore_types(sheet), read_sample_headers(sheet, total_col_index))
+        offsets = [col - 2 for col in sorted(state.samples)]
+        if offsets:
+            for aggregate, row in zip(state.rows, sheet.iter_rows(min_row=4, max_row=sheet.max_row, min_col=2, max_col=total_col_index, values_only=True)):
+                for offset in offsets:
+                    aggregate.add(*read_cell(row[offset]))
+        return state
+
+    def describes(self, spore_types, samples):
+        """Returns whether every sample column in this state is still in the sheet, under the same header and rows."""
+        if spore_types != self.spore_types:
+            return False
+        return all(samples.get(col) == header for col, header in self.samples.items())
+
+    def add_column(self, sheet, col, header):
+        """
+        Folds one new sample column into the aggregates.
+
+        Args:
+            sheet (Worksheet): The active worksheet.
+            col (int): The 1-based column number of the sample.
+            header (str): The sample's lab reference number.
+
+        Returns:
+            None
+        """
+        column = (value for (value,) in sheet.iter_rows(min_row=4, max_row=sheet.max_row, min_col=col, max_col=col, values_only=True))
+        self.add_values(col, header, column)
+        return
+
+    def add_values(self, col, header, values):
+        """
+        Folds one new sample column into the aggregates from its cell values, one per row from 4 down.
+
+        Args:
+            col (int): The 1-based column number of the sample.
+            header (str): The sample's lab reference number.
+            values (iterable): The column's cell values, None for blank cells.
+
+        Returns:
+            None
+        """
+        values = list(values)
+        for aggregate, value in zip(self.rows, values):
+            aggregate.add(*read_cell(value))
+        self.samples[col] = header
+        self.unsaved.append([col, header, values])
+        return
+
+    def statistics(self, sheet, total_col_index):
+        """
+        Returns the statistics in the same shape as compute_statistics.
+
+        Args:
+            sheet (Worksheet): The active worksheet, only its header row and last sample column are read.
+            total_col_index (int): The 0-based index of the 'Total' column.
+
+        Returns:
+            dict: Mapping of statistic header to a list with one value per row (None where undefined).
+        """
+        stats = {header: [] for header in STAT_HEADERS}
+        samples = read_sample_headers(sheet, total_col_index)
+        legacy = skips_last_sample(sheet.parent)
+        last_column = read_sample_column(sheet, max(samples) if samples and legacy else None)
+        for aggregate, last_value in zip(self.rows, last_column):
+            value, present, nonzero = read_cell(last_value)
+            for header, result in aggregate.results(len(samples), value if present else None).items():
+                stats[header].append(result)
+        return stats
+
+    def save(self, path):
+        """
+        Writes the state to a JSON lines file. If the file is unchanged since this state was loaded
+        from or saved to it, only the sample columns folded in since then are appended, one line
+        each. Otherwise, or once COMPACT_AFTER_LINES have been appended, a snapshot of the aggregates
+        replaces the file in one step.
+
+        Args:
+            path (str): Path of the running statistics file.
+
+        Returns:
+            None
+        """
+        unchanged = self.saved_as is not None and self.saved_as == (os.path.abspath(path), file_size(path))
+        if unchanged and self.appended + len(self.unsaved) <= COMPACT_AFTER_LINES:
+            with open(path, "a", encoding="utf-8") as state_file:
+                for col, header, values in self.unsaved:
+                    state_file.write(json.dumps({"col": col, "header": header, "values": values}, default=str) + "\n")
+            self.appended += len(self.unsaved)
+        else:
+            snapshot = {
+                "version": STATE_FORMAT_VERSION,
+                "spore_types": self.spore_types,
+                "samples": [[col, header] for col, header in sorted(self.samples.items())],
+                "rows": [aggregate.to_list() for aggregate in self.rows],
+            }
+            temp_path = path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as state_file:
+                state_file.write(json.dumps(snapshot) + "\n")
+            os.replace(temp_path, path)
+            self.appended = 0
+        self.unsaved = []
+        self.saved_as = (os.path.abspath(path), file_size(path))
+        return
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a state saved by save, replaying the appended sample columns onto the snapshot.
+
+        Returns:
+            RunningStatistics: The state, or None if the file is missing, unreadable, from another
+                format version or ends in a line cut short by an interrupted save.
+        """
+        try:
+            with open(path, encoding="utf-8") as state_file:
+                snapshot = json.loads(state_file.readline())
+                if snapshot.get("version") != STATE_FORMAT_VERSION:
+                    return None
+                state = cls(
+                    snapshot["spore_types"],
+                    {col: header for col, header in snapshot["samples"]},
+                    [RowAggregate.from_list(row) for row in snapshot["rows"]],
+                )
+                for line in state_file:
+                    if not line.endswith("\n"):
+                        return None
+                    record = json.loads(line)
+                    state.add_values(record["col"], record["header"], record["values"])
+                size = os.fstat(state_file.fileno()).st_size
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        state.appended = len(state.unsaved)
+        state.unsaved = []
+        state.saved_as = (os.path.abspath(path), size)
+        return state
+
+def file_size(path):
+    """Returns the size of a file in bytes, or None if it cannot be read."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+def read_spore_types(sheet):
+    """Returns the stripped spore type label in column A of every row from 4 down."""
+    return [str(value).strip() for (value,) in sheet.iter_rows(min_row=4, max_row=sheet.max_row, max_col=1, values_only=True)]
+
+def read_sample_headers(sheet, total_col_index):
+    """Returns 1-based column number -> header for every occupied sample slot before 'Total'."""
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    return {col: header_row[col - 1] for col in range(2, total_col_index + 1) if header_row[col - 1] is not None}
+
+def read_sample_column(sheet, col):
+    """Returns the cell values of one sample column, one per row from 4 down, all None if col is None."""
+    if col is None:
+        return [None] * max(sheet.max_row - 3, 0)
+    return [value for (value,) in sheet.iter_rows(min_row=4, max_row=sheet.max_row, min_col=col, max_col=col, values_only=True)]
+
+@instrumented("stats", cells=statistic_block_cells)
+def update_statistics_incrementally(sheet, state_path, rebuild=False):
+    """
+    Writes every statistic column like update_statistics, but only reads the sample columns that
+    are new since the saved state. Falls back to a full rebuild when the state is missing or no
+    longer matches the sheet. Save the returned state once the workbook itself has been saved.
+    Sheets using statistic formulas only get their formulas and sample ranges refreshed.
+
+    Args:
+        sheet (Worksheet): The active worksheet, with the new samples already inserted.
+        state_path (str): Path of the running statistics file.
+        rebuild (bool, optional): Ignore the saved state and rebuild it, e.g. after existing sample values changed.
+
+    Returns:
+        RunningStatistics: The updated state, or None if the sheet uses statistic formulas.
+    """
+    if statistics_mode(sheet) == "formulas":
+        write_statistic_formulas(sheet)
+        return None
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    zero_fill_headers = [header for header in ZERO_WHEN_EMPTY_HEADERS if header in header_row]
+    columns = ensure_stat_columns(sheet)
+    total_col_index = columns["Total"] - 1
+    spore_types = read_spore_types(sheet)
+    samples = read_sample_headers(sheet, total_col_index)
+    state = None if rebuild else RunningStatistics.load(state_path)
+    if state is None or not state.describes(spore_types, samples):
+        state = RunningStatistics.from_sheet(sheet, total_col_index)
+    else:
+        for col, header in samples.items():
+            if col not in state.samples:
+                state.add_column(sheet, col, header)
+    write_statistics(sheet, state.statistics(sheet, total_col_index), columns, zero_fill_headers)
+    return state
+
+def values_match(actual, expected):
+    if actual is None or expected is None:
+        return actual == expected
+    return math.isclose(actual, expected, rel_tol=DRIFT_TOLERANCE, abs_tol=DRIFT_TOLERANCE)
+
+def range_drift(sheet, total_col_index):
+    """Returns drift entries for the defined names the statistic formulas read if they do not point where sample_range_references says."""
+    sample_cols = list(read_sample_headers(sheet, total_col_index))
+    wanted = sample_range_references(sheet.title, total_col_index, sample_cols, sheet.max_row, skips_last_sample(sheet.parent))
+    drift = []
+    for name, reference in wanted.items():
+        defined = sheet.parent.defined_names.get(name)
+        actual = defined.attr_text if defined is not None else None
+        if actual != reference:
+            drift.append(("names", 3, None, name, actual, reference))
+    return drift
+
+def verify_statistics(sheet, state=None):
+    """
+    Recomputes every statistic from scratch and compares it with the values written in the sheet
+    and, if given, with the running aggregates. In a sheet using statistic formulas, the formulas
+    and the sample ranges they read are checked instead of the values.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+        state (RunningStatistics, optional): Saved running statistics to check as well.
+
+    Returns:
+        list: One (source, row, spore_type, header, actual, expected) tuple per value that drifted,
+            where source is 'sheet', 'names' or 'state'.
+    """
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    total_col_index = find_total_count_index(sheet)
+    num_samples = sum(1 for header in header_row[1:total_col_index] if header is not None)
+    expected = sheet_statistics(sheet)
+    spore_types = read_spore_types(sheet)
+    drift = []
+    columns = {header: header_row.index(header) + 1 for header in STAT_HEADERS if header in header_row}
+    formulas = statistics_mode(sheet) == "formulas"
+    if formulas:
+        drift.extend(range_drift(sheet, total_col_index))
+    for header in STAT_HEADERS:
+        if header not in columns:
+            drift.append(("sheet", 3, None, header, None, header))
+            continue
+        written = sheet.iter_rows(min_row=4, max_row=sheet.max_row, min_col=columns[header], max_col=columns[header], values_only=True)
+        for offset, (actual,) in enumerate(written):
+            if formulas:
+                if actual != STAT_FORMULAS[header]:
+                    drift.append(("sheet", offset + 4, spore_types[offset], header, actual, STAT_FORMULAS[header]))
+                continue
+            wanted = expected[header][offset]
+            # write_statistics may leave these as 0 instead of blank
+            if wanted is None and actual == 0 and header in ZERO_WHEN_EMPTY_HEADERS:
+                continue
+            if not isinstance(actual, (int, float, type(None))) or not values_match(actual, wanted):
+                drift.append(("sheet", offset + 4, spore_types[offset], header, actual, wanted))
+    if state is not None:
+        if not state.describes(spore_types, read_sample_headers(sheet, total_col_index)) or len(state.samples) != num_samples:
+            drift.append(("state", 3, None, "samples", len(state.samples), num_samples))
+        else:
+            running = state.statistics(sheet, total_col_index)
+            for header in STAT_HEADERS:
+                for offset, (actual, wanted) in enumerate(zip(running[header], expected[header])):
+                    if not values_match(actual, wanted):
+                        drift.append(("state", offset + 4, spore_types[offset], header, actual, wanted))
+    return drift
@@ -0,0 +1,314 @@
+import csv
+import datetime
+import os
+import sqlite3
+import threading
+import numpy as np
+from openpyxl import Workbook, load_workbook
+from mold_processing import (
+    LAB_REFERENCE_NUMBER_STYLE, OTHER_STYLE, STAT_HEADERS, ZERO_WHEN_EMPTY_HEADERS, compute_statistics,
+    find_total_count_index, insert_columns_into_excel, update_statistics, include_last_sample, skips_last_sample
+)
+from spore_index import SporeRowIndex, normalize_spore_type, load_aliases, FIRST_SPORE_ROW
+from duplicates import DuplicateIndex, INGESTED_SHEET, reference_key
+
+#CONSTANTS
+DEFAULT_STORE_PATH = os.environ.get("PDF_TO_EXCEL_STORE", "samples.sqlite3")
+STORE_SCHEMA_VERSION = 1  # Stored in PRAGMA user_version
+
+class SampleStore:
+    """
+    SQLite store of every extracted sample, kept as one row per sample (lab reference number, PDF
+    hash, PDF name, ingestion time) and one row per non-blank count (sample, spore type, count).
+
+    Counts are keyed by spore type first, so all the counts of one spore type are read as one range,
+    and the whole sample matrix is read in a single query without opening a workbook. The tracking
+    workbook is rendered from the store with render_workbook.
+
+    Spore types are stored under their normalized name, with aliases applied when the sample is
+    added, and keep the first name they were seen under as their label. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, aliases=None):
+        self.path = path
+        self.aliases = aliases if aliases is not None else load_aliases()
+        self.lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, STORE_SCHEMA_VERSION):
+                # Unlike the extraction cache, the store cannot simply be rebuilt
+                raise ValueError(f"'{path}' uses sample store schema {version}, expected {STORE_SCHEMA_VERSION}.")
+            self.connection.execute(f"PRAGMA user_version = {STORE_SCHEMA_VERSION}")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                " id INTEGER PRIMARY KEY, lab_reference_number TEXT NOT NULL, reference_key TEXT NOT NULL UNIQUE,"
+                " pdf_digest TEXT, pdf_name TEXT, ingested_at TEXT NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS samples_digest ON samples (pdf_digest)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS spore_types (key TEXT PRIMARY KEY, label TEXT NOT NULL, position INTEGER NOT NULL)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS counts ("
+                " spore_key TEXT NOT NULL, sample_id INTEGER NOT NULL, count INTEGER NOT NULL,"
+                " PRIMARY KEY (spore_key, sample_id)) WITHOUT ROWID"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def spore_key(self, name):
+        """Returns the key a spore type name is stored under."""
+        key = normalize_spore_type(name)
+        return self.aliases.get(key, key)
+
+    def _add_spore_type(self, key, label, known):
+        if key not in known:
+            self.connection.execute(
+                "INSERT INTO spore_types (key, label, position) VALUES (?, ?, ?)", (key, label.strip(), len(known))
+            )
+            known.add(key)
+
+    def add_report(self, matches, digest=None, pdf_name=None):
+        """
+        Appends the samples of one report. A PDF stored before is skipped, as is any sample whose lab
+        reference number is already in the store.
+
+        Args:
+            matches (list): (mold_dict, lab_reference_number) pairs as returned by extract_report.
+            digest (str, optional): SHA-256 hex digest of the PDF.
+            pdf_name (str, optional): File name of the PDF.
+
+        Returns:
+            tuple: (added, skipped) lab reference numbers.
+        """
+        ingested_at = datetime.datetime.now().isoformat(timespec="seconds")
+        added = []
+        skipped = []
+        with self.lock, self.connection:
+            if digest is not None and self.connection.execute("SELECT 1 FROM samples WHERE pdf_digest = ?", (digest,)).fetchone():
+                return added, [str(lab_reference_number) for mold_dict, lab_reference_number in matches]
+            known = {key for (key,) in self.connection.execute("SELECT key FROM spore_types")}
+            for mold_dict, lab_reference_number in matches:
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO samples (lab_reference_number, reference_key, pdf_digest, pdf_name, ingested_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (str(lab_reference_number), reference_key(lab_reference_number), digest, pdf_name, ingested_at),
+                )
+                if not cursor.rowcount:
+                    skipped.append(str(lab_reference_number))
+                    continue
+                counts = {}
+                for name, value in mold_dict.items():
+                    if not name or not name.strip():
+                        continue
+                    key = self.spore_key(name)
+                    self._add_spore_type(key, name, known)
+                    # The first value wins, as in SporeRowIndex.match
+                    if value is not None and key not in counts:
+                        counts[key] = int(value)
+                self.connection.executemany(
+                    "INSERT INTO counts (spore_key, sample_id, count) VALUES (?, ?, ?)",
+                    [(key, cursor.lastrowid, count) for key, count in counts.items()],
+                )
+                added.append(str(lab_reference_number))
+        return added, skipped
+
+    def import_workbook(self, sheet):
+        """
+        Seeds the store from the sample columns of an existing tracking sheet, so the store can take
+        over as the source of truth. PDF hashes are taken from the '_ingested' sheet where it has them.
+
+        Args:
+            sheet (Worksheet): The active worksheet.
+
+        Returns:
+            tuple: (added, skipped) lab reference numbers, as add_report.
+        """
+        digests = {}
+        if INGESTED_SHEET in sheet.parent.sheetnames:
+            for digest, lab_reference_numbers, pdf_name, *rest in sheet.parent[INGESTED_SHEET].iter_rows(min_row=2, values_only=True):
+                for lab_reference_number in str(lab_reference_numbers or "").split("; "):
+                    digests.setdefault(reference_key(lab_reference_number), (digest, pdf_name))
+        total_col_index = find_total_count_index(sheet)
+        labels = [value for (value,) in sheet.iter_rows(min_row=FIRST_SPORE_ROW, max_row=sheet.max_row, max_col=1, values_only=True)]
+        added = []
+        skipped = []
+        if total_col_index < 2:
+            return added, skipped
+        columns = zip(*sheet.iter_rows(min_row=3, max_row=sheet.max_row, min_col=2, max_col=total_col_index, values_only=True))
+        for lab_reference_number, *values in columns:
+            if lab_reference_number is None:
+                continue
+            mold_dict = {str(label): value for label, value in zip(labels, values) if label is not None and str(label).strip()}
+            digest, pdf_name = digests.get(reference_key(lab_reference_number), (None, None))
+            # Several samples of one PDF share its hash, so they are added one by one
+            new, old = self.add_report([(mold_dict, lab_reference_number)], pdf_name=pdf_name)
+            if new and digest is not None:
+                with self.lock, self.connection:
+                    self.connection.execute("UPDATE samples SET pdf_digest = ? WHERE reference_key = ?", (digest, reference_key(lab_reference_number)))
+            added.extend(new)
+            skipped.extend(old)
+        return added, skipped
+
+    def spore_types(self):
+        """Returns (key, label) of every spore type in the order they were first seen."""
+        with self.lock:
+            return self.connection.execute("SELECT key, label FROM spore_types ORDER BY position").fetchall()
+
+    def samples(self):
+        """Returns (id, lab_reference_number, pdf_digest, pdf_name, ingested_at) of every sample in the order they were added."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT id, lab_reference_number, pdf_digest, pdf_name, ingested_at FROM samples ORDER BY id"
+            ).fetchall()
+
+    def spore_counts(self, name):
+        """
+        Reads the counts of one spore type across every sample.
+
+        Args:
+            name (str): A spore type name, matched like a workbook row.
+
+        Returns:
+            dict: Sample id -> count, for the samples with a count.
+        """
+        with self.lock:
+            return dict(self.connection.execute(
+                "SELECT sample_id, count FROM counts WHERE spore_key = ?", (self.spore_key(name),)
+            ).fetchall())
+
+    def sample_matrix(self):
+        """
+        Reads every count into the arrays compute_statistics takes, rows in spore type order and
+        columns in sample order.
+
+        Returns:
+            tuple: (spore_types, samples, values, present, nonzero) where spore_types and samples are
+                as returned by spore_types and samples, and the arrays are as described in read_sample_block.
+        """
+        spore_types = self.spore_types()
+        samples = self.samples()
+        row_of = {key: row for row, (key, label) in enumerate(spore_types)}
+        col_of = {sample[0]: col for col, sample in enumerate(samples)}
+        values = np.zeros((len(spore_types), len(samples)), dtype=np.int64)
+        present = np.zeros(values.shape, dtype=bool)
+        with self.lock:
+            counts = self.connection.execute("SELECT spore_key, sample_id, count FROM counts").fetchall()
+        if counts:
+            keys, sample_ids, numbers = zip(*counts)
+            rows = np.fromiter((row_of[key] for key in keys), dtype=np.int64, count=len(counts))
+            cols = np.fromiter((col_of[sample_id] for sample_id in sample_ids), dtype=np.int64, count=len(counts))
+            values[rows, cols] = numbers
+            present[rows, cols] = True
+        return spore_types, samples, values, present, present & (values != 0)
+
+    def statistics(self):
+        """
+        Computes every statistic column straight from the store, over every sample. render_workbook
+        marks the workbooks it writes to count the same way, so they show the same figures.
+
+        Returns:
+            tuple: (labels, stats) with one spore type label per row and stats as compute_statistics returns it.
+        """
+        spore_types, samples, values, present, nonzero = self.sample_matrix()
+        return [label for key, label in spore_types], compute_statistics(values, present, nonzero)
+
+def new_tracking_workbook(labels):
+    """Returns a workbook laid out like sample/Example.xlsx with the given spore types and no samples yet."""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Sheet1"
+    sheet.cell(row=3, column=1, value="Lab Ref No.").font = LAB_REFERENCE_NUMBER_STYLE
+    for row, label in enumerate(labels, start=FIRST_SPORE_ROW):
+        sheet.cell(row=row, column=1, value=label).font = OTHER_STYLE
+    for offset, header in enumerate(STAT_HEADERS):
+        sheet.cell(row=3, column=2 + offset, value=header).font = LAB_REFERENCE_NUMBER_STYLE
+    sheet.freeze_panes = "B4"
+    return workbook
+
+def render_workbook(store, excel_path, template_path=None, stats_mode=None):
+    """
+    Brings a tracking workbook up to date with the store: samples it does not have yet are added as
+    columns in store order, the '_ingested' sheet is filled in and the statistics are refreshed.
+    Samples already in the workbook are left as they are. The workbook is marked with
+    include_last_sample, so its statistics cover every sample like SampleStore.statistics.
+
+    Args:
+        store (SampleStore): The store to render.
+        excel_path (str): The workbook to refresh, created if it does not exist.
+        template_path (str, optional): Workbook whose spore type rows a new workbook starts from,
+            e.g. sample/Example.xlsx. Without one, the rows are the spore types in the store.
+        stats_mode (str, optional): "values" or "formulas", see update_statistics.
+
+    Returns:
+        tuple: (added, unmatched) lab reference numbers added, and spore types that matched no row.
+    """
+    if os.path.exists(excel_path):
+        workbook = load_workbook(excel_path)
+    elif template_path is not None:
+        template = load_workbook(template_path).active
+        labels = [value for (value,) in template.iter_rows(min_row=FIRST_SPORE_ROW, max_row=template.max_row, max_col=1, values_only=True) if value is not None]
+        workbook = new_tracking_workbook(labels)
+    else:
+        workbook = new_tracking_workbook([label for key, label in store.spore_types()])
+    sheet = workbook.active
+    rescope = skips_last_sample(workbook)
+    if rescope:
+        include_last_sample(workbook)
+    duplicates = DuplicateIndex(workbook, sheet)
+    index = SporeRowIndex(sheet, store.aliases)
+    labels = dict(store.spore_types())
+    new_samples = [sample for sample in store.samples() if duplicates.column_of(sample[1]) is None]
+    columns = []
+    for sample_id, lab_reference_number, digest, pdf_name, ingested_at in new_samples:
+        with store.lock:
+            counts = store.connection.execute("SELECT spore_key, count FROM counts WHERE sample_id = ?", (sample_id,)).fetchall()
+        columns.append(({labels[key]: count for key, count in counts}, lab_reference_number))
+    unmatched = []
+    if columns:
+        sample_slots, unmatched = insert_columns_into_excel(columns, sheet, index)
+        duplicates.add_columns(sample_slots, [lab_reference_number for mold_dict, lab_reference_number in columns])
+        references = {}
+        for sample_id, lab_reference_number, digest, pdf_name, ingested_at in new_samples:
+            if digest is not None:
+                references.setdefault((digest, pdf_name), []).append(lab_reference_number)
+        for (digest, pdf_name), lab_reference_numbers in references.items():
+            duplicates.record(digest, "; ".join(lab_reference_numbers), pdf_name or "")
+    if columns or rescope:
+        update_statistics(sheet, stats_mode)
+        workbook.save(excel_path)
+    return [lab_reference_number for mold_dict, lab_reference_number in columns], unmatched
+
+def write_statistics_csv(labels, stats, output):
+    """
+    Writes store statistics as CSV, one row per spore type with the statistic columns of the workbook.
+
+    Args:
+        labels (list): Spore type labels, one per row.
+        stats (dict): Statistics as compute_statistics returns them.
+        output (file): Open text file to write to.
+
+    Returns:
+        None
+    """
+    writer = csv.writer(output)
+    writer.writerow(["Spore type"] + STAT_HEADERS)
+    for row, label in enumerate(labels):
+        values = []
+        for header in STAT_HEADERS:
+            value = stats[header][row]
+            values.append(0 if value is None and header in ZERO_WHEN_EMPTY_HEADERS else value)
+        writer.writerow([label] + ["" if value is None else value for value in values])
+    return
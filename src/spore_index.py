@@ -0,0 +1,151 @@
+import csv
+import os
+import re
+import unicodedata
+
+#CONSTANTS
+DEFAULT_ALIAS_PATH = os.environ.get(
+    "PDF_TO_EXCEL_ALIASES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "spore_aliases.csv"),
+)
+FIRST_SPORE_ROW = 4
+
+_alias_cache = {}  # path -> (modification time, aliases) of the alias tables read so far
+
+def find_total_count_index(sheet):
+    """
+    Finds the index of the 'Total' column in the Excel sheet.
+
+    Args:
+        sheet (Worksheet): The active worksheet.
+
+    Returns:
+        int: The 0-based index of the 'Total' column.
+
+    Raises:
+        ValueError: If the 'Total' column header is missing in the Excel sheet.
+    """
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    try:
+        total_col_index = header_row.index("Total")
+    except ValueError:
+        raise ValueError("The 'Total' column header is missing in the Excel sheet.")
+    return total_col_index
+
+def normalize_spore_type(name):
+    """
+    Reduces a spore type name to the form rows and PDF names are matched on.
+
+    Case, accents, commas and runs of whitespace are ignored, as is a plural 's' at the end of a
+    word, so 'Ascospores,  non-specified' and 'ascospore non-specified' compare equal.
+
+    Args:
+        name (str): A spore type as written in the PDF, the workbook or the alias table.
+
+    Returns:
+        str: The normalized name.
+    """
+    text = unicodedata.normalize("NFKD", str(name))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = text.casefold().replace(",", " ")
+    text = re.sub(r"\s*([/-])\s*", r"\1", text)
+    text = re.sub(r"(\w{3,})s\b", r"\1", text)
+    return " ".join(text.split())
+
+def load_aliases(path=DEFAULT_ALIAS_PATH):
+    """
+    Reads the alias table, a CSV file with 'alias' and 'spore_type' columns. Lines starting
+    with '#' are comments.
+
+    The table is kept per path and only read again once the file has changed, since every
+    SporeRowIndex built without an explicit table asks for it. Callers share the returned dict and
+    must not modify it.
+
+    Args:
+        path (str, optional): Path of the alias CSV file.
+
+    Returns:
+        dict: Normalized alias -> normalized workbook spore type. Empty if the file does not exist.
+    """
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _alias_cache.get(path)
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+    aliases = {}
+    with open(path, newline="", encoding="utf-8") as alias_file:
+        lines = (line for line in alias_file if not line.lstrip().startswith("#"))
+        for row in csv.DictReader(lines):
+            alias = (row.get("alias") or "").strip()
+            spore_type = (row.get("spore_type") or "").strip()
+            if alias and spore_type:
+                aliases[normalize_spore_type(alias)] = normalize_spore_type(spore_type)
+    _alias_cache[path] = (modified, aliases)
+    return aliases
+
+class SporeRowIndex:
+    """
+    Maps spore type names to their workbook row, built from column A once and reused for every
+    sample inserted into the sheet. Column insertions do not affect it, but it has to be rebuilt
+    if rows are added or removed.
+    """
+
+    def __init__(self, sheet=None, aliases=None):
+        self.aliases = aliases if aliases is not None else load_aliases()
+        self.rows = {}
+        if sheet is not None:
+            labels = sheet.iter_rows(min_row=FIRST_SPORE_ROW, max_row=sheet.max_row, max_col=1, values_only=True)
+            self.add_labels((row, value) for row, (value,) in enumerate(labels, start=FIRST_SPORE_ROW))
+
+    def add_labels(self, labels):
+        """
+        Indexes spore type labels read from column A some other way than through a worksheet.
+
+        Args:
+            labels (iterable): (row, value) pairs in row order.
+
+        Returns:
+            None
+        """
+        for row, value in labels:
+            if value is None or not str(value).strip():
+                continue
+            # The first row wins if two names normalize the same way
+            self.rows.setdefault(normalize_spore_type(value), row)
+        return
+
+    def row_for(self, name):
+        """Returns the row of a spore type name, or None if neither the name nor an alias of it is in the sheet."""
+        key = normalize_spore_type(name)
+        row = self.rows.get(key)
+        if row is None and key in self.aliases:
+            row = self.rows.get(self.aliases[key])
+        return row
+
+    def match(self, mold_dict):
+        """
+        Looks up the row of every spore type in a mold_dict.
+
+        Args:
+            mold_dict (dict): Dictionary mapping mold types to their values.
+
+        Returns:
+            tuple: (row_values, unmatched)
+                row_values (dict): Workbook row -> value.
+                unmatched (list): Names with a count that matched no row, in PDF order.
+        """
+        row_values = {}
+        unmatched = []
+        for name, value in mold_dict.items():
+            if not name or not name.strip():
+                continue
+            row = self.row_for(name)
+            if row is None:
+                if value is not None:
+                    unmatched.append(name)
+                continue
+            if row_values.get(row) is None:
+                row_values[row] = value
+        return row_values, unmatched
@@ -0,0 +1,400 @@
+import ctypes
+import ctypes.util
+import datetime
+import json
+import os
+import select
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from openpyxl import load_workbook
+from batch import (
+    collect_pdf_paths, extract_sequentially, insert_report, make_result, refresh_statistics,
+    STATUS_SUCCESS, STATUS_SKIPPED, STATUS_ERROR
+)
+from mold_processing import template_hits
+from extraction_cache import file_digest
+from spore_index import SporeRowIndex, load_aliases, DEFAULT_ALIAS_PATH
+from duplicates import DuplicateIndex
+from metrics import measure, record_file, workbook_cells
+
+#CONSTANTS
+DEFAULT_DEBOUNCE = 5.0  # seconds without a new report before the workbook is saved
+DEFAULT_MAX_DELAY = 120.0  # seconds an inserted report may wait for a save while files keep arriving
+DEFAULT_POLL_INTERVAL = 2.0
+SETTLE_TIME = 1.0  # seconds a PDF must be left unchanged before it is read, so half-copied files are not picked up
+IDLE_STATUS_INTERVAL = 30.0  # seconds between status file updates while nothing happens
+THROUGHPUT_WINDOW = 300.0  # seconds of recent files the throughput is averaged over
+OUTCOME_FOLDERS = {STATUS_SUCCESS: "processed", STATUS_SKIPPED: "skipped", STATUS_ERROR: "failed"}
+IN_CREATE = 0x00000100
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+def default_status_path(excel_path):
+    """Returns the status file written next to the workbook, e.g. 'tracking_watch.json'."""
+    return os.path.splitext(excel_path)[0] + "_watch.json"
+
+def save_workbook_atomically(workbook, excel_path):
+    """
+    Saves the workbook to a temporary file in the same folder and renames it over the original, so
+    the workbook on disk is never left half-written.
+
+    Args:
+        workbook (Workbook): The workbook to save.
+        excel_path (str): Path of the workbook.
+
+    Returns:
+        None
+    """
+    directory = os.path.dirname(os.path.abspath(excel_path))
+    handle, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=directory)
+    os.close(handle)
+    try:
+        workbook.save(temp_path)
+        os.replace(temp_path, excel_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return
+
+def move_to_folder(path, folder):
+    """Moves a file into a folder, adding ' (1)', ' (2)', ... to the name if it is already taken. Returns the new path."""
+    os.makedirs(folder, exist_ok=True)
+    base, extension = os.path.splitext(os.path.basename(path))
+    target = os.path.join(folder, base + extension)
+    number = 1
+    while os.path.exists(target):
+        target = os.path.join(folder, f"{base} ({number}){extension}")
+        number += 1
+    shutil.move(path, target)
+    return target
+
+def file_signature(path):
+    """Returns (modification time, size) of a file, used to notice when someone else saved the workbook."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+class PollingWakeup:
+    """Waits out the poll interval between inbox scans. Used where inotify is not available."""
+
+    def __init__(self, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+
+    def wait(self, timeout):
+        """Sleeps until the timeout or the poll interval, whichever comes first."""
+        time.sleep(min(timeout, self.poll_interval))
+        return
+
+    def wake(self):
+        # A stop is noticed after at most one poll interval
+        return
+
+    def close(self):
+        return
+
+class InotifyWakeup:
+    """
+    Sleeps until a file is written or moved into the inbox, using Linux inotify through the C library.
+
+    Raises OSError where inotify is not available, in which case PollingWakeup should be used.
+    """
+
+    def __init__(self, directory):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"Cannot watch '{directory}'")
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+
+    def wait(self, timeout):
+        """Sleeps until the timeout, an inbox event or wake, whichever comes first."""
+        ready, _, _ = select.select([self.fd, self.wake_read], [], [], max(timeout, 0))
+        # Only the wakeup matters, the inbox is rescanned anyway
+        for fd in ready:
+            try:
+                while os.read(fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+        return
+
+    def wake(self):
+        os.write(self.wake_write, b"x")
+
+    def close(self):
+        for fd in (self.fd, self.wake_read, self.wake_write):
+            os.close(fd)
+        return
+
+class WatchService:
+    """
+    Watches an inbox folder and inserts every PDF dropped into it into one workbook, which stays
+    loaded between files.
+
+    Inserts are saved together once no new report has arrived for `debounce` seconds (or once the
+    oldest unsaved report has waited `max_delay` seconds), so a burst of files costs one save. The
+    workbook is written to a temporary file and renamed over the original. A PDF is moved into the
+    'processed' folder only after the save that holds it, 'skipped' and 'failed' PDFs are moved
+    right away. If the workbook is changed on disk while the service holds unsaved reports, it is
+    reloaded and those reports are inserted again instead of overwriting the change.
+
+    A JSON status file with the queue depth, counts and throughput is rewritten as work happens.
+    """
+
+    def __init__(self, inbox, excel_path, outcome_root=None, status_path=None, debounce=DEFAULT_DEBOUNCE, max_delay=DEFAULT_MAX_DELAY,
+                 poll_interval=DEFAULT_POLL_INTERVAL, polling=False, cache=None, engine="tables", samples="outdoor",
+                 alias_path=DEFAULT_ALIAS_PATH, duplicate_policy="skip", stats_mode=None, state_path=None):
+        self.inbox = os.path.abspath(inbox)
+        self.excel_path = excel_path
+        outcome_root = outcome_root or self.inbox
+        self.outcome_folders = {status: os.path.join(outcome_root, name) for status, name in OUTCOME_FOLDERS.items()}
+        self.status_path = status_path or default_status_path(excel_path)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.cache = cache
+        self.engine = engine
+        self.samples = samples
+        self.aliases = load_aliases(alias_path)
+        self.duplicate_policy = duplicate_policy
+        self.stats_mode = stats_mode
+        self.state_path = state_path
+        self.wakeup = None
+        if not polling:
+            try:
+                self.wakeup = InotifyWakeup(self.inbox)
+            except (OSError, AttributeError):
+                pass
+        if self.wakeup is None:
+            self.wakeup = PollingWakeup(poll_interval)
+        self.stopping = False
+        self.workbook = None
+        self.queue = deque()
+        self.pending = []  # (pdf_path, result) inserted but not saved yet
+        self.first_unsaved = None
+        self.last_insert = None
+        self.counts = {status: 0 for status in OUTCOME_FOLDERS}
+        self.saves = 0
+        self.finished = deque()
+        self.started_at = time.time()
+        self.last_save_at = None
+        self.last_error = None
+        self.status_written = 0
+
+    def load(self):
+        """Loads the workbook and the indexes built from it."""
+        with measure("load") as counters:
+            self.workbook = load_workbook(self.excel_path)
+            counters["cells"] = workbook_cells(self.workbook)
+        self.sheet = self.workbook.active
+        self.index = SporeRowIndex(self.sheet, self.aliases)
+        self.duplicates = DuplicateIndex(self.workbook, self.sheet)
+        self.signature = file_signature(self.excel_path)
+        return
+
+    def scan(self):
+        """Queues PDFs in the inbox that are not queued or pending yet and have stopped changing. Returns seconds until the next one settles, or None."""
+        known = set(self.queue) | {pdf_path for pdf_path, result in self.pending}
+        now = time.time()
+        next_settle = None
+        for pdf_path in collect_pdf_paths([self.inbox]):
+            if pdf_path in known:
+                continue
+            try:
+                age = now - os.path.getmtime(pdf_path)
+            except OSError:
+                continue
+            if age >= SETTLE_TIME:
+                self.queue.append(pdf_path)
+            else:
+                wait = SETTLE_TIME - age
+                next_settle = wait if next_settle is None else min(next_settle, wait)
+        return next_settle
+
+    def process(self, pdf_path):
+        """Extracts and inserts one PDF, moving it to its outcome folder unless it still has to be saved."""
+        pdf_path, matches, error = next(extract_sequentially([pdf_path], self.cache, self.engine, self.samples))
+        if error is not None:
+            result = make_result(pdf_path, STATUS_ERROR, message=error)
+        else:
+            try:
+                digest = file_digest(pdf_path)
+                result = insert_report(self.sheet, pdf_path, matches, self.index, self.duplicates, self.duplicate_policy, digest)
+            except OSError as e:
+                result = make_result(pdf_path, STATUS_ERROR, message=f"Failed to read PDF: {e}")
+        record_file(pdf_path, result)
+        if result["status"] == STATUS_SUCCESS:
+            self.pending.append((pdf_path, result))
+            now = time.time()
+            self.first_unsaved = self.first_unsaved or now
+            self.last_insert = now
+        else:
+            self.finish(pdf_path, result)
+        return result
+
+    def finish(self, pdf_path, result):
+        """Moves a PDF to its outcome folder and counts it."""
+        try:
+            move_to_folder(pdf_path, self.outcome_folders[result["status"]])
+        except OSError as e:
+            self.last_error = f"Could not move '{pdf_path}': {e}"
+            print(self.last_error)
+        self.counts[result["status"]] += 1
+        self.finished.append(time.time())
+        print(f"{result['status']:<8} {pdf_path} {result['message']}".rstrip())
+        return
+
+    def save_due(self):
+        """Returns whether the unsaved reports should be saved now."""
+        if not self.pending:
+            return False
+        now = time.time()
+        if now - self.first_unsaved >= self.max_delay:
+            return True
+        return not self.queue and now - self.last_insert >= self.debounce
+
+    def save(self):
+        """
+        Refreshes the statistics and saves every unsaved report in one atomic save, then moves their PDFs.
+
+        Returns:
+            bool: Whether the workbook was saved. On a permission error the reports stay pending and
+                the save is retried later. If the workbook changed on disk, it is reloaded and the
+                pending PDFs are queued again.
+        """
+        if file_signature(self.excel_path) != self.signature:
+            print(f"'{self.excel_path}' was changed by someone else, reloading it and inserting {len(self.pending)} reports again")
+            self.queue.extendleft(reversed([pdf_path for pdf_path, result in self.pending]))
+            self.pending = []
+            self.first_unsaved = None
+            self.load()
+            return False
+        state = refresh_statistics(self.sheet, self.stats_mode, self.state_path, rebuild=self.duplicate_policy == "replace")
+        try:
+            with measure("save") as counters:
+                save_workbook_atomically(self.workbook, self.excel_path)
+                counters["cells"] = workbook_cells(self.workbook)
+        except PermissionError:
+            self.last_error = f"Permission denied: Unable to save to '{self.excel_path}'. Please close the file if it is open."
+            print(self.last_error)
+            # Try again after another debounce interval
+            self.last_insert = time.time()
+            self.first_unsaved = self.last_insert
+            return False
+        if state is not None:
+            state.save(self.state_path)
+        self.signature = file_signature(self.excel_path)
+        self.saves += 1
+        self.last_save_at = time.time()
+        pending, self.pending, self.first_unsaved = self.pending, [], None
+        for pdf_path, result in pending:
+            self.finish(pdf_path, result)
+        return True
+
+    def throughput(self):
+        """Returns files finished per minute over the last THROUGHPUT_WINDOW seconds."""
+        now = time.time()
+        while self.finished and now - self.finished[0] > THROUGHPUT_WINDOW:
+            self.finished.popleft()
+        window = min(THROUGHPUT_WINDOW, now - self.started_at)
+        return round(len(self.finished) / window * 60, 2) if window > 0 else 0.0
+
+    def write_status(self, state):
+        """Rewrites the status file in one step."""
+        def timestamp(seconds):
+            return datetime.datetime.fromtimestamp(seconds).isoformat(timespec="seconds") if seconds else None
+        status = {
+            "state": state,
+            "inbox": self.inbox,
+            "workbook": os.path.abspath(self.excel_path),
+            "watching_with": "inotify" if isinstance(self.wakeup, InotifyWakeup) else "polling",
+            "queue_depth": len(self.queue),
+            "unsaved_reports": len(self.pending),
+            "processed": self.counts[STATUS_SUCCESS],
+            "skipped": self.counts[STATUS_SKIPPED],
+            "failed": self.counts[STATUS_ERROR],
+            "saves": self.saves,
+            "files_per_minute": self.throughput(),
+            "started_at": timestamp(self.started_at),
+            "last_save_at": timestamp(self.last_save_at),
+            "updated_at": timestamp(time.time()),
+            "last_error": self.last_error,
+            "templates": template_hits(),
+        }
+        temp_path = self.status_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as status_file:
+            json.dump(status, status_file, indent=2)
+        os.replace(temp_path, self.status_path)
+        self.status_written = time.time()
+        return
+
+    def stop(self):
+        """Asks run to save what is pending and return. Safe to call from a signal handler."""
+        self.stopping = True
+        self.wakeup.wake()
+
+    def run(self, once=False):
+        """
+        Processes the inbox until stop is called, or until it is empty when once is set, saving
+        whatever is still pending before returning. If that save fails once more, the unsaved
+        reports are given up and their PDFs are left in the inbox.
+
+        Args:
+            once (bool, optional): Process the PDFs already in the inbox and return.
+
+        Returns:
+            dict: Number of PDFs per status.
+        """
+        if self.workbook is None:
+            self.load()
+        try:
+            while not self.stopping:
+                next_settle = self.scan()
+                if self.queue:
+                    if not self.pending and file_signature(self.excel_path) != self.signature:
+                        self.load()
+                    self.process(self.queue.popleft())
+                    if self.save_due():
+                        self.save()
+                    self.write_status("processing")
+                    continue
+                if self.save_due():
+                    self.save()
+                    self.write_status("idle")
+                    continue
+                if once and next_settle is None and not self.pending:
+                    break
+                timeout = IDLE_STATUS_INTERVAL if next_settle is None else next_settle
+                if self.pending:
+                    timeout = min(timeout, self.last_insert + self.debounce - time.time(), self.first_unsaved + self.max_delay - time.time())
+                if time.time() - self.status_written >= IDLE_STATUS_INTERVAL:
+                    self.write_status("idle")
+                if once and next_settle is None:
+                    # Nothing else will arrive, no need to wait for the debounce
+                    if self.save() or self.queue:
+                        continue
+                    # The workbook could not be written, retry once below rather than spinning on it
+                    break
+                self.wakeup.wait(max(timeout, 0))
+            # PDFs not reached yet stay in the inbox for the next run
+            self.queue.clear()
+            if self.pending and not self.save() and self.queue:
+                # The workbook was changed on disk and reloaded, so its reports go in again
+                while self.queue:
+                    self.process(self.queue.popleft())
+                self.save()
+            if self.pending:
+                print(f"{len(self.pending)} reports were not saved, their PDFs stay in '{self.inbox}' for the next run")
+                self.pending = []
+        finally:
+            self.write_status("stopped")
+            self.wakeup.close()
+        return dict(self.counts)
@@ -0,0 +1,628 @@
+import datetime
+import html
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+from xml.etree import ElementTree
+from openpyxl.utils.cell import get_column_letter, column_index_from_string
+from mold_processing import (
+    STAT_HEADERS, ZERO_WHEN_EMPTY_HEADERS, ORDERED_BLOCK_NAME, STATISTICS_SCOPE_NAME, EVERY_SAMPLE_SCOPE,
+    sample_range_references, sample_block_arrays, compute_statistics
+)
+from spore_index import SporeRowIndex, FIRST_SPORE_ROW
+from duplicates import INGESTED_SHEET, INGESTED_HEADERS, reference_key
+from running_stats import RunningStatistics
+from batch import make_result, STATUS_SUCCESS, STATUS_SKIPPED
+
+#CONSTANTS
+CHUNK_SIZE = 1 << 16
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+ROW_START = re.compile(rb"<row[\s>/]")
+ROW_TAG = re.compile(rb"<row\b([^>]*?)(/?)>")
+CELL = re.compile(rb"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+# Excel and openpyxl both write the reference first, which lets most cells be read with one findall
+CELL_WITH_REFERENCE = re.compile(rb'<c r="([A-Z]+)(\d+)"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+ATTRIBUTE = re.compile(rb'([\w:]+)="([^"]*)"')
+TYPE_ATTRIBUTE = re.compile(rb'\st="([^"]*)"')
+STYLE_ATTRIBUTE = re.compile(rb'\ss="([^"]*)"')
+VALUE = re.compile(rb"<v(?:\s[^>]*)?>(.*?)</v>", re.S)
+TEXT = re.compile(rb"<t(?:\s[^>]*)?>(.*?)</t>", re.S)
+CELL_REFERENCE = re.compile(rb"([A-Z]+)(\d+)")
+ORDERED_NAME_ELEMENT = re.compile(rb'(<definedName\b[^>]*\bname="' + ORDERED_BLOCK_NAME.encode() + rb'"[^>]*>)(.*?)(</definedName>)', re.S)
+
+class PatchNotPossible(ValueError):
+    """Raised when a workbook needs a change the patcher does not make, so the openpyxl path has to be used."""
+
+class StringTable:
+    """The workbook's shared strings, with new strings appended at the end."""
+
+    def __init__(self, strings, path):
+        self.strings = strings
+        self.path = path
+        self.positions = {}
+        for position, text in enumerate(strings):
+            self.positions.setdefault(text, position)
+        self.added = []
+        self.references = 0
+
+    def add_cells(self, writes):
+        """
+        Registers the text of every cell about to be written, so the shared strings part can be
+        finished before any worksheet is streamed.
+
+        Args:
+            writes (dict): Row -> {col: value} of cells to write.
+
+        Returns:
+            None
+        """
+        if self.path is None:
+            return
+        for row_writes in writes.values():
+            for text in row_writes.values():
+                if not isinstance(text, str):
+                    continue
+                self.references += 1
+                if text not in self.positions:
+                    self.positions[text] = len(self.strings)
+                    self.strings.append(text)
+                    self.added.append(text)
+        return
+
+    def patch(self, data):
+        """Returns the sharedStrings part with the new strings appended and its counts updated."""
+        if not self.added:
+            return data
+        tag_end = data.index(b">", data.index(b"<sst"))
+        root_tag = data[:tag_end]
+        for name, increase in ((b"count", self.references), (b"uniqueCount", len(self.added))):
+            match = re.search(rb"\s" + name + rb'="(\d+)"', root_tag)
+            if match:
+                number = str(int(match.group(1)) + increase).encode()
+                root_tag = root_tag[:match.start(1)] + number + root_tag[match.end(1):]
+        items = b"".join(b'<si><t xml:space="preserve">' + escape(text) + b"</t></si>" for text in self.added)
+        rest = data[tag_end:]
+        if rest.startswith(b"/>"):
+            return root_tag + b">" + items + b"</sst>" + rest[2:]
+        closing = rest.rindex(b"</sst>")
+        return root_tag + rest[:closing] + items + rest[closing:]
+
+def escape(text):
+    return html.escape(str(text), quote=False).encode("utf-8")
+
+COLUMN_NUMBERS = {}
+
+def column_number(letters):
+    if letters not in COLUMN_NUMBERS:
+        COLUMN_NUMBERS[letters] = column_index_from_string(letters.decode())
+    return COLUMN_NUMBERS[letters]
+
+def split_reference(reference):
+    match = CELL_REFERENCE.fullmatch(reference)
+    if match is None:
+        raise PatchNotPossible(f"Unsupported cell reference '{reference.decode(errors='replace')}'.")
+    return column_index_from_string(match.group(1).decode()), int(match.group(2))
+
+def attributes(tag_attributes):
+    return dict(ATTRIBUTE.findall(tag_attributes))
+
+def iter_sheet_parts(stream):
+    """
+    Splits worksheet XML into <row> elements and the markup between them, reading it in chunks.
+
+    Args:
+        stream (file): The worksheet part opened from the zip archive.
+
+    Yields:
+        tuple: (row_number, row_xml) for every row, or (None, markup) for everything else.
+    """
+    buffer = b""
+    eof = False
+    while True:
+        match = ROW_START.search(buffer)
+        if match is None:
+            if eof:
+                if buffer:
+                    yield None, buffer
+                return
+            # Hold back a few bytes in case '<row' is split across chunks
+            if len(buffer) > 5:
+                yield None, buffer[:-5]
+                buffer = buffer[-5:]
+            chunk = stream.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        if match.start():
+            yield None, buffer[:match.start()]
+            buffer = buffer[match.start():]
+        end = row_end(buffer)
+        while end is None and not eof:
+            chunk = stream.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            end = row_end(buffer)
+        if end is None:
+            raise PatchNotPossible("The worksheet XML ends inside a row.")
+        row_xml = buffer[:end]
+        buffer = buffer[end:]
+        row_attributes = attributes(ROW_TAG.match(row_xml).group(1))
+        if b"r" not in row_attributes:
+            raise PatchNotPossible("The worksheet has rows without row numbers.")
+        yield int(row_attributes[b"r"]), row_xml
+
+def row_end(buffer):
+    tag_end = buffer.find(b">")
+    if tag_end == -1:
+        return None
+    if buffer[tag_end - 1:tag_end] == b"/":
+        return tag_end + 1
+    closing = buffer.find(b"</row>", tag_end)
+    return closing + len(b"</row>") if closing != -1 else None
+
+def has_leading_references(row_xml):
+    return row_xml.count(b"<c ") == row_xml.count(b'<c r="')
+
+def read_cells(row_xml):
+    """
+    Returns (col, raw_attributes, body) for every cell of a row element, where raw_attributes is
+    the attribute text after the cell reference.
+    """
+    start = ROW_TAG.match(row_xml).end()
+    if has_leading_references(row_xml):
+        return [(column_number(letters), raw_attributes, body) for letters, row, raw_attributes, body in CELL_WITH_REFERENCE.findall(row_xml, start)]
+    cells = []
+    for match in CELL.finditer(row_xml, start):
+        cell_attributes = attributes(match.group(1))
+        if b"r" not in cell_attributes:
+            raise PatchNotPossible("The worksheet has cells without references.")
+        col, row = split_reference(cell_attributes[b"r"])
+        cells.append((col, match.group(1), match.group(2) or b""))
+    return cells
+
+def cell_value(raw_attributes, body, shared_strings):
+    """Returns a cell's value the way openpyxl reads it, the cached result for formulas."""
+    if not body:
+        return None
+    if b"t=" not in raw_attributes and body[:3] == b"<v>" and body[-4:] == b"</v>":
+        text = body[3:-4]
+        return float(text) if (b"." in text or b"E" in text or b"e" in text) else int(text)
+    match = TYPE_ATTRIBUTE.search(raw_attributes) if b"t=" in raw_attributes else None
+    cell_type = match.group(1) if match else b"n"
+    if cell_type == b"inlineStr":
+        return html.unescape(b"".join(TEXT.findall(body)).decode("utf-8"))
+    match = VALUE.search(body)
+    if match is None:
+        return None
+    text = match.group(1).decode("utf-8")
+    if cell_type == b"s":
+        return shared_strings[int(text)]
+    if cell_type == b"b":
+        return text == "1"
+    if cell_type in (b"str", b"e"):
+        return html.unescape(text)
+    if "." in text or "E" in text or "e" in text:
+        return float(text)
+    return int(text)
+
+def make_cell(col, row, style, value, strings):
+    """Builds the XML of one cell, keeping its style. Text must already be in the string table, see StringTable.add_cells."""
+    reference = f"{get_column_letter(col)}{row}".encode()
+    style_attribute = b' s="' + style + b'"' if style else b""
+    if value is None:
+        return b'<c r="' + reference + b'"' + style_attribute + b"/>"
+    if isinstance(value, str):
+        if strings.path is None:
+            return b'<c r="' + reference + b'"' + style_attribute + b' t="inlineStr"><is><t xml:space="preserve">' + escape(value) + b"</t></is></c>"
+        return b'<c r="' + reference + b'"' + style_attribute + b' t="s"><v>' + str(strings.positions[value]).encode() + b"</v></c>"
+    number = repr(float(value)) if isinstance(value, float) else str(int(value))
+    return b'<c r="' + reference + b'"' + style_attribute + b"><v>" + number.encode() + b"</v></c>"
+
+def cell_style(raw_attributes):
+    match = STYLE_ATTRIBUTE.search(raw_attributes)
+    return match.group(1) if match else None
+
+def rewrite_row(row, row_xml, updates, strings):
+    """
+    Returns a row element with the cells in updates replaced or added and every other cell left as it was.
+    New cells take the style of the nearest cell to their left, so they look like the column before them.
+    """
+    if row_xml is None:
+        cells = [make_cell(col, row, None, updates[col], strings) for col in sorted(updates) if updates[col] is not None]
+        return f'<row r="{row}">'.encode() + b"".join(cells) + b"</row>"
+    tag = ROW_TAG.match(row_xml)
+    # spans is only a hint and would be wrong once cells are added
+    open_tag = re.sub(rb'\sspans="[^"]*"', b"", tag.group(0)).replace(b"/>", b">")
+    body = b"" if tag.group(2) else row_xml[tag.end():-len(b"</row>")]
+    if not has_leading_references(body):
+        return rewrite_row_slowly(row, open_tag, body, updates, strings)
+    suffix = str(row).encode() + b'"'
+    edits = []
+    for col in sorted(updates):
+        position = body.find(b'<c r="' + get_column_letter(col).encode() + suffix)
+        if position != -1:
+            cell = CELL.match(body, position)
+            edits.append((position, cell.end(), col, cell_style(cell.group(1))))
+            continue
+        if updates[col] is None:
+            continue
+        # Find the nearest cell to the left, the new cell goes right after it
+        insert_at, style = 0, None
+        for left in range(col - 1, 0, -1):
+            position = body.find(b'<c r="' + get_column_letter(left).encode() + suffix)
+            if position != -1:
+                cell = CELL.match(body, position)
+                insert_at, style = cell.end(), cell_style(cell.group(1))
+                break
+        edits.append((insert_at, insert_at, col, style))
+    pieces = []
+    cursor = 0
+    for start, end, col, style in sorted(edits, key=lambda edit: (edit[0], edit[2])):
+        pieces.append(body[cursor:start])
+        pieces.append(make_cell(col, row, style, updates[col], strings))
+        cursor = max(cursor, end)
+    pieces.append(body[cursor:])
+    return open_tag + b"".join(pieces) + b"</row>"
+
+def rewrite_row_slowly(row, open_tag, body, updates, strings):
+    """rewrite_row for rows whose cells do not start with their reference, parsing every cell."""
+    cells = {}
+    styles = {}
+    for match in CELL.finditer(body):
+        col, cell_row = split_reference(attributes(match.group(1)).get(b"r", b""))
+        cells[col] = match.group(0)
+        styles[col] = cell_style(match.group(1))
+    for col in sorted(updates):
+        style = styles.get(col)
+        if style is None:
+            left = [other for other in styles if other < col and styles[other]]
+            style = styles[max(left)] if left else None
+        if updates[col] is None and col not in cells:
+            continue
+        cells[col] = make_cell(col, row, style, updates[col], strings)
+        styles.setdefault(col, style)
+    return open_tag + b"".join(cells[col] for col in sorted(cells)) + b"</row>"
+
+def rewrite_sheet(source, target, writes, strings):
+    """
+    Streams a worksheet part from source to target, rewriting only the rows that have cell updates.
+
+    Args:
+        source (file): The original worksheet part.
+        target (file): Where the new worksheet part is written.
+        writes (dict): Row -> {col: value} of cells to write, rows that do not exist yet are added.
+        strings (StringTable): Shared strings for text values.
+
+    Returns:
+        None
+    """
+    pending = sorted(writes)
+    for row, part in iter_sheet_parts(source):
+        if row is None:
+            if pending and (b"</sheetData>" in part or b"<sheetData/>" in part):
+                new_rows = b"".join(rewrite_row(new_row, None, writes[new_row], strings) for new_row in pending)
+                pending = []
+                if b"<sheetData/>" in part:
+                    part = part.replace(b"<sheetData/>", b"<sheetData>" + new_rows + b"</sheetData>", 1)
+                else:
+                    part = part.replace(b"</sheetData>", new_rows + b"</sheetData>", 1)
+            target.write(part)
+            continue
+        while pending and pending[0] < row:
+            new_row = pending.pop(0)
+            target.write(rewrite_row(new_row, None, writes[new_row], strings))
+        if pending and pending[0] == row:
+            pending.pop(0)
+            target.write(rewrite_row(row, part, writes[row], strings))
+        else:
+            target.write(part)
+    return
+
+def scan_sheet(archive, path, shared_strings):
+    """
+    Reads the cell values of a worksheet part in one streaming pass.
+
+    Returns:
+        tuple: (values, formulas, max_row)
+            values (dict): Row -> {col: value} of every non-blank cell.
+            formulas (set): (row, col) of every cell holding a formula.
+            max_row (int): The last row with any cell, as openpyxl counts it.
+    """
+    values = {}
+    formulas = set()
+    max_row = 0
+    with archive.open(path) as source:
+        for row, row_xml in iter_sheet_parts(source):
+            if row is None:
+                continue
+            cells = read_cells(row_xml)
+            if cells:
+                max_row = max(max_row, row)
+            row_values = {}
+            for col, raw_attributes, body in cells:
+                if not body:
+                    continue
+                if b"<f" in body:
+                    formulas.add((row, col))
+                value = cell_value(raw_attributes, body, shared_strings)
+                if value is not None:
+                    row_values[col] = value
+            if row_values:
+                values[row] = row_values
+    return values, formulas, max_row
+
+def read_shared_strings(archive, path):
+    if path is None:
+        return []
+    strings = []
+    with archive.open(path) as source:
+        for event, element in ElementTree.iterparse(source):
+            if element.tag == MAIN_NS + "si":
+                strings.append("".join(text.text or "" for text in element.iter(MAIN_NS + "t")))
+                element.clear()
+    return strings
+
+def locate_parts(archive):
+    """
+    Finds the worksheet parts and the shared strings part through workbook.xml and its relationships.
+
+    Returns:
+        tuple: (sheet_paths, active_path, shared_strings_path) where sheet_paths maps sheet name to part path.
+    """
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {}
+    shared_strings_path = None
+    for relationship in relationships.iter(PACKAGE_REL_NS + "Relationship"):
+        target = relationship.get("Target")
+        target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+        targets[relationship.get("Id")] = target
+        if relationship.get("Type", "").endswith("/sharedStrings"):
+            shared_strings_path = target
+    sheet_paths = {}
+    for sheet in workbook.iter(MAIN_NS + "sheet"):
+        sheet_paths[sheet.get("name")] = targets[sheet.get(REL_NS + "id")]
+    view = workbook.find(f"{MAIN_NS}bookViews/{MAIN_NS}workbookView")
+    active_tab = int(view.get("activeTab", 0)) if view is not None else 0
+    names = list(sheet_paths)
+    if not names:
+        raise PatchNotPossible("The workbook has no worksheets.")
+    return sheet_paths, sheet_paths[names[min(active_tab, len(names) - 1)]], shared_strings_path
+
+def read_defined_names(data):
+    """Returns defined name -> its text from the workbook.xml part."""
+    return {name.get("name"): name.text for name in ElementTree.fromstring(data).iter(MAIN_NS + "definedName")}
+
+def formula_workbook_xml(data, sheet_name, total_col, sample_cols, max_row, legacy_last_column=True):
+    """
+    Checks that the sample range names still cover the sample area, moves OrderedBlock to the new
+    last sample and returns workbook.xml set to recalculate on open, so statistic formulas do not
+    show their old cached results.
+
+    Args:
+        data (bytes): The workbook.xml part.
+        sheet_name (str): Title of the sheet the samples are in.
+        total_col (int): The 1-based column number of 'Total'.
+        sample_cols (list): 1-based column numbers of the samples with a lab reference number, new ones included.
+        max_row (int): The last row of the sheet.
+        legacy_last_column (bool, optional): Whether Min through Count leave out the last sample, see skips_last_sample.
+
+    Returns:
+        bytes: The workbook.xml part to write.
+
+    Raises:
+        PatchNotPossible: If the names are missing or out of date, or calcPr cannot be updated.
+    """
+    wanted = sample_range_references(sheet_name, total_col - 1, sample_cols, max_row, legacy_last_column)
+    ordered = wanted.pop(ORDERED_BLOCK_NAME)
+    defined = read_defined_names(data)
+    if any(defined.get(name) != reference for name, reference in wanted.items()):
+        raise PatchNotPossible("The sample range names do not cover the sample area.")
+    if len(ORDERED_NAME_ELEMENT.findall(data)) != 1:
+        raise PatchNotPossible("The workbook has no single OrderedBlock name to move.")
+    text = html.escape(ordered, quote=False).encode("utf-8")
+    data = ORDERED_NAME_ELEMENT.sub(lambda match: match.group(1) + text + match.group(3), data)
+    if b'fullCalcOnLoad="1"' in data:
+        return data
+    if b"<calcPr" not in data:
+        raise PatchNotPossible("The workbook has no calculation properties to update.")
+    return data.replace(b"<calcPr", b'<calcPr fullCalcOnLoad="1"', 1)
+
+def write_archive(archive, excel_path, replacements, streamed):
+    """
+    Writes a copy of the archive with some parts replaced, then swaps it in for the original file.
+
+    Args:
+        archive (ZipFile): The open original workbook.
+        excel_path (str): Path of the workbook.
+        replacements (dict): Part path -> new bytes.
+        streamed (dict): Part path -> function(source, target) that writes the new part.
+
+    Returns:
+        None
+    """
+    directory = os.path.dirname(os.path.abspath(excel_path))
+    handle, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=directory)
+    os.close(handle)
+    try:
+        with zipfile.ZipFile(temp_path, "w") as output:
+            for info in archive.infolist():
+                new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                new_info.compress_type = info.compress_type
+                new_info.external_attr = info.external_attr
+                if info.filename in replacements:
+                    output.writestr(new_info, replacements[info.filename])
+                    continue
+                with archive.open(info) as source, output.open(new_info, "w", force_zip64=True) as target:
+                    if info.filename in streamed:
+                        streamed[info.filename](source, target)
+                    else:
+                        shutil.copyfileobj(source, target, CHUNK_SIZE)
+        os.replace(temp_path, excel_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return
+
+def update_running_state(state_path, values, total_col, max_row):
+    """
+    Brings the running statistics file up to date with a patched sheet, so the next incremental
+    update does not see a state that is missing the patched samples. The new sample columns are
+    folded into the saved state, which is rebuilt from the scanned cells if it no longer matches.
+
+    Args:
+        state_path (str): Path of the running statistics file.
+        values (dict): Row -> {col: value} of the sheet, with the patched cells included.
+        total_col (int): The 1-based column number of 'Total'.
+        max_row (int): The last row of the sheet.
+
+    Returns:
+        RunningStatistics: The state to save once the workbook has been replaced.
+    """
+    spore_types = [str(values.get(row, {}).get(1)).strip() for row in range(FIRST_SPORE_ROW, max_row + 1)]
+    samples = {col: header for col, header in values.get(3, {}).items() if 1 < col < total_col}
+    state = RunningStatistics.load(state_path)
+    if state is None or not state.describes(spore_types, samples):
+        state = RunningStatistics(spore_types)
+    for col in sorted(samples):
+        if col not in state.samples:
+            state.add_values(col, samples[col], (values.get(row, {}).get(col) for row in range(FIRST_SPORE_ROW, max_row + 1)))
+    return state
+
+def patch_report(excel_path, pdf_path, matches, digest=None, aliases=None, state_path=None):
+    """
+    Inserts one report and refreshes the statistics by patching the worksheet XML in place of an
+    openpyxl load and save.
+
+    Only the sample columns written, the statistic columns and the shared strings are rewritten,
+    every other part of the file is copied unchanged. The report goes into the empty sample slots
+    before 'Total' and takes their formatting. Duplicates are skipped as insert_report does, and
+    statistic formulas (see write_statistic_formulas) are left for Excel to recalculate. When the
+    workbook needs more than that (no free slots, missing statistic headers, formulas in the cells
+    to write or no '_ingested' sheet to record the PDF in) PatchNotPossible is raised before the file
+    is touched, and the openpyxl path should be used.
+
+    Args:
+        excel_path (str): Path of the tracking workbook.
+        pdf_path (str): Path of the PDF the report came from.
+        matches (list): (mold_dict, lab_reference_number) pairs as returned by extract_report.
+        digest (str, optional): SHA-256 hex digest of the PDF, checked and recorded in the '_ingested' sheet.
+        aliases (dict, optional): Spore type aliases, see load_aliases.
+        state_path (str, optional): Running statistics file kept next to the workbook, see
+            update_statistics_incrementally. It is updated with the new samples when the statistics are values.
+
+    Returns:
+        dict: The summary row for this PDF, as insert_report returns it.
+
+    Raises:
+        PatchNotPossible: If the change needs the openpyxl path.
+    """
+    if not matches:
+        return make_result(pdf_path, STATUS_SKIPPED, message="No matching samples found in the PDF.")
+    lab_reference_numbers = "; ".join(str(lab_reference_number) for mold_dict, lab_reference_number in matches)
+    with zipfile.ZipFile(excel_path) as archive:
+        sheet_paths, sheet_path, shared_strings_path = locate_parts(archive)
+        shared_strings = read_shared_strings(archive, shared_strings_path)
+        strings = StringTable(shared_strings, shared_strings_path)
+        values, formulas, max_row = scan_sheet(archive, sheet_path, shared_strings)
+        header_row = values.get(3, {})
+        total_cols = [col for col, header in header_row.items() if header == "Total"]
+        if not total_cols:
+            raise ValueError("The 'Total' column header is missing in the Excel sheet.")
+        total_col = min(total_cols)
+        stat_columns = {}
+        for col in sorted(header_row):
+            if header_row[col] in STAT_HEADERS:
+                stat_columns.setdefault(header_row[col], col)
+        if len(stat_columns) != len(STAT_HEADERS):
+            raise PatchNotPossible("Some statistic columns are missing.")
+
+        ingested_writes = {}
+        if digest is not None:
+            if INGESTED_SHEET not in sheet_paths:
+                raise PatchNotPossible("The workbook has no '_ingested' sheet yet.")
+            ingested, ingested_formulas, ingested_max_row = scan_sheet(archive, sheet_paths[INGESTED_SHEET], shared_strings)
+            for row_values in ingested.values():
+                if row_values.get(1) == digest:
+                    return make_result(pdf_path, STATUS_SKIPPED, lab_reference_numbers, f"PDF was already inserted as {row_values.get(2) or ''}.")
+        existing = {reference_key(header) for col, header in header_row.items() if 1 < col < total_col}
+        new_matches = [match for match in matches if match[1] is None or reference_key(match[1]) not in existing]
+        duplicate_references = [str(match[1]) for match in matches if match not in new_matches]
+        if not new_matches:
+            return make_result(pdf_path, STATUS_SKIPPED, lab_reference_numbers, "Already in the workbook: " + ", ".join(duplicate_references))
+        free_slots = [col for col in range(2, total_col) if col not in header_row][:len(new_matches)]
+        if len(free_slots) < len(new_matches):
+            raise PatchNotPossible("The sample area has no room for the report.")
+
+        index = SporeRowIndex(aliases=aliases)
+        index.add_labels((row, values[row].get(1)) for row in sorted(values) if row >= FIRST_SPORE_ROW)
+        writes = {}
+        unmatched = []
+        for col, (mold_dict, lab_reference_number) in zip(free_slots, new_matches):
+            writes.setdefault(3, {})[col] = lab_reference_number
+            row_values, missing = index.match(mold_dict)
+            for row, value in row_values.items():
+                if value is not None:
+                    writes.setdefault(row, {})[col] = value
+            unmatched.extend(name for name in missing if name not in unmatched)
+        for row, row_writes in writes.items():
+            for col, value in row_writes.items():
+                values.setdefault(row, {})[col] = value
+
+        workbook_xml = archive.read("xl/workbook.xml")
+        legacy = read_defined_names(workbook_xml).get(STATISTICS_SCOPE_NAME) != EVERY_SAMPLE_SCOPE
+        # Only the sample columns with a lab reference number count, as in sheet_statistics
+        sample_cols = [col for col in range(2, total_col) if col in values.get(3, {})]
+        state = None
+        if (4, stat_columns["Total"]) in formulas:
+            # The statistic formulas recalculate themselves once Excel opens the file
+            sheet_name = next(name for name, path in sheet_paths.items() if path == sheet_path)
+            workbook_xml = formula_workbook_xml(workbook_xml, sheet_name, total_col, sample_cols, max_row, legacy)
+        else:
+            workbook_xml = None
+            num_rows = max(max_row - 3, 0)
+            rows = ([values.get(row, {}).get(col) for col in sample_cols] for row in range(4, max_row + 1))
+            stats = compute_statistics(*sample_block_arrays(rows, num_rows, len(sample_cols)), legacy_last_column=legacy)
+            for offset in range(num_rows):
+                row_writes = writes.setdefault(offset + 4, {})
+                for header in STAT_HEADERS:
+                    value = stats[header][offset]
+                    if value is None and header in ZERO_WHEN_EMPTY_HEADERS:
+                        value = 0
+                    row_writes[stat_columns[header]] = value
+            if state_path is not None:
+                state = update_running_state(state_path, values, total_col, max_row)
+        if any((row, col) in formulas for row, row_writes in writes.items() for col in row_writes):
+            raise PatchNotPossible("Cells to be written hold formulas.")
+
+        if digest is not None:
+            ingested_at = datetime.datetime.now().isoformat(timespec="seconds")
+            record = [digest, lab_reference_numbers, os.path.basename(pdf_path), ingested_at]
+            ingested_writes[ingested_max_row + 1] = dict(zip(range(1, len(INGESTED_HEADERS) + 1), record))
+
+        strings.add_cells(writes)
+        strings.add_cells(ingested_writes)
+        streamed = {sheet_path: lambda source, target: rewrite_sheet(source, target, writes, strings)}
+        if ingested_writes:
+            streamed[sheet_paths[INGESTED_SHEET]] = lambda source, target: rewrite_sheet(source, target, ingested_writes, strings)
+        replacements = {}
+        if workbook_xml is not None:
+            replacements["xl/workbook.xml"] = workbook_xml
+        if strings.added:
+            replacements[shared_strings_path] = strings.patch(archive.read(shared_strings_path))
+        write_archive(archive, excel_path, replacements, streamed)
+    if state is not None:
+        state.save(state_path)
+    messages = []
+    if len(new_matches) > 1:
+        messages.append(f"{len(new_matches)} samples inserted")
+    if duplicate_references:
+        messages.append("Skipped samples already in the workbook: " + ", ".join(duplicate_references))
+    if unmatched:
+        messages.append("Unmatched spore types: " + ", ".join(unmatched))
+    return make_result(pdf_path, STATUS_SUCCESS, lab_reference_numbers, "; ".join(messages))
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules in src/ import each other by name, as they do when main.py is run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+# Synthetic result PDFs and workbooks are shared with the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
@@ -0,0 +1,28 @@
+from openpyxl import Workbook
+from mold_processing import STAT_HEADERS
+from archive_query import ALL_SITES, query_archive
+
+def make_site(path, lab_references, counts):
+    """A tracking workbook with one spore type row and a sample column per lab reference number."""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append([])
+    sheet.append([])
+    sheet.append(["Lab Ref No."] + lab_references + STAT_HEADERS)
+    sheet.append(["Spore 1"] + counts)
+    workbook.save(path)
+    return path
+
+def figures(stats, *headers):
+    return tuple(stats[header][0] for header in headers)
+
+def test_statistics_include_the_last_sample_of_each_site(tmp_path):
+    # Each site's extreme value is in its last sample column
+    north = make_site(str(tmp_path / "north.xlsx"), ["M1-1", "M2-1", "M3-1"], [10, 20, 900])
+    south = make_site(str(tmp_path / "south.xlsx"), ["M4-1", "M5-1"], [5, 1])
+    labels, groups, sources = query_archive([north, south], root=str(tmp_path), by_site=True, workers=1)
+    assert labels == ["Spore 1"]
+    stats = dict(groups)
+    assert figures(stats["north"], "Min", "Median", "Max", "Count") == (10, 20, 900, 3)
+    assert figures(stats["south"], "Min", "Median", "Max", "Count") == (1, 3, 5, 2)
+    assert figures(stats[ALL_SITES], "Total", "Min", "Max", "Count", "Frequency") == (936, 1, 900, 5, 100)
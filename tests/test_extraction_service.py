@@ -0,0 +1,124 @@
+import http.client
+import json
+import threading
+import time
+from contextlib import contextmanager
+from extraction_service import make_server
+from synthetic import make_report_pdf, page_stream, write_pdf
+
+@contextmanager
+def running_server(**options):
+    server = make_server(port=0, quiet=True, **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service.close()
+
+def request(server, method, path, body=None, headers=None):
+    host, port = server.server_address[:2]
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read()), dict(response.getheaders())
+    finally:
+        connection.close()
+
+def post_pdf(server, data, path="/extract"):
+    return request(server, "POST", path, data)
+
+def report_bytes(tmp_path, name="report.pdf", **options):
+    path = tmp_path / name
+    expected = make_report_pdf(str(path), **options)
+    return path.read_bytes(), expected
+
+def slow_report_bytes(tmp_path, pages=200):
+    """A report whose 'Outdoor' table comes after many text pages, so extracting it takes a while."""
+    path = tmp_path / "slow.pdf"
+    filler = [page_stream([f"Page {number} of the chain of custody"] * 40) for number in range(pages)]
+    write_pdf(str(path), filler)
+    return path.read_bytes()
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting"
+        time.sleep(0.01)
+
+def test_extract_returns_the_outdoor_counts(tmp_path):
+    data, (expected, lab_reference_number) = report_bytes(tmp_path)
+    with running_server(workers=1) as server:
+        for path in ("/extract", "/extract?engine=words"):
+            status, body, headers = post_pdf(server, data, path)
+            assert status == 200
+            assert body["lab_reference_number"] == lab_reference_number
+            assert body["counts"] == expected
+        status, body, headers = request(server, "GET", "/metrics")
+        assert status == 200
+        assert body["ok"] == 2 and body["requests"] == 2 and body["in_progress"] == 0
+        assert "latency_ms" in body and "queue_wait_ms" in body
+
+def test_bad_requests(tmp_path):
+    no_outdoor = tmp_path / "cover.pdf"
+    write_pdf(str(no_outdoor), [page_stream(["Just a cover page"])])
+    with running_server(workers=1) as server:
+        assert post_pdf(server, b"not a pdf")[0] == 422
+        assert post_pdf(server, no_outdoor.read_bytes())[0] == 422
+        assert post_pdf(server, b"x", "/extract?engine=ocr")[0] == 400
+        assert request(server, "POST", "/extract", headers={"Content-Length": "-1"})[0] == 400
+        assert request(server, "GET", "/nowhere")[0] == 404
+        assert request(server, "GET", "/health")[1] == {"status": "ok"}
+        metrics = request(server, "GET", "/metrics")[1]
+        assert metrics["failed"] == 1 and metrics["not_found"] == 1
+
+def test_full_queue_gets_503(tmp_path):
+    data, expected = report_bytes(tmp_path)
+    with running_server(workers=1, queue_limit=0) as server:
+        service = server.service
+        # Hold the only worker slot so the first request stays admitted and waiting
+        service.slots.acquire()
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(post_pdf(server, data)))
+        waiting.start()
+        wait_for(lambda: service.metrics()["queued"] == 1)
+        status, body, headers = post_pdf(server, data)
+        assert status == 503
+        assert headers["Retry-After"] == "1"
+        service.slots.release()
+        waiting.join()
+        assert results[0][0] == 200
+        assert service.metrics()["rejected"] == 1
+
+def test_time_spent_queued_does_not_count_against_the_timeout(tmp_path):
+    data, expected = report_bytes(tmp_path)
+    with running_server(workers=1, queue_limit=1, timeout=1.0) as server:
+        service = server.service
+        service.slots.acquire()
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(post_pdf(server, data)))
+        waiting.start()
+        wait_for(lambda: service.metrics()["queued"] == 1)
+        time.sleep(1.5)
+        service.slots.release()
+        waiting.join()
+        assert results[0][0] == 200
+        metrics = service.metrics()
+        assert metrics["timeouts"] == 0 and metrics["restarts"] == 0
+        assert metrics["queue_wait_ms"]["max"] >= 1500
+
+def test_slow_extraction_gets_504_and_a_fresh_pool(tmp_path):
+    data, expected = report_bytes(tmp_path)
+    slow = slow_report_bytes(tmp_path)
+    with running_server(workers=1, timeout=0.05) as server:
+        status, body, headers = post_pdf(server, slow)
+        assert status == 504
+        metrics = request(server, "GET", "/metrics")[1]
+        assert metrics["timeouts"] == 1 and metrics["restarts"] == 1
+        assert metrics["in_progress"] == 0 and metrics["queued"] == 0
+        # The replacement pool serves the next request once the timeout allows for it
+        server.service.timeout = 30
+        assert post_pdf(server, data)[0] == 200
@@ -0,0 +1,47 @@
+import pytest
+from openpyxl import load_workbook
+from mold_processing import STAT_HEADERS
+from sample_store import SampleStore, render_workbook
+from running_stats import verify_statistics
+from test_statistics import written_statistics, evaluated_statistics, same_value
+
+def make_store(path):
+    store = SampleStore(path, aliases={})
+    # The largest Spore 1 count is in the last sample, Spore 2 is blank there
+    for number, (first, second) in enumerate([(10, 4), (20, 0), (30, None)], start=1):
+        store.add_report([({"Spore 1": first, "Spore 2": second}, f"M8000{number}-2")], digest=str(number) * 64, pdf_name=f"{number}.pdf")
+    return store
+
+def assert_same_as_store(store_stats, sheet_stats):
+    for header in STAT_HEADERS:
+        for row, (a, e) in enumerate(zip(sheet_stats[header], store_stats[header])):
+            # The workbook shows an undefined Min or Max as 0
+            assert same_value(a, e) or (a in (0, None) and e is None), f"{header} row {row + 4}: {a!r} != {e!r}"
+
+@pytest.mark.parametrize("stats_mode", ["values", "formulas"])
+def test_rendered_workbook_matches_store_statistics(tmp_path, stats_mode):
+    excel_path = str(tmp_path / "tracking.xlsx")
+    with make_store(str(tmp_path / "samples.sqlite3")) as store:
+        render_workbook(store, excel_path, stats_mode=stats_mode)
+        labels, store_stats = store.statistics()
+    assert labels == ["Spore 1", "Spore 2"]
+    assert [store_stats[header][0] for header in ("Min", "Median", "Max", "Count", "Frequency")] == [10, 20, 30, 3, 100]
+    sheet = load_workbook(excel_path).active
+    sheet_stats = written_statistics(sheet) if stats_mode == "values" else evaluated_statistics(sheet)
+    assert_same_as_store(store_stats, sheet_stats)
+    assert verify_statistics(sheet) == []
+
+def test_rendering_into_a_legacy_workbook_counts_every_sample(tmp_path):
+    excel_path = str(tmp_path / "tracking.xlsx")
+    with make_store(str(tmp_path / "samples.sqlite3")) as store:
+        render_workbook(store, excel_path)
+        # Drop the mark, as in a workbook from before it existed
+        workbook = load_workbook(excel_path)
+        del workbook.defined_names["StatisticsScope"]
+        workbook.save(excel_path)
+        store.add_report([({"Spore 1": 5, "Spore 2": 2}, "M80004-2")], digest="4" * 64)
+        added, unmatched = render_workbook(store, excel_path)
+        labels, store_stats = store.statistics()
+    assert added == ["M80004-2"]
+    assert store_stats["Max"][0] == 30 and store_stats["Count"][0] == 4
+    assert_same_as_store(store_stats, written_statistics(load_workbook(excel_path).active))
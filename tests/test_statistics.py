@@ -0,0 +1,338 @@
+"""
+The statistics engines against the original per-row functions (total_count, find_min, ...).
+
+Those functions read Min, the percentiles, Median, Max and Count from range(2, total_col_index),
+which stops one column short of the last sample before 'Total', while Total, Mean, Stdv and
+Frequency cover every sample column. Workbook statistics keep that quirk, so they are compared
+with compute_statistics(..., legacy_last_column=True). Sample columns are the ones with a lab
+reference number: the empty slots reserved by plan_layout must not change any statistic, so sheets
+with them are compared with the legacy functions on the same sheet without them. Formula mode is
+checked against values mode with a small evaluator for the functions STAT_FORMULAS uses.
+"""
+import math
+import os
+import random
+import re
+import statistics
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils.cell import range_boundaries
+import numpy as np
+from mold_processing import (
+    STAT_HEADERS, SampleMatrix, compute_statistics, insert_into_excel, update_statistics, find_total_count_index,
+    clear_old_stats, total_count, mean_count, stdv_count, display_mold_type_frequency, find_min,
+    fifth_percentile, find_median, find_ninety_fifth_percentile, find_max, find_count
+)
+from running_stats import RunningStatistics, update_statistics_incrementally
+
+#CONSTANTS
+EXAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sample", "Example.xlsx")
+LEGACY_FUNCTIONS = [
+    clear_old_stats, total_count, mean_count, stdv_count, display_mold_type_frequency, find_min,
+    fifth_percentile, find_median, find_ninety_fifth_percentile, find_max, find_count,
+]
+# Sample counts around the nearest-rank boundaries of the 5th and 95th percentiles and the median
+EDGE_SIZES = [1, 2, 3, 4, 19, 20, 21, 22, 39, 40, 41]
+
+def run_legacy(sheet):
+    for function in LEGACY_FUNCTIONS:
+        function(sheet)
+
+def load_legacy_copy(workbook, tmp_path):
+    path = str(tmp_path / "copy.xlsx")
+    workbook.save(path)
+    sheet = load_workbook(path).active
+    run_legacy(sheet)
+    return sheet
+
+def written_statistics(sheet):
+    """Returns statistic header -> the values in its column, rows 4 down."""
+    header_row = [cell.value for cell in sheet[3]]
+    stats = {}
+    for header in STAT_HEADERS:
+        col = header_row.index(header) + 1
+        stats[header] = [value for (value,) in sheet.iter_rows(min_row=4, max_row=sheet.max_row, min_col=col, max_col=col, values_only=True)]
+    return stats
+
+def same_value(actual, expected):
+    if isinstance(actual, float) or isinstance(expected, float):
+        return actual is not None and expected is not None and math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-9)
+    return actual == expected
+
+def assert_same_statistics(actual, expected):
+    for header in STAT_HEADERS:
+        for row, (a, e) in enumerate(zip(actual[header], expected[header])):
+            assert same_value(a, e), f"{header} row {row + 4}: {a!r} != {e!r}"
+        assert len(actual[header]) == len(expected[header])
+
+def random_workbook(seed, num_samples, blank_slots=0, num_rows=12):
+    """A tracking sheet with random counts, blanks and zeros, and blank_slots empty sample columns before 'Total'."""
+    rng = random.Random(seed)
+    workbook = Workbook()
+    sheet = workbook.active
+    headers = ["Lab Ref No."] + [f"M{seed:03d}{col:03d}-2" for col in range(num_samples)] + [None] * blank_slots
+    sheet.append([])
+    sheet.append([])
+    sheet.append(headers + STAT_HEADERS)
+    for row in range(num_rows):
+        # Some rows are all blank or all zero, the rest mix blanks, zeros and counts
+        kind = rng.random()
+        values = []
+        for col in range(num_samples):
+            if kind < 0.1:
+                values.append(None)
+            elif kind < 0.2:
+                values.append(0)
+            else:
+                roll = rng.random()
+                values.append(None if roll < 0.25 else 0 if roll < 0.45 else rng.randint(1, 20000))
+        sheet.append([f"Spore {row}"] + values)
+    return workbook
+
+def legacy_and_engine(workbook_factory):
+    legacy = workbook_factory().active
+    run_legacy(legacy)
+    engine = workbook_factory().active
+    update_statistics(engine, "values")
+    return written_statistics(legacy), written_statistics(engine)
+
+def test_legacy_functions_leave_out_the_last_sample_column():
+    workbook = random_workbook(0, 3, num_rows=1)
+    sheet = workbook.active
+    for col, value in zip((2, 3, 4), (10, 20, 30)):
+        sheet.cell(row=4, column=col, value=value)
+    run_legacy(sheet)
+    legacy = {header: values[0] for header, values in written_statistics(sheet).items()}
+    # 30, in the last sample column, is in Total and Mean but not in Max, Median or Count
+    assert legacy["Total"] == 60 and legacy["Mean"] == 20 and legacy["Frequency"] == 100
+    assert (legacy["Min"], legacy["Median"], legacy["Max"], legacy["Count"]) == (10, 15, 20, 2)
+
+    arrays = (np.array([[10, 20, 30]]), np.ones((1, 3), dtype=bool), np.ones((1, 3), dtype=bool))
+    quirk = compute_statistics(*arrays, legacy_last_column=True)
+    assert {header: values[0] for header, values in quirk.items()} == legacy
+    every_column = compute_statistics(*arrays)
+    assert (every_column["Min"][0], every_column["Median"][0], every_column["Max"][0], every_column["Count"][0]) == (10, 20, 30, 3)
+    assert every_column["Total"][0] == 60 and every_column["Frequency"][0] == 100
+
+def test_example_workbook_matches_legacy_functions():
+    legacy, engine = legacy_and_engine(lambda: load_workbook(EXAMPLE_PATH))
+    assert_same_statistics(engine, legacy)
+
+@pytest.mark.parametrize("num_samples", EDGE_SIZES)
+@pytest.mark.parametrize("seed", range(3))
+def test_random_sheets_match_legacy_functions(seed, num_samples):
+    legacy, engine = legacy_and_engine(lambda: random_workbook(seed, num_samples))
+    assert_same_statistics(engine, legacy)
+
+@pytest.mark.parametrize("num_samples, blank_slots", [(5, 1), (9, 10), (20, 3), (1, 4)])
+def test_blank_sample_slots_are_left_out(num_samples, blank_slots):
+    legacy = random_workbook(7, num_samples).active
+    run_legacy(legacy)
+    engine = random_workbook(7, num_samples, blank_slots).active
+    update_statistics(engine, "values")
+    assert_same_statistics(written_statistics(engine), written_statistics(legacy))
+
+def baseline_insert(sheet, mold_dict, lab_reference_number):
+    """insert_into_excel as it was before sample columns were reserved: the first empty slot, else a new column before 'Total'."""
+    total_count_index = find_total_count_index(sheet)
+    header_row = list(sheet.iter_rows(min_row=3, max_row=3, values_only=True))[0]
+    for col_index in range(total_count_index):
+        if header_row[col_index] is None:
+            break
+    else:
+        col_index = total_count_index
+        sheet.insert_cols(col_index + 1)
+    sheet.cell(row=3, column=col_index + 1, value=lab_reference_number)
+    for row in range(4, sheet.max_row + 1):
+        spore_type = str(sheet.cell(row=row, column=1).value).strip()
+        if spore_type in mold_dict:
+            sheet.cell(row=row, column=col_index + 1, value=mold_dict[spore_type])
+
+@pytest.mark.parametrize("reports", [1, 3])
+def test_insert_into_example_matches_baseline(reports):
+    baseline = load_workbook(EXAMPLE_PATH).active
+    engine = load_workbook(EXAMPLE_PATH).active
+    labels = [str(value).strip() for (value,) in baseline.iter_rows(min_row=4, max_row=baseline.max_row, max_col=1, values_only=True) if value is not None]
+    rng = random.Random(reports)
+    for number in range(reports):
+        mold_dict = {label: rng.choice([None, 0, rng.randint(1, 5000)]) for label in labels}
+        baseline_insert(baseline, mold_dict, f"M7000{number}-2")
+        run_legacy(baseline)
+        insert_into_excel(mold_dict, engine, f"M7000{number}-2")
+        update_statistics(engine, "values")
+    header_row = [cell.value for cell in engine[3]]
+    # The engine reserved a block of empty sample columns the baseline does not have
+    assert header_row.index("Total") > [cell.value for cell in baseline[3]].index("Total")
+    assert_same_statistics(written_statistics(engine), written_statistics(baseline))
+
+@pytest.mark.parametrize("num_samples", EDGE_SIZES)
+def test_sample_matrix_matches_legacy_functions(num_samples):
+    legacy = random_workbook(11, num_samples).active
+    run_legacy(legacy)
+    matrix = SampleMatrix.from_sheet(random_workbook(11, num_samples).active)
+    stats = matrix.statistics(legacy_last_column=True)
+    expected = written_statistics(legacy)
+    for header in STAT_HEADERS:
+        for a, e in zip(stats[header], expected[header]):
+            assert same_value(a, e) or (a is None and e == 0)
+
+def test_sample_matrix_statistics_include_the_last_sample():
+    sheet = random_workbook(0, 4, blank_slots=1, num_rows=1).active
+    for col, value in zip((2, 3, 4, 5), (10, 20, 30, 40)):
+        sheet.cell(row=4, column=col, value=value)
+    matrix = SampleMatrix.from_sheet(sheet)
+    whole = matrix.statistics()
+    assert (whole["Min"][0], whole["Median"][0], whole["Max"][0], whole["Count"][0]) == (10, 25, 40, 4)
+    # A slice ends with its own last sample too
+    part = matrix.statistics(1, 3)
+    assert (part["Total"][0], part["Min"][0], part["Max"][0], part["Count"][0], part["Frequency"][0]) == (50, 20, 30, 2, 100)
+
+@pytest.mark.parametrize("num_samples, blank_slots", [(1, 0), (20, 0), (21, 0), (8, 2)])
+def test_running_statistics_match_legacy_functions(num_samples, blank_slots):
+    legacy = random_workbook(5, num_samples).active
+    run_legacy(legacy)
+    sheet = random_workbook(5, num_samples, blank_slots).active
+    state = RunningStatistics.from_sheet(sheet)
+    header_row = [cell.value for cell in sheet[3]]
+    stats = state.statistics(sheet, header_row.index("Total"))
+    expected = written_statistics(legacy)
+    for header in STAT_HEADERS:
+        for a, e in zip(stats[header], expected[header]):
+            # The legacy functions leave 0 where clear_old_stats zeroed an empty row
+            assert same_value(a, e) or (a is None and e == 0)
+
+def test_incremental_append_matches_legacy_functions(tmp_path):
+    state_path = str(tmp_path / "tracking_stats.json")
+    workbook = random_workbook(9, 10, blank_slots=2)
+    sheet = workbook.active
+    update_statistics_incrementally(sheet, state_path).save(state_path)
+    # Fill the two blank slots one at a time, the second lands in the last sample column
+    for col in (12, 13):
+        sheet.cell(row=3, column=col, value=f"M999{col}-2")
+        for row in range(4, sheet.max_row + 1):
+            sheet.cell(row=row, column=col, value=row * col % 7)
+        update_statistics_incrementally(sheet, state_path).save(state_path)
+    legacy = load_legacy_copy(workbook, tmp_path)
+    assert_same_statistics(written_statistics(sheet), written_statistics(legacy))
+
+def test_running_statistics_file_is_appended_to(tmp_path):
+    state_path = str(tmp_path / "tracking_stats.json")
+    sheet = random_workbook(3, 6, blank_slots=2).active
+    update_statistics_incrementally(sheet, state_path).save(state_path)
+    before = open(state_path, "rb").read()
+    for col in (8, 9):
+        sheet.cell(row=3, column=col, value=f"M998{col}-2")
+        for row in range(4, sheet.max_row + 1):
+            sheet.cell(row=row, column=col, value=None if row % 4 == 0 else row * col % 9)
+        update_statistics_incrementally(sheet, state_path).save(state_path)
+    after = open(state_path, "rb").read()
+    # The snapshot is left as it was and each new sample adds one line
+    assert after.startswith(before) and after.count(b"\n") == before.count(b"\n") + 2
+    header_row = [cell.value for cell in sheet[3]]
+    loaded = RunningStatistics.load(state_path).statistics(sheet, header_row.index("Total"))
+    rebuilt = RunningStatistics.from_sheet(sheet).statistics(sheet, header_row.index("Total"))
+    assert_same_statistics(loaded, rebuilt)
+    # A save cut short leaves a partial last line, and the state is rebuilt
+    with open(state_path, "ab") as state_file:
+        state_file.write(b'{"col": 10, "hea')
+    assert RunningStatistics.load(state_path) is None
+
+class Block:
+    """A defined name's cells, as the evaluator sees them."""
+    def __init__(self, sheet, reference):
+        min_col, min_row, max_col, max_row = range_boundaries(reference.split("!")[-1].replace("$", ""))
+        self.first_row = min_row
+        self.rows = [list(row) for row in sheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col, values_only=True)]
+
+def numbers(*args):
+    """The numbers among the arguments and the lists in them, skipping blanks and text as Excel does."""
+    found = []
+    for arg in args:
+        for value in (arg if isinstance(arg, list) else [arg]):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                found.append(value)
+    return found
+
+def countif(values, criterion):
+    if criterion == ">0":
+        return sum(1 for value in numbers(values) if value > 0)
+    return sum(1 for value in numbers(values) if value < 0)
+
+def lazy_if(expression):
+    """Rewrites IF(condition,then,otherwise) as a Python conditional, so only the branch taken is evaluated."""
+    match = re.search(r"\bIF\(", expression)
+    if match is None:
+        return expression
+    start, parts, depth, position = match.start(), [""], 0, match.end()
+    while depth >= 0:
+        char = expression[position]
+        depth += {"(": 1, ")": -1}.get(char, 0)
+        if char == "," and depth == 0:
+            parts.append("")
+        elif depth >= 0:
+            parts[-1] += char
+        position += 1
+    condition, then, otherwise = (lazy_if(part) for part in parts)
+    return expression[:start] + f"(({then}) if ({condition}) else ({otherwise}))" + lazy_if(expression[position:])
+
+def evaluate_formula(sheet, row, formula):
+    """Evaluates one of STAT_FORMULAS in the given row, after translating it to Python."""
+    names = {name: Block(sheet, defined.attr_text) for name, defined in sheet.parent.defined_names.items() if "!" in defined.attr_text}
+    functions = {
+        "ROW": lambda block=None: row if block is None else block.first_row,
+        "INDEX": lambda block, r, c: block.rows[r - 1],
+        "SUM": lambda *args: sum(numbers(*args)),
+        "COUNT": lambda *args: len(numbers(*args)),
+        "COUNTA": lambda block: sum(1 for values in block.rows for value in values if value is not None),
+        "COUNTIF": countif,
+        "AVERAGE": lambda values: statistics.mean(numbers(values)),
+        "STDEV_S": lambda values: statistics.stdev(numbers(values)),
+        "MIN": lambda *args: min(numbers(*args), default=0),
+        "MAX": lambda *args: max(numbers(*args), default=0),
+        "SMALL": lambda values, k: sorted(numbers(values))[k - 1],
+        "MEDIAN": lambda values: statistics.median(numbers(values)),
+        "ROUND": round,
+        "ROUNDUP": lambda value, digits: math.ceil(value),
+    }
+    expression = formula[1:].replace("_xlfn.STDEV.S", "STDEV_S")
+    expression = lazy_if(re.sub(r"(?<![<>!=])=(?!=)", "==", expression))
+    result = eval(expression, {"__builtins__": {}}, {**functions, **names})
+    return None if result == "" else result
+
+def evaluated_statistics(sheet):
+    """Returns statistic header -> the evaluated formulas in its column, rows 4 down."""
+    stats = {}
+    for header, formulas in written_statistics(sheet).items():
+        stats[header] = [evaluate_formula(sheet, offset + 4, formula) for offset, formula in enumerate(formulas)]
+    return stats
+
+def assert_formulas_match_values(workbook_factory):
+    values = workbook_factory().active
+    update_statistics(values, "values")
+    formulas = workbook_factory().active
+    update_statistics(formulas, "formulas")
+    actual = evaluated_statistics(formulas)
+    expected = written_statistics(values)
+    for header in STAT_HEADERS:
+        for row, (a, e) in enumerate(zip(actual[header], expected[header])):
+            # The formulas show a blank Min or Max as 0, like the zero-filled values
+            assert same_value(a, e) or (e == 0 and a is None), f"{header} row {row + 4}: {a!r} != {e!r}"
+
+def test_example_formulas_match_values():
+    assert_formulas_match_values(lambda: load_workbook(EXAMPLE_PATH))
+
+@pytest.mark.parametrize("num_samples, blank_slots", [(1, 0), (2, 0), (20, 0), (21, 3), (1, 4), (0, 2)])
+def test_random_formulas_match_values(num_samples, blank_slots):
+    assert_formulas_match_values(lambda: random_workbook(13, num_samples, blank_slots))
+
+def test_formulas_match_values_after_inserts():
+    def inserted():
+        workbook = load_workbook(EXAMPLE_PATH)
+        sheet = workbook.active
+        labels = [str(value).strip() for (value,) in sheet.iter_rows(min_row=4, max_row=sheet.max_row, max_col=1, values_only=True) if value is not None]
+        update_statistics(sheet, "formulas")
+        rng = random.Random(2)
+        for number in range(3):
+            insert_into_excel({label: rng.choice([None, 0, rng.randint(1, 5000)]) for label in labels}, sheet, f"M7100{number}-2")
+        return workbook
+    assert_formulas_match_values(inserted)
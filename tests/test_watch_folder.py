@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+import pytest
+from openpyxl import Workbook, load_workbook
+import watch_folder
+from watch_folder import WatchService, save_workbook_atomically, move_to_folder
+from synthetic import make_report_pdf, make_tracking_workbook
+
+#CONSTANTS
+SAMPLES = 5
+FREE_SLOTS = 5
+
+@pytest.fixture
+def inbox(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    return inbox
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    path = str(tmp_path / "tracking.xlsx")
+    make_tracking_workbook(path, SAMPLES, free_slots=FREE_SLOTS)
+    return path
+
+def drop_report(inbox, name, number):
+    """Writes a report PDF into the inbox, dated back so it counts as settled. Returns its lab reference number."""
+    path = str(inbox / name)
+    mold_dict, lab_reference_number = make_report_pdf(path, lab_reference_number=f"M90000{number}-2", seed=number)
+    past = time.time() - 10
+    os.utime(path, (past, past))
+    return lab_reference_number
+
+def lab_references(excel_path):
+    sheet = load_workbook(excel_path).active
+    return [sheet.cell(row=3, column=col).value for col in range(2, SAMPLES + FREE_SLOTS + 2)]
+
+def service(inbox, workbook_path, **options):
+    return WatchService(str(inbox), workbook_path, polling=True, poll_interval=0.05, **options)
+
+def test_burst_is_saved_once_after_the_debounce(inbox, workbook_path):
+    watcher = service(inbox, workbook_path, debounce=0.5)
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        references = [drop_report(inbox, f"report{number}.pdf", number) for number in range(1, 4)]
+        deadline = time.time() + 30
+        while watcher.counts["success"] < 3 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+        thread.join(30)
+    assert not thread.is_alive()
+    assert watcher.counts["success"] == 3
+    assert watcher.saves == 1
+    assert lab_references(workbook_path)[SAMPLES:SAMPLES + 3] == references
+    assert sorted(os.listdir(inbox / "processed")) == ["report1.pdf", "report2.pdf", "report3.pdf"]
+
+def test_outcome_folders(inbox, workbook_path):
+    drop_report(inbox, "a.pdf", 1)
+    # Same lab reference number as a.pdf, so it is a duplicate
+    drop_report(inbox, "b.pdf", 1)
+    (inbox / "broken.pdf").write_bytes(b"not a pdf")
+    past = time.time() - 10
+    os.utime(inbox / "broken.pdf", (past, past))
+    counts = service(inbox, workbook_path).run(once=True)
+    assert counts == {"success": 1, "skipped": 1, "error": 1}
+    assert os.listdir(inbox / "processed") == ["a.pdf"]
+    assert os.listdir(inbox / "skipped") == ["b.pdf"]
+    assert os.listdir(inbox / "failed") == ["broken.pdf"]
+    assert not [name for name in os.listdir(inbox) if name.endswith(".pdf")]
+
+def test_move_to_folder_keeps_both_files(tmp_path):
+    folder = tmp_path / "processed"
+    folder.mkdir()
+    (folder / "report.pdf").write_bytes(b"first")
+    (tmp_path / "report.pdf").write_bytes(b"second")
+    target = move_to_folder(str(tmp_path / "report.pdf"), str(folder))
+    assert os.path.basename(target) == "report (1).pdf"
+    assert (folder / "report.pdf").read_bytes() == b"first"
+    assert (folder / "report (1).pdf").read_bytes() == b"second"
+
+def test_atomic_save_replaces_the_workbook(tmp_path):
+    excel_path = str(tmp_path / "tracking.xlsx")
+    Workbook().save(excel_path)
+    workbook = Workbook()
+    workbook.active["A1"] = "saved"
+    save_workbook_atomically(workbook, excel_path)
+    assert load_workbook(excel_path).active["A1"].value == "saved"
+    assert os.listdir(tmp_path) == ["tracking.xlsx"]
+
+def test_failed_atomic_save_leaves_the_workbook_untouched(tmp_path):
+    excel_path = str(tmp_path / "tracking.xlsx")
+    original = Workbook()
+    original.active["A1"] = "original"
+    original.save(excel_path)
+    before = open(excel_path, "rb").read()
+
+    class BrokenWorkbook:
+        def save(self, path):
+            with open(path, "wb") as partial:
+                partial.write(b"PK half written")
+            raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        save_workbook_atomically(BrokenWorkbook(), excel_path)
+    assert open(excel_path, "rb").read() == before
+    assert os.listdir(tmp_path) == ["tracking.xlsx"]
+
+def test_reload_when_the_workbook_changes_on_disk(inbox, workbook_path):
+    reference = drop_report(inbox, "report.pdf", 1)
+    watcher = service(inbox, workbook_path)
+    watcher.load()
+    watcher.scan()
+    watcher.process(watcher.queue.popleft())
+    assert len(watcher.pending) == 1
+    # Someone else saves the workbook while the report is unsaved
+    edited = load_workbook(workbook_path)
+    edited.active["A1"] = "edited elsewhere"
+    edited.save(workbook_path)
+    assert watcher.save() is False
+    assert list(watcher.queue) == [str(inbox / "report.pdf")]
+    assert watcher.run(once=True)["success"] == 1
+    sheet = load_workbook(workbook_path).active
+    assert sheet["A1"].value == "edited elsewhere"
+    assert lab_references(workbook_path)[SAMPLES] == reference
+    assert os.listdir(inbox / "processed") == ["report.pdf"]
+
+def test_once_gives_up_when_the_workbook_cannot_be_saved(inbox, workbook_path, monkeypatch):
+    drop_report(inbox, "report.pdf", 1)
+    before = open(workbook_path, "rb").read()
+    attempts = []
+
+    def locked(workbook, excel_path):
+        attempts.append(excel_path)
+        if len(attempts) > 5:
+            raise AssertionError("save retried without end")
+        raise PermissionError(excel_path)
+
+    monkeypatch.setattr(watch_folder, "save_workbook_atomically", locked)
+    watcher = service(inbox, workbook_path)
+    counts = watcher.run(once=True)
+    assert len(attempts) == 2
+    assert counts["success"] == 0
+    assert watcher.pending == []
+    assert os.path.exists(inbox / "report.pdf")
+    assert open(workbook_path, "rb").read() == before
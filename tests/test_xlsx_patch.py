@@ -0,0 +1,121 @@
+import math
+import shutil
+import zipfile
+from xml.etree import ElementTree
+import pytest
+from openpyxl import Workbook, load_workbook
+from mold_processing import STAT_HEADERS, update_statistics, include_last_sample
+from batch import insert_report
+from duplicates import DuplicateIndex
+from running_stats import RunningStatistics, default_state_path, verify_statistics
+from xlsx_patch import patch_report, PatchNotPossible
+from main import insert_with_openpyxl
+from test_statistics import EXAMPLE_PATH
+
+#CONSTANTS
+ROWS = 12
+FREE_SLOTS = 4
+
+def make_workbook(path, samples=30, every_sample=False):
+    """A tracking workbook with filled sample columns, a few free slots, every statistic column and an '_ingested' sheet."""
+    workbook = Workbook()
+    if every_sample:
+        include_last_sample(workbook)
+    sheet = workbook.active
+    sheet.cell(row=3, column=1, value="Lab Ref No.")
+    for row in range(4, ROWS + 4):
+        sheet.cell(row=row, column=1, value=f"Spore {row - 3}")
+    for col in range(2, samples + 2):
+        sheet.cell(row=3, column=col, value=f"M{col:06d}-1")
+        for row in range(4, ROWS + 4):
+            if (col + row) % 5:
+                sheet.cell(row=row, column=col, value=(col * 7 + row * 13) % 40)
+    for offset, header in enumerate(STAT_HEADERS):
+        sheet.cell(row=3, column=samples + 2 + FREE_SLOTS + offset, value=header)
+    update_statistics(sheet)
+    insert_report(sheet, "seed.pdf", [({"Spore 1": 1}, "SEED")], duplicates=DuplicateIndex(workbook, sheet), digest="0" * 64)
+    workbook.save(path)
+
+def report(number, rows=ROWS):
+    return [({f"Spore {row}": (row * number) % 11 or None for row in range(1, rows + 1)}, f"M99999{number}-1")]
+
+def same_cell_values(first_path, second_path):
+    first = load_workbook(first_path)
+    second = load_workbook(second_path)
+    assert first.sheetnames == second.sheetnames
+    for name in first.sheetnames:
+        first_sheet, second_sheet = first[name], second[name]
+        # The ingestion time differs between the two runs
+        max_col = 3 if name == "_ingested" else max(first_sheet.max_column, second_sheet.max_column)
+        rows = zip(first_sheet.iter_rows(max_col=max_col, values_only=True), second_sheet.iter_rows(max_col=max_col, values_only=True))
+        for row, (first_row, second_row) in enumerate(rows, start=1):
+            for col, (x, y) in enumerate(zip(first_row, second_row), start=1):
+                if isinstance(x, float) and isinstance(y, float):
+                    assert math.isclose(x, y), f"{name}!R{row}C{col}: {x!r} != {y!r}"
+                else:
+                    assert x == y, f"{name}!R{row}C{col}: {x!r} != {y!r}"
+
+@pytest.mark.parametrize("every_sample", [False, True])
+def test_patch_matches_openpyxl_insert(tmp_path, every_sample):
+    template = str(tmp_path / "template.xlsx")
+    make_workbook(template, every_sample=every_sample)
+    openpyxl_path = str(tmp_path / "openpyxl.xlsx")
+    patch_path = str(tmp_path / "patch.xlsx")
+    shutil.copy(template, openpyxl_path)
+    shutil.copy(template, patch_path)
+    for number in (1, 2, 3):
+        insert_with_openpyxl(f"report{number}.pdf", openpyxl_path, report(number), str(number) * 64)
+        result = patch_report(patch_path, f"report{number}.pdf", report(number), str(number) * 64, state_path=default_state_path(patch_path))
+        assert result["status"] == "success"
+    with zipfile.ZipFile(patch_path) as archive:
+        for name in archive.namelist():
+            if name.endswith(".xml") or name.endswith(".rels"):
+                ElementTree.fromstring(archive.read(name))
+    same_cell_values(openpyxl_path, patch_path)
+    assert verify_statistics(load_workbook(patch_path).active) == []
+
+def test_patch_skips_an_ingested_pdf(tmp_path):
+    path = str(tmp_path / "tracking.xlsx")
+    make_workbook(path)
+    patch_report(path, "report.pdf", report(1), "1" * 64)
+    result = patch_report(path, "report.pdf", report(1), "1" * 64)
+    assert result["status"] == "skipped"
+
+def test_patch_refuses_a_full_sample_area(tmp_path):
+    path = str(tmp_path / "tracking.xlsx")
+    make_workbook(path)
+    # The seed report already took one of the free slots
+    for number in range(1, FREE_SLOTS):
+        patch_report(path, f"report{number}.pdf", report(number), str(number) * 64)
+    before = open(path, "rb").read()
+    with pytest.raises(PatchNotPossible):
+        patch_report(path, "more.pdf", report(7), "7" * 64)
+    assert open(path, "rb").read() == before
+
+def test_patch_keeps_the_running_statistics_current(tmp_path):
+    path = str(tmp_path / "Example.xlsx")
+    shutil.copy(EXAMPLE_PATH, path)
+    state_path = default_state_path(path)
+    labels = [str(value).strip() for (value,) in load_workbook(path).active.iter_rows(min_row=4, max_col=1, values_only=True)]
+    matches = [({label: (offset * 37) % 500 for offset, label in enumerate(labels)}, "M123456-2")]
+    # The first insert goes through openpyxl and creates the '_ingested' sheet, the next ones are patched
+    insert_with_openpyxl("first.pdf", path, matches, "a" * 64)
+    for number in (2, 3):
+        matches = [({label: (offset * number) % 90 for offset, label in enumerate(labels)}, f"M12345{number}-2")]
+        assert patch_report(path, f"report{number}.pdf", matches, str(number) * 64, state_path=state_path)["status"] == "success"
+    state = RunningStatistics.load(state_path)
+    assert state is not None and len(state.samples) == 23
+    assert verify_statistics(load_workbook(path).active, state) == []
+
+def test_patch_moves_the_ordered_block_in_a_formula_workbook(tmp_path):
+    path = str(tmp_path / "tracking.xlsx")
+    make_workbook(path)
+    workbook = load_workbook(path)
+    update_statistics(workbook.active, "formulas")
+    workbook.save(path)
+    for number in (1, 2):
+        assert patch_report(path, f"report{number}.pdf", report(number), str(number) * 64)["status"] == "success"
+    workbook = load_workbook(path)
+    # The seed and both reports took the first three free slots, Min through Count stop before the last
+    assert workbook.defined_names["OrderedBlock"].attr_text == f"'Sheet'!$B$4:$AG${ROWS + 3}"
+    assert verify_statistics(workbook.active) == []